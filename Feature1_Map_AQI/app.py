@@ -1,24 +1,50 @@
 import os
+import re
 import json
+import base64
 import random
+import threading
+import time
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context
 from dotenv import load_dotenv
 from pymongo import MongoClient
 from bson import ObjectId
 from bson.json_util import dumps, loads
-import requests
 import numpy as np
-from sklearn.cluster import KMeans
-import pandas as pd
-from geopy.distance import geodesic
-from openai import OpenAI
+from geo_cache import (
+    GeoCache, MongoCacheBackend, SharedCacheBackend, TTLCache, search_key, route_key,
+    GEO_CACHE_BACKEND, GEO_CACHE_SEARCH_TTL, GEO_CACHE_ROUTE_TTL
+)
+from http_client import tomtom_http, openai_http, upstream_stats
+from zone_model import ZoneIndex, ZONE_TYPES
+from distance import distance_km, pairwise_km
+from leaderboard import Leaderboard, LEADERBOARD_SIZE, LEADER_FIELDS
+from write_behind import TripWriter
+from single_flight import SingleFlight
+from intent_engine import IntentEngine, CHATBOT_RULES_PATH
+from timeseries import MetricStore, METRIC_NAMES, ROLLUP_RESOLUTIONS
+from traffic_forecast import TrafficForecaster
+from spatial_index import GridIndex, geo_point
+from route_graph import load_route_graph, ROUTE_COSTS
+from assets import AssetPipeline, PageCache
+from json_provider import FastJSONProvider, public_doc
+from live_updates import LiveHub, SubscriberLimitError, sse_frame
+from event_bus import EventBus
+from map_layers import MapLayers, MAP_LAYER_SHAPES, MAP_LAYER_MAX_ZOOM, MAP_LAYER_TIME_BUCKET
+from shared_state import process_memory, shared_stats
+from instrumentation import (
+    MongoCommandTimer, instrument_flask, profiler, render_metrics, timed, worker_snapshots
+)
 
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = os.getenv('SESSION_SECRET', 'dev-secret-key-change-in-production')
-app.config['JSON_SORT_KEYS'] = False
+# orjson-backed responses that encode ObjectId, datetime and NumPy values directly
+app.json = FastJSONProvider(app)
+# Per-route latency histograms, stage breakdowns (Server-Timing) and the opt-in slow-request profiler
+instrument_flask(app)
 
 # MongoDB connection
 MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/')
@@ -26,10 +52,30 @@ DATABASE_NAME = os.getenv('DATABASE_NAME', 'aimlmapinsights')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
 TOMTOM_API_KEY = os.getenv('TOMTOM_API_KEY')
+TOMTOM_BASE_URL = os.getenv('TOMTOM_BASE_URL', 'https://api.tomtom.com')
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+BATCH_MAX_POINTS = int(os.getenv('BATCH_MAX_POINTS', 200000))
+BATCH_CHUNK_SIZE = 5000
+# Bodies are read up to this size before parsing; about 64 bytes per point leaves room for {"lat", "lon"} objects
+BATCH_MAX_BYTES = int(os.getenv('BATCH_MAX_BYTES', BATCH_MAX_POINTS * 64))
+FEED_PAGE_SIZE = 20
+FEED_MAX_PAGE_SIZE = 100
+FEED_CACHE_TTL = int(os.getenv('FEED_CACHE_TTL', 30))
+ROUTE_BATCH_MAX_PAIRS = int(os.getenv('ROUTE_BATCH_MAX_PAIRS', 5000))
+NEARBY_RADIUS_KM = 2.0
+NEARBY_MAX_RADIUS_KM = 50.0
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 300))
+USER_CACHE_MAX_ENTRIES = int(os.getenv('USER_CACHE_MAX_ENTRIES', 10000))
+INSIGHT_CACHE_TTL = int(os.getenv('INSIGHT_CACHE_TTL', 900))
+CHATBOT_CACHE_TTL = int(os.getenv('CHATBOT_CACHE_TTL', 3600))
+PROFILER_TOKEN = os.getenv('PROFILER_TOKEN')
+METRICS_INGEST_TOKEN = os.getenv('METRICS_INGEST_TOKEN')
+EVENT_BUS = os.getenv('EVENT_BUS', 'local')
 
-# Initialize MongoDB client
+# Initialize MongoDB client; connect=False defers the connection (and its monitor threads) to first use.
+# Every command is timed as a mongo.<command> stage.
 try:
-    client = MongoClient(MONGODB_URI)
+    client = MongoClient(MONGODB_URI, connect=False, event_listeners=[MongoCommandTimer()])
     db = client[DATABASE_NAME]
     print(f"Connected to MongoDB: {DATABASE_NAME}")
 except Exception as e:
@@ -37,32 +83,269 @@ except Exception as e:
     client = None
     db = None
 
-try:
-    openai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
-    if openai_client:
-        print(f"OpenAI client initialized with model {OPENAI_MODEL}")
-except Exception as e:
-    print(f"OpenAI client initialization error: {e}")
-    openai_client = None
+# The openai SDK is slow to import, so its client is created on first use (or by warm_up)
+openai_client = None
+_openai_attempted = False
+_openai_lock = threading.Lock()
+
+def get_openai_client():
+    """Shared OpenAI SDK client, or None without an API key or if it failed to initialize"""
+    global openai_client, _openai_attempted
+    if not _openai_attempted and OPENAI_API_KEY:
+        with _openai_lock:
+            if not _openai_attempted:
+                try:
+                    from openai import OpenAI
+                    
+                    openai_client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+                    print(f"OpenAI client initialized with model {OPENAI_MODEL}")
+                except Exception as e:
+                    print(f"OpenAI client initialization error: {e}")
+                _openai_attempted = True
+    return openai_client
+
+# Cache for TomTom lookups, keyed on geohash tiles. The "shm" backend is one table shared by every
+# worker serve.py forks, so each worker only keeps a small local tier in front of it.
+if GEO_CACHE_BACKEND == 'shm':
+    tomtom_cache = GeoCache(local=TTLCache(max_entries=256), shared=SharedCacheBackend())
+else:
+    tomtom_cache = GeoCache(
+        shared=MongoCacheBackend(db.api_cache) if GEO_CACHE_BACKEND == 'mongo' and db is not None else None
+    )
+
+# Precomputed urban zone model, refreshed in the background from observed POIs
+zone_index = ZoneIndex(collection=db.location_analytics if db is not None else None)
+
+# Changes other workers must mirror (ingested samples, point changes, new users, feed changes) go out on the "mongo" bus
+event_bus = EventBus(db.live_events if EVENT_BUS == 'mongo' and db is not None else None)
+
+# Observed AQI/noise/traffic per geohash tile, read back from in-memory rollups
+metric_store = MetricStore(db)
+metric_store.attach(event_bus)
+
+# Hour-of-week traffic profiles per tile, retrained in the background from metric_samples
+traffic_model = TrafficForecaster(collection=db.metric_samples if db is not None else None)
+
+# Local road graph (built offline from an OSM extract) for routing without TomTom; loaded by warm_up
+route_graph = None
+
+# Trip counters and route history are flushed to Mongo in batches
+trip_writer = TripWriter(db) if db is not None else None
+
+# Per-process user records (user fields plus badges) keyed by session username
+user_cache = TTLCache(max_entries=USER_CACHE_MAX_ENTRIES)
+
+# OpenAI responses keyed on discretized inputs, with in-flight request coalescing
+insight_cache = TTLCache(max_entries=1000)
+insight_flight = SingleFlight()
+chat_cache = TTLCache(max_entries=5000)
+chat_flight = SingleFlight()
+
+# Rule-based chatbot fallback compiled from chatbot_rules.json
+intent_engine = IntentEngine.from_file(CHATBOT_RULES_PATH)
+
+# Rendered community feed pages, cleared in every worker whenever a post is created or upvoted
+feed_cache = TTLCache(max_entries=256)
+
+# Posts and POIs for /api/community/nearby when there is no Mongo 2dsphere index to ask
+post_index = GridIndex()
+poi_index = GridIndex()
+
+# Eco-points ranking kept in memory; Mongo is only read to rebuild it
+leaderboard_service = Leaderboard(pending=trip_writer.pending_batches if trip_writer else None)
+
+# Per-tile metric deltas and user point changes pushed to /api/dashboard/stream subscribers
+live_hub = LiveHub(lambda tile: observed_tile_metrics(tile), app.json.dumps)
+metric_store.listeners.append(live_hub.mark_tiles)
+
+# Expert-mode cluster and heat cells per map tile and zoom, aggregated from posts, POIs and metric rollups
+map_layers = MapLayers(lambda *box: map_layer_points(*box), lambda: metric_store.latest_totals('hour'))
 
-def init_db():
-    """Initialize database collections and indexes"""
-    if not db:
+# Content-hashed, pre-compressed static files (built by warm_up) and pre-rendered pages
+asset_pipeline = AssetPipeline(app.static_folder)
+app.jinja_env.globals['asset_url'] = asset_pipeline.url
+page_cache = PageCache()
+
+def init_db(database=None):
+    """Initialize database collections and indexes.
+    
+    serve.py's master passes a database from a short-lived client of its own, since the
+    app's client must not connect before the workers fork; models are then not fitted here.
+    """
+    if db is None:
         return
+    database = db if database is None else database
     
     # Create indexes for better performance
-    db.users.create_index("username", unique=True)
-    db.badges.create_index("user_id")
-    db.community_posts.create_index("created_at")
-    db.community_posts.create_index("user_id")
-    db.location_analytics.create_index("analyzed_at")
-    db.user_routes.create_index("user_id")
+    database.users.create_index("username", unique=True)
+    database.users.create_index([("eco_points", -1)])
+    database.badges.create_index("user_id")
+    database.community_posts.create_index("created_at")
+    database.community_posts.create_index([("created_at", -1), ("_id", -1)])
+    database.community_posts.create_index([("upvotes", -1), ("_id", -1)])
+    database.community_posts.create_index("user_id")
+    database.community_posts.create_index([("geo", "2dsphere")])
+    database.location_analytics.create_index([("geo", "2dsphere")])
+    database.location_analytics.create_index("analyzed_at")
+    database.user_routes.create_index("user_id")
+    metric_store.init_collections(database)
+    event_bus.init_collection(database)
     
     print("Database initialized with indexes")
+    if database is not db:
+        return
+    
+    if not zone_index.ready and zone_index.fit_from_store():
+        print("Zone model fitted from stored location analytics")
+    
+    if not traffic_model.ready and traffic_model.fit_from_store():
+        print("Traffic forecast fitted from stored metric samples")
+
+_warmed = False
+_warm_lock = threading.Lock()
+_connected = False
+_connect_lock = threading.Lock()
+_worker_started = time.time()
+
+def warm_up(connect=True):
+    """Load models and open connection pools so a worker's first request is not a cold one.
+    
+    serve.py calls warm_up(connect=False) in its master process, which must not hold
+    connections or threads when it forks, and connect_worker() in each worker.
+    """
+    global route_graph, _warmed
+    if _warmed:
+        return
+    with _warm_lock:
+        if _warmed:
+            return
+        start = time.perf_counter()
+        
+        asset_pipeline.build()
+        zone_index.load()
+        traffic_model.load()
+        route_graph = load_route_graph()
+        if route_graph is not None:
+            route_graph.prepare()
+        if connect:
+            connect_worker()
+        
+        _warmed = True
+        print(f"Worker warmed up in {time.perf_counter() - start:.2f}s")
+
+def connect_worker():
+    """Open this process's Mongo pool and OpenAI client and load the per-process state kept in Mongo"""
+    global _connected, _worker_started
+    if _connected:
+        return
+    with _connect_lock:
+        if _connected:
+            return
+        _worker_started = time.time()
+        
+        # The first query opens the connection pool
+        metric_store.load()
+        if db is not None:
+            try:
+                leaderboard_service.ensure_fresh(db.users)
+            except Exception as e:
+                print(f"MongoDB warm-up error: {e}")
+        get_openai_client()
+        event_bus.start()
+        worker_snapshots.start()
+        
+        _connected = True
+
+def share_models():
+    """Move model arrays into shared memory so the workers serve.py forks afterwards map a single copy"""
+    zone_index.share()
+    traffic_model.share()
+    if route_graph is not None:
+        route_graph.share()
+    print(f"Shared {shared_stats()['bytes'] / 1e6:.1f} MB of model arrays with workers")
+
+@app.before_request
+def ensure_warm():
+    """Warm up lazily for servers that did not call warm_up before taking traffic"""
+    if request.endpoint in ('healthz', 'readyz'):
+        return
+    if not _warmed:
+        warm_up()
+    elif not _connected:
+        connect_worker()
 
-def get_or_create_user(username='demo_user'):
+USER_FIELDS = ("username", "eco_points", "green_score", "streak_days", "last_activity", "co2_saved", "clean_trips", "created_at")
+BADGE_FIELDS = ("badge_name", "badge_icon", "earned_at")
+
+def current_username():
+    """Username bound to the current session"""
+    return session.get('username', 'demo_user')
+
+def user_object_id(user):
+    """ObjectId for a user dict returned by get_or_create_user"""
+    return ObjectId(user['id']) if isinstance(user['id'], str) and len(user['id']) == 24 else user.get('_id')
+
+def compact_user_record(user, badges):
+    """Cacheable user record: JSON-ready user fields plus badges, newest first"""
+    record_user = {field: user[field] for field in USER_FIELDS if field in user}
+    record_user['id'] = str(user['_id'])
+    record_badges = []
+    for badge in sorted(badges, key=lambda b: b.get('earned_at') or datetime.min, reverse=True):
+        record_badge = {field: badge[field] for field in BADGE_FIELDS if field in badge}
+        record_badge['id'] = str(badge['_id'])
+        record_badges.append(record_badge)
+    return {'user': record_user, 'badges': record_badges}
+
+def load_user_record(username):
+    """Fetch a user and their badges in a single round trip"""
+    pipeline = [
+        {"$match": {"username": username}},
+        {"$limit": 1},
+        {"$lookup": {"from": "badges", "localField": "_id", "foreignField": "user_id", "as": "badges"}}
+    ]
+    for user in db.users.aggregate(pipeline):
+        return compact_user_record(user, user.pop('badges', []))
+    return None
+
+def create_user_record(username):
+    """Create a new user with the default badges"""
+    now = datetime.now()
+    user_data = {
+        "username": username,
+        "eco_points": 150,
+        "green_score": 65,
+        "streak_days": 3,
+        "last_activity": datetime.combine(now.date(), datetime.min.time()),
+        "co2_saved": 12.5,
+        "clean_trips": 8,
+        "created_at": now
+    }
+    result = db.users.insert_one(user_data)
+    user_id = result.inserted_id
+    
+    # Create default badges
+    badges = [
+        {"user_id": user_id, "badge_name": "Eco Starter", "badge_icon": "🌱", "earned_at": now},
+        {"user_id": user_id, "badge_name": "Conscious Citizen", "badge_icon": "🏅", "earned_at": now}
+    ]
+    db.badges.insert_many(badges)
+    
+    leaderboard_service.upsert(user_data)
+    event_bus.publish('user_created', dict({field: user_data[field] for field in LEADER_FIELDS}, id=str(user_id)))
+    return compact_user_record(user_data, badges)
+
+def get_user_record(username):
+    """Cached user record, loading or creating the user on a miss"""
+    record = user_cache.get(username)
+    if record is None:
+        record = load_user_record(username) or create_user_record(username)
+        user_cache.set(username, record, USER_CACHE_TTL)
+    return record
+
+def get_or_create_user(username=None):
     """Get or create a user session"""
-    if not db:
+    username = username or current_username()
+    if db is None:
         # Fallback if MongoDB not available
         return {
             'id': 'demo',
@@ -75,43 +358,64 @@ def get_or_create_user(username='demo_user'):
             'created_at': datetime.now()
         }
     
-    user = db.users.find_one({"username": username})
-    
-    if not user:
-        # Create new user
-        user_data = {
-            "username": username,
-            "eco_points": 150,
-            "green_score": 65,
-            "streak_days": 3,
-            "last_activity": datetime.now().date(),
-            "co2_saved": 12.5,
-            "clean_trips": 8,
-            "created_at": datetime.now()
-        }
-        result = db.users.insert_one(user_data)
-        user_id = result.inserted_id
-        
-        # Create default badges
-        badges = [
-            {"user_id": user_id, "badge_name": "Eco Starter", "badge_icon": "🌱", "earned_at": datetime.now()},
-            {"user_id": user_id, "badge_name": "Conscious Citizen", "badge_icon": "🏅", "earned_at": datetime.now()}
-        ]
-        db.badges.insert_many(badges)
-        
-        user = db.users.find_one({"_id": user_id})
-    
-    # Convert ObjectId to string for JSON serialization
-    user['id'] = str(user['_id'])
-    del user['_id']
-    
+    return dict(get_user_record(username)['user'])
+
+def get_user_badges(username=None):
+    """Badges for a user, served from the user cache"""
+    if db is None:
+        return []
+    return list(get_user_record(username or current_username())['badges'])
+
+def apply_user_increments(username, increments):
+    """Mirror counter increments into the cached user record so reads see them before the write-behind flush.
+
+    Returns the updated user fields, or None when the user is not cached.
+    """
+    record = user_cache.get(username)
+    if record is None:
+        return None
+    user = dict(record['user'])
+    for field, amount in increments.items():
+        user[field] = user.get(field, 0) + amount
+    user_cache.set(username, {'user': user, 'badges': record['badges']}, USER_CACHE_TTL)
     return user
 
+def apply_trip_points(username, increments):
+    """Mirror a trip's counter increments into the user cache and leaderboard and push them to live dashboards"""
+    updated = apply_user_increments(username, increments)
+    leaderboard_service.apply_increment(username, eco_points=increments['eco_points'], co2_saved=increments['co2_saved'])
+    totals = {field: updated[field] for field in increments} if updated else {}
+    live_hub.publish(f"user:{username}", 'user', dict(totals, delta=increments))
+
+# Trips planned, users created and posts changed on other workers
+event_bus.on('trip_points', lambda event: apply_trip_points(event['username'], event['increments']))
+event_bus.on('user_created', lambda entry: leaderboard_service.upsert(entry))
+event_bus.on('feed_changed', lambda event: feed_cache.clear())
+
+@timed('ml_patterns')
 def analyze_location_patterns_ml(locations_data):
-    """Use ML clustering to identify urban zone patterns"""
-    if not locations_data or len(locations_data) < 3:
+    """Label locations with urban zone patterns from the precomputed zone model"""
+    if not locations_data:
         return None
     
+    # Only real POIs are stored or indexed; mock results (no API key, or TomTom unavailable) are random
+    # and would show up in the zone model, nearby searches and map layers
+    real = [loc for loc in locations_data if loc.get('source') != 'mock']
+    if real:
+        zone_index.observe(real)
+    if db is None:
+        for loc in real:
+            poi_index.insert(f"{loc['name']}|{loc['lat']:.5f}|{loc['lon']:.5f}", loc['lat'], loc['lon'], dict(loc))
+    
+    if zone_index.ready:
+        return zone_index.assign(locations_data)
+    
+    # No zone model fitted yet: cluster this request's points on their own
+    if len(locations_data) < 3:
+        return None
+    
+    from sklearn.cluster import KMeans
+    
     coords = np.array([[loc['lat'], loc['lon']] for loc in locations_data])
     
     n_clusters = min(3, len(locations_data))
@@ -126,42 +430,72 @@ def analyze_location_patterns_ml(locations_data):
     
     return locations_data
 
-def generate_traffic_pattern(lat, lon):
-    """Generate ML-based traffic pattern analysis"""
-    hour = datetime.now().hour
-    
-    patterns = {
-        'peak_morning': (7, 9),
-        'peak_evening': (17, 20),
-        'quiet': (22, 6)
-    }
-    
+def traffic_bucket(hour):
+    """Pattern text, traffic level range and busy hours for an hour of day"""
     if 7 <= hour <= 9:
-        pattern = "Peak morning traffic - Busiest between 7-9 AM"
-        traffic_level = random.randint(70, 95)
+        return "Peak morning traffic - Busiest between 7-9 AM", 70, 95, '7-9 AM'
     elif 17 <= hour <= 20:
-        pattern = "Peak evening rush - Busiest between 6-8 PM"
-        traffic_level = random.randint(75, 100)
+        return "Peak evening rush - Busiest between 6-8 PM", 75, 100, '6-8 PM'
     elif 22 <= hour or hour <= 6:
-        pattern = "Quiet zone - Perfect for evening walks"
-        traffic_level = random.randint(10, 30)
+        return "Quiet zone - Perfect for evening walks", 10, 30, 'Low traffic'
     else:
-        pattern = "Moderate traffic - Good time for errands"
-        traffic_level = random.randint(40, 65)
+        return "Moderate traffic - Good time for errands", 40, 65, 'Low traffic'
+
+def busy_hours_label(peak_hour):
+    """Two-hour window starting at a peak hour, e.g. '6-8 PM' or '11 AM-1 PM'"""
+    start, end = peak_hour % 24, (peak_hour + 2) % 24
+    start_suffix, end_suffix = ('AM' if start < 12 else 'PM'), ('AM' if end < 12 else 'PM')
+    start_label = f"{start % 12 or 12}" if start_suffix == end_suffix else f"{start % 12 or 12} {start_suffix}"
+    return f"{start_label}-{end % 12 or 12} {end_suffix}"
+
+def forecast_pattern(traffic_level, busy_hours):
+    """Pattern text for a forecast traffic level"""
+    if traffic_level >= 70:
+        return f"Heavy traffic expected - Busiest between {busy_hours}"
+    elif traffic_level >= 40:
+        return "Moderate traffic - Good time for errands"
+    return "Quiet zone - Perfect for walks"
+
+def generate_traffic_pattern(lat, lon):
+    """Traffic pattern from the location's forecast profile, or the hour-of-day prior without one"""
+    now = datetime.now()
+    pattern, low, high, busy_hours = traffic_bucket(now.hour)
     
+    forecast = traffic_model.forecast(lat, lon, now)
+    if forecast is None:
+        return {
+            'pattern': pattern,
+            'traffic_level': random.randint(low, high),
+            'busy_hours': busy_hours,
+            'recommendations': []
+        }
+    
+    peak = traffic_model.peak_hour(lat, lon, now)
+    busy_hours = busy_hours_label(peak) if peak is not None else busy_hours
     return {
-        'pattern': pattern,
-        'traffic_level': traffic_level,
-        'busy_hours': '6-8 PM' if 17 <= hour <= 20 else '7-9 AM' if 7 <= hour <= 9 else 'Low traffic',
+        'pattern': forecast_pattern(forecast, busy_hours),
+        'traffic_level': int(round(forecast)),
+        'busy_hours': busy_hours,
         'recommendations': []
     }
 
-def get_tomtom_search(query, lat=None, lon=None):
-    """Search POIs using TomTom Search API"""
-    if not TOMTOM_API_KEY:
-        return mock_tomtom_search(query, lat, lon)
+def generate_traffic_patterns(lats, lons):
+    """Vectorized generate_traffic_pattern: one shared pattern plus a forecast traffic level per point"""
+    now = datetime.now()
+    pattern, low, high, busy_hours = traffic_bucket(now.hour)
     
-    url = f"https://api.tomtom.com/search/2/search/{query}.json"
+    forecast = traffic_model.predict(lats, lons, now)
+    missing = np.isnan(forecast)
+    levels = np.where(missing, np.random.randint(low, high + 1, size=len(lats)), np.rint(np.nan_to_num(forecast))).astype(np.int64)
+    return {
+        'pattern': pattern,
+        'busy_hours': busy_hours,
+        'recommendations': []
+    }, levels
+
+def tomtom_search_request(query, lat=None, lon=None):
+    """Build the TomTom Search API url and query params"""
+    url = f"{TOMTOM_BASE_URL}/search/2/search/{query}.json"
     params = {
         'key': TOMTOM_API_KEY,
         'limit': 10
@@ -169,19 +503,35 @@ def get_tomtom_search(query, lat=None, lon=None):
     if lat and lon:
         params['lat'] = lat
         params['lon'] = lon
+    return url, params
+
+@timed('tomtom_search')
+def get_tomtom_search(query, lat=None, lon=None):
+    """Search POIs using TomTom Search API"""
+    if not TOMTOM_API_KEY:
+        return mock_tomtom_search(query, lat, lon)
+    
+    cache_key = search_key(query, lat, lon)
+    cached = tomtom_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    url, params = tomtom_search_request(query, lat, lon)
     
     try:
-        response = requests.get(url, params=params, timeout=5)
+        response = tomtom_http.get(url, params=params, timeout=5)
         if response.status_code == 200:
             data = response.json()
-            return data.get('results', [])
+            results = data.get('results', [])
+            tomtom_cache.set(cache_key, results, GEO_CACHE_SEARCH_TTL)
+            return results
     except Exception as e:
         print(f"TomTom API error: {e}")
     
     return mock_tomtom_search(query, lat, lon)
 
 def mock_tomtom_search(query, lat=None, lon=None):
-    """Mock TomTom search results for demo"""
+    """Mock TomTom search results for demo, marked with source 'mock' so they are never stored"""
     base_lat = lat or 18.5204
     base_lon = lon or 73.8567
     
@@ -203,34 +553,55 @@ def mock_tomtom_search(query, lat=None, lon=None):
             },
             'address': {
                 'freeformAddress': f"Street {i+1}, Pune, India"
-            }
+            },
+            'source': 'mock'
         })
     
     return results
 
+@timed('tomtom_route')
 def get_tomtom_route(start_lat, start_lon, end_lat, end_lon, route_type='eco'):
     """Get route using TomTom Routing API"""
     if not TOMTOM_API_KEY:
-        return mock_tomtom_route(start_lat, start_lon, end_lat, end_lon, route_type)
+        return offline_route(start_lat, start_lon, end_lat, end_lon, route_type)
+    
+    cache_key = route_key(start_lat, start_lon, end_lat, end_lon, route_type)
+    cached = tomtom_cache.get(cache_key)
+    if cached is not None:
+        return cached
     
-    url = f"https://api.tomtom.com/routing/1/calculateRoute/{start_lat},{start_lon}:{end_lat},{end_lon}/json"
+    url = f"{TOMTOM_BASE_URL}/routing/1/calculateRoute/{start_lat},{start_lon}:{end_lat},{end_lon}/json"
     params = {
         'key': TOMTOM_API_KEY,
         'routeType': 'eco' if route_type == 'eco' else 'fastest'
     }
     
     try:
-        response = requests.get(url, params=params, timeout=5)
+        response = tomtom_http.get(url, params=params, timeout=5)
         if response.status_code == 200:
-            return response.json()
+            route_data = response.json()
+            tomtom_cache.set(cache_key, route_data, GEO_CACHE_ROUTE_TTL)
+            return route_data
     except Exception as e:
         print(f"TomTom Routing API error: {e}")
     
+    return offline_route(start_lat, start_lon, end_lat, end_lon, route_type)
+
+def offline_route(start_lat, start_lon, end_lat, end_lon, route_type):
+    """Route on the local road graph when one is loaded, else the straight-line mock"""
+    if route_graph is not None:
+        try:
+            route = route_graph.route(float(start_lat), float(start_lon), float(end_lat), float(end_lon), route_type)
+            if route is not None:
+                return route
+        except Exception as e:
+            print(f"Local routing error: {e}")
+    
     return mock_tomtom_route(start_lat, start_lon, end_lat, end_lon, route_type)
 
 def mock_tomtom_route(start_lat, start_lon, end_lat, end_lon, route_type):
     """Mock TomTom route for demo"""
-    distance = geodesic((start_lat, start_lon), (end_lat, end_lon)).kilometers
+    distance = distance_km(start_lat, start_lon, end_lat, end_lon)
     
     travel_time = int(distance * 4 * 60)
     if route_type == 'eco':
@@ -255,41 +626,91 @@ def mock_tomtom_route(start_lat, start_lon, end_lat, end_lon, route_type):
         }]
     }
 
-def get_ai_insight(location_data, context='general'):
-    """Generate AI-powered insights using OpenAI"""
-    if not OPENAI_API_KEY:
-        return generate_mock_insight(location_data, context)
-    
-    try:
-        prompt = f"""Generate a one-line friendly insight about this location data:
-        Traffic Level: {location_data.get('traffic_level', 50)}%
-        AQI: {location_data.get('aqi', 75)}
-        Time: {datetime.now().strftime('%H:%M')}
+OPENAI_CHAT_URL = f'{OPENAI_BASE_URL}/chat/completions'
+
+def openai_headers():
+    """Headers for direct OpenAI REST calls"""
+    return {
+        'Authorization': f'Bearer {OPENAI_API_KEY}',
+        'Content-Type': 'application/json'
+    }
+
+def traffic_band(traffic_level):
+    """Coarse traffic band used for insight prompts and cache keys"""
+    if traffic_level < 40:
+        return 'light (under 40%)'
+    elif traffic_level < 70:
+        return 'moderate (40-69%)'
+    return 'heavy (70% or more)'
+
+def aqi_band(aqi):
+    """Coarse AQI band used for insight prompts and cache keys"""
+    if aqi < 50:
+        return 'good (under 50)'
+    elif aqi < 100:
+        return 'moderate (50-99)'
+    elif aqi < 150:
+        return 'unhealthy for sensitive groups (100-149)'
+    return 'unhealthy (150 or more)'
+
+def insight_cache_key(location_data, context='general'):
+    """Discretized insight inputs; identical keys produce identical prompts"""
+    return (
+        traffic_band(location_data.get('traffic_level', 50)),
+        aqi_band(location_data.get('aqi', 75)),
+        datetime.now().hour,
+        context
+    )
+
+def insight_request_body(location_data, context='general'):
+    """Build the chat completion payload for a one-line location insight"""
+    traffic, aqi, hour, context = insight_cache_key(location_data, context)
+    prompt = f"""Generate a one-line friendly insight about this location data:
+        Traffic Level: {traffic}
+        AQI: {aqi}
+        Time: around {hour:02d}:00
         Context: {context}
         
         Provide a helpful, conversational insight like "Traffic is moderate in your zone, AQI is healthy — best time for an evening walk!"
         """
-        
-        response = requests.post(
-            'https://api.openai.com/v1/chat/completions',
-            headers={
-                'Authorization': f'Bearer {OPENAI_API_KEY}',
-                'Content-Type': 'application/json'
-            },
-            json={
-                'model': 'gpt-3.5-turbo',
-                'messages': [{'role': 'user', 'content': prompt}],
-                'max_tokens': 100
-            },
+    return {
+        'model': 'gpt-3.5-turbo',
+        'messages': [{'role': 'user', 'content': prompt}],
+        'max_tokens': 100
+    }
+
+def fetch_ai_insight(cache_key, location_data, context):
+    """Call OpenAI for an insight and cache it; returns None on failure"""
+    try:
+        response = openai_http.post(
+            OPENAI_CHAT_URL,
+            headers=openai_headers(),
+            json=insight_request_body(location_data, context),
             timeout=10
         )
         
         if response.status_code == 200:
-            return response.json()['choices'][0]['message']['content'].strip()
+            insight = response.json()['choices'][0]['message']['content'].strip()
+            insight_cache.set(cache_key, insight, INSIGHT_CACHE_TTL)
+            return insight
     except Exception as e:
         print(f"OpenAI API error: {e}")
     
-    return generate_mock_insight(location_data, context)
+    return None
+
+@timed('ai_insight')
+def get_ai_insight(location_data, context='general'):
+    """Generate AI-powered insights using OpenAI"""
+    if not OPENAI_API_KEY:
+        return generate_mock_insight(location_data, context)
+    
+    cache_key = insight_cache_key(location_data, context)
+    insight = insight_cache.get(cache_key)
+    if insight is None:
+        # Concurrent requests in the same bucket share one upstream call
+        insight = insight_flight.do(cache_key, lambda: fetch_ai_insight(cache_key, location_data, context))
+    
+    return insight or generate_mock_insight(location_data, context)
 
 def generate_mock_insight(location_data, context):
     """Generate mock AI insights"""
@@ -307,67 +728,37 @@ def generate_mock_insight(location_data, context):
 
 def get_rule_based_response(message: str) -> str:
     """Generate a simple rule-based chatbot response when OpenAI is unavailable"""
-    if not message:
-        return "I'm GeoSense+, your eco-assistant! Ask me about clean routes, air quality, or earning eco-points."
-
-    message_lower = message.lower()
-
-    responses = [
-        (
-            ['route', 'walk', 'bike', 'path'],
-            "I can guide you to cleaner routes! Try exploring eco-friendly paths during off-peak hours to save emissions."
-        ),
-        (
-            ['eco', 'carbon', 'green score', 'points'],
-            "Eco-points come from choosing sustainable travel. Every eco-route boosts your green score and saves CO₂!"
-        ),
-        (
-            ['air', 'aqi', 'pollution', 'quality'],
-            "Local AQI is usually best early mornings after rainfall. Consider parks or riverside areas for the cleanest air!"
-        ),
-        (
-            ['traffic', 'congestion', 'rush'],
-            "Traffic peaks around 8 AM and 6 PM. Shifting your commute by 20 minutes can lower delays and emissions."
-        ),
-        (
-            ['mad', 'angry'],
-            "I'm never mad—just motivated to help you find greener journeys!"
-        ),
-    ]
-
-    for keywords, response in responses:
-        if any(keyword in message_lower for keyword in keywords):
-            return response
-
-    return "I'm here to help with eco-routes, air quality insights, or your green score. How can I assist?"
+    return intent_engine.respond(message)
 
 @app.route('/')
 def index():
-    return render_template('index.html', tomtom_key=TOMTOM_API_KEY or '')
+    # The page only depends on configuration, so it is rendered and compressed once per config
+    tomtom_key = TOMTOM_API_KEY or ''
+    page = page_cache.get(('index.html', tomtom_key), lambda: render_template('index.html', tomtom_key=tomtom_key))
+    return page.response(request, 'no-cache')
+
+@app.route(f'{asset_pipeline.url_prefix}/<path:filename>')
+def hashed_asset(filename):
+    """Serve a content-hashed static file, pre-compressed when the client accepts it"""
+    response = asset_pipeline.response(filename, request)
+    if response is None:
+        return jsonify({'error': 'Asset not found'}), 404
+    return response
 
 @app.route('/api/dashboard')
 def dashboard_data():
     """Get dashboard data for current user"""
     user = get_or_create_user()
     
-    badges = []
-    if db:
-        user_id = ObjectId(user['id']) if isinstance(user['id'], str) and len(user['id']) == 24 else user.get('_id')
-        if user_id:
-            try:
-                badges_cursor = db.badges.find({"user_id": user_id}).sort("earned_at", -1)
-                badges = []
-                for badge in badges_cursor:
-                    badge['id'] = str(badge['_id'])
-                    del badge['_id']
-                    badges.append(badge)
-            except:
-                pass
+    badges = get_user_badges(user['username'])
     
+    lat = request.args.get('lat', 18.5204, type=float)
+    lon = request.args.get('lon', 73.8567, type=float)
+    observed = observed_metrics(lat, lon)
     location_data = {
-        'aqi': random.randint(50, 120),
-        'noise_level': random.randint(40, 80),
-        'traffic_level': random.randint(30, 90)
+        'aqi': observed['aqi'] if 'aqi' in observed else random.randint(50, 120),
+        'noise_level': observed['noise_level'] if 'noise_level' in observed else random.randint(40, 80),
+        'traffic_level': observed['traffic_level'] if 'traffic_level' in observed else random.randint(30, 90)
     }
     
     insight = get_ai_insight(location_data, 'dashboard')
@@ -385,16 +776,46 @@ def dashboard_data():
         'streak': user['streak_days']
     })
 
-@app.route('/api/location/analyze', methods=['POST'])
-def analyze_location():
-    """Analyze location using TomTom and ML"""
-    data = request.json
-    lat = data.get('lat', 18.5204)
-    lon = data.get('lon', 73.8567)
-    query = data.get('query', 'points of interest')
+@app.route('/api/dashboard/stream')
+def dashboard_stream():
+    """Live dashboard as Server-Sent Events: a snapshot, then metric deltas for the tile and point changes"""
+    lat = request.args.get('lat', 18.5204, type=float)
+    lon = request.args.get('lon', 73.8567, type=float)
+    username = current_username()
+    tile = metric_store.tile(lat, lon)
     
-    pois = get_tomtom_search(query, lat, lon)
+    try:
+        subscription = live_hub.subscribe([f'tile:{tile}', f'user:{username}'])
+    except SubscriberLimitError as e:
+        return jsonify({'error': str(e)}), 503
+    
+    # Subscribed before the snapshot is taken, so no update can fall between the two
+    try:
+        user = get_or_create_user(username)
+        snapshot = {
+            'tile': tile,
+            'metrics': live_hub.snapshot(tile),
+            'user': {field: user.get(field) for field in ('eco_points', 'co2_saved', 'clean_trips', 'green_score', 'streak_days')}
+        }
+    except Exception:
+        live_hub.unsubscribe(subscription)
+        raise
+    
+    def generate():
+        yield live_hub.frame('snapshot', snapshot)
+        yield from subscription.stream()
     
+    response = Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Runs when the server closes the response, even if the client left before the first byte
+    response.call_on_close(lambda: live_hub.unsubscribe(subscription))
+    return response
+
+def pois_to_locations(pois, lat, lon):
+    """Flatten the top TomTom POI results into clustering input"""
     locations_data = []
     for poi in pois[:5]:
         pos = poi.get('position', {})
@@ -402,17 +823,44 @@ def analyze_location():
             'lat': pos.get('lat', lat),
             'lon': pos.get('lon', lon),
             'name': poi.get('poi', {}).get('name', 'Unknown'),
-            'category': poi.get('poi', {}).get('categories', ['General'])[0] if poi.get('poi', {}).get('categories') else 'General'
+            'category': poi.get('poi', {}).get('categories', ['General'])[0] if poi.get('poi', {}).get('categories') else 'General',
+            'source': poi.get('source', 'tomtom')
         })
+    return locations_data
+
+def observed_metrics(lat, lon):
+    """Hourly averages recorded for the tile around a point; empty when nothing was ingested there"""
+    return observed_tile_metrics(metric_store.tile(lat, lon))
+
+def observed_tile_metrics(tile):
+    rollup = metric_store.latest_tile(tile, 'hour')
+    if rollup is None:
+        return {}
+    return {name: int(round(rollup[name]['avg'])) for name in METRIC_NAMES if name in rollup}
+
+def location_metrics(lat, lon, traffic_pattern):
+    """Environmental metrics for an analyzed location"""
+    observed = observed_metrics(lat, lon)
+    return {
+        'aqi': observed['aqi'] if 'aqi' in observed else random.randint(60, 110),
+        'noise_level': observed['noise_level'] if 'noise_level' in observed else random.randint(45, 85),
+        'traffic_level': observed.get('traffic_level', traffic_pattern['traffic_level'])
+    }
+
+@app.route('/api/location/analyze', methods=['POST'])
+def analyze_location():
+    """Analyze location using TomTom and ML"""
+    data = request.json
+    lat = data.get('lat', 18.5204)
+    lon = data.get('lon', 73.8567)
+    query = data.get('query', 'points of interest')
+    
+    pois = get_tomtom_search(query, lat, lon)
+    locations_data = pois_to_locations(pois, lat, lon)
     
     analyzed = analyze_location_patterns_ml(locations_data)
     traffic_pattern = generate_traffic_pattern(lat, lon)
-    
-    location_data = {
-        'aqi': random.randint(60, 110),
-        'noise_level': random.randint(45, 85),
-        'traffic_level': traffic_pattern['traffic_level']
-    }
+    location_data = location_metrics(lat, lon, traffic_pattern)
     
     insight = get_ai_insight(location_data, 'location_analysis')
     
@@ -423,6 +871,118 @@ def analyze_location():
         'insight': insight
     })
 
+def parse_batch_coords(req):
+    """Read an (N, 2) lat/lon array from a JSON or NDJSON batch request body"""
+    # Bounded read, so an oversized body is rejected before it is buffered or parsed
+    if req.content_length is not None and req.content_length > BATCH_MAX_BYTES:
+        raise ValueError(f'Batch bodies are limited to {BATCH_MAX_BYTES} bytes')
+    body = req.stream.read(BATCH_MAX_BYTES + 1)
+    if len(body) > BATCH_MAX_BYTES:
+        raise ValueError(f'Batch bodies are limited to {BATCH_MAX_BYTES} bytes')
+    
+    if req.mimetype == 'application/x-ndjson':
+        points = []
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            if len(points) == BATCH_MAX_POINTS:
+                raise ValueError(f'At most {BATCH_MAX_POINTS} points per batch')
+            points.append(json.loads(line))
+    else:
+        data = json.loads(body) if body.strip() else {}
+        points = data.get('points', []) if isinstance(data, dict) else []
+    
+    if not points:
+        raise ValueError('No points supplied')
+    if len(points) > BATCH_MAX_POINTS:
+        raise ValueError(f'At most {BATCH_MAX_POINTS} points per batch')
+    
+    if isinstance(points[0], dict):
+        coords = np.array([(p['lat'], p['lon']) for p in points], dtype=np.float64)
+    else:
+        coords = np.array(points, dtype=np.float64)
+    
+    if coords.ndim != 2 or coords.shape[1] != 2 or not np.isfinite(coords).all():
+        raise ValueError('Points must be finite [lat, lon] pairs')
+    if (np.abs(coords[:, 0]) > 90).any() or (np.abs(coords[:, 1]) > 180).any():
+        raise ValueError('Coordinates out of range')
+    return coords
+
+@app.route('/api/location/analyze/batch', methods=['POST'])
+def analyze_location_batch():
+    """Zone labels, traffic levels and metrics for many coordinates, streamed as one JSON document"""
+    try:
+        coords = parse_batch_coords(request)
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({'error': f'Invalid batch: {e}'}), 400
+    
+    n = len(coords)
+    lats, lons = coords[:, 0], coords[:, 1]
+    
+    # Zones come from the background-fitted model only; until it exists they are null, so a request
+    # never pays for (or lets callers trigger) a clustering run
+    model = zone_index.model
+    
+    if model is not None:
+        clusters = model.predict(coords)
+        zone_names = np.array(ZONE_TYPES)[model.labels[clusters]]
+        distances = pairwise_km(coords, model.centroids[clusters])
+    
+    traffic_pattern, traffic_levels = generate_traffic_patterns(lats, lons)
+    aqi = np.random.randint(60, 111, size=n)
+    noise = np.random.randint(45, 86, size=n)
+    
+    def generate():
+        yield '{"count": %d, "traffic_pattern": %s, "results": [' % (n, json.dumps(traffic_pattern))
+        for start in range(0, n, BATCH_CHUNK_SIZE):
+            end = min(start + BATCH_CHUNK_SIZE, n)
+            columns = [lats[start:end].tolist(), lons[start:end].tolist(), traffic_levels[start:end].tolist(),
+                       aqi[start:end].tolist(), noise[start:end].tolist()]
+            if model is not None:
+                columns += [clusters[start:end].tolist(), zone_names[start:end].tolist(), distances[start:end].tolist()]
+                row = '{"lat": %.6f, "lon": %.6f, "traffic_level": %d, "aqi": %d, "noise_level": %d, "cluster": %d, "zone_type": "%s", "distance_to_zone_km": %.3f}'
+            else:
+                row = '{"lat": %.6f, "lon": %.6f, "traffic_level": %d, "aqi": %d, "noise_level": %d, "cluster": null, "zone_type": null, "distance_to_zone_km": null}'
+            chunk = ', '.join(row % values for values in zip(*columns))
+            yield chunk if start == 0 else ', ' + chunk
+        yield ']}'
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+@app.route('/api/metrics/ingest', methods=['POST'])
+def ingest_metrics():
+    """Record AQI/noise/traffic samples (one object or a "samples" list) into the time-series store"""
+    if not METRICS_INGEST_TOKEN or request.headers.get('X-Ingest-Token') != METRICS_INGEST_TOKEN:
+        return jsonify({'error': 'Metric ingest requires METRICS_INGEST_TOKEN'}), 403
+    data = request.get_json(silent=True) or {}
+    samples = data.get('samples', [data])
+    
+    try:
+        stored = metric_store.record_many(samples)
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({'error': f'Invalid sample: {e}'}), 400
+    
+    return jsonify({'success': True, 'stored': stored})
+
+@app.route('/api/metrics/series')
+def metrics_series():
+    """Rolled-up metrics for the tile around a point, oldest bucket first"""
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    resolution = request.args.get('resolution', 'hour')
+    limit = request.args.get('limit', 24, type=int)
+    
+    if lat is None or lon is None:
+        return jsonify({'error': 'lat and lon are required'}), 400
+    if resolution not in ROLLUP_RESOLUTIONS:
+        return jsonify({'error': f"resolution must be one of {', '.join(ROLLUP_RESOLUTIONS)}"}), 400
+    
+    return jsonify({
+        'tile': metric_store.tile(lat, lon),
+        'resolution': resolution,
+        'buckets': metric_store.window(lat, lon, resolution, max(1, limit))
+    })
+
 @app.route('/api/route/plan', methods=['POST'])
 def plan_route():
     """Plan eco-friendly route using TomTom Routing API"""
@@ -445,29 +1005,30 @@ def plan_route():
         
         user = get_or_create_user()
         
-        if db:
-            user_id = ObjectId(user['id']) if isinstance(user['id'], str) and len(user['id']) == 24 else user.get('_id')
+        if db is not None:
+            user_id = user_object_id(user)
             if user_id:
-                db.users.update_one(
-                    {"_id": user_id},
+                # Counters and route history are written behind the response
+                increments = {"eco_points": eco_points, "co2_saved": co2_saved, "clean_trips": 1}
+                queued = trip_writer.record(
+                    user_id,
+                    increments,
                     {
-                        "$inc": {
-                            "eco_points": eco_points,
-                            "co2_saved": co2_saved,
-                            "clean_trips": 1
-                        }
+                        "user_id": user_id,
+                        "start_location": f"{start_lat},{start_lon}",
+                        "end_location": f"{end_lat},{end_lon}",
+                        "route_type": route_type,
+                        "eco_points_earned": eco_points,
+                        "created_at": datetime.now()
                     }
                 )
-                
-                # Save route
-                db.user_routes.insert_one({
-                    "user_id": user_id,
-                    "start_location": f"{start_lat},{start_lon}",
-                    "end_location": f"{end_lat},{end_lon}",
-                    "route_type": route_type,
-                    "eco_points_earned": eco_points,
-                    "created_at": datetime.now()
-                })
+                if not queued:
+                    # The database has fallen behind; refuse the trip rather than queue without bound
+                    response = jsonify({'error': 'Trip could not be recorded right now, please try again shortly'})
+                    response.headers['Retry-After'] = str(int(trip_writer.flush_interval) + 1)
+                    return response, 503
+                apply_trip_points(user['username'], increments)
+                event_bus.publish('trip_points', {'username': user['username'], 'increments': increments})
         
         return jsonify({
             'route': route,
@@ -480,25 +1041,69 @@ def plan_route():
     
     return jsonify({'error': 'Could not calculate route'}), 400
 
-@app.route('/api/chatbot', methods=['POST'])
-def chatbot():
-    """AI chatbot for conversational queries"""
-    data = request.json
-    message = data.get('message', '')
+def parse_route_pairs(data):
+    """Read an (N, 4) start/end lat/lon array from a batch route request"""
+    pairs = data.get('pairs', [])
+    if not pairs:
+        raise ValueError('No pairs supplied')
+    if len(pairs) > ROUTE_BATCH_MAX_PAIRS:
+        raise ValueError(f'At most {ROUTE_BATCH_MAX_PAIRS} pairs per batch')
     
-    if not openai_client:
-        return jsonify({'response': get_rule_based_response(message)})
+    if isinstance(pairs[0], dict):
+        pairs = [(p['start_lat'], p['start_lon'], p['end_lat'], p['end_lon']) for p in pairs]
+    pairs = np.array(pairs, dtype=np.float64)
+    
+    if pairs.ndim != 2 or pairs.shape[1] != 4 or not np.isfinite(pairs).all():
+        raise ValueError('Pairs must be finite [start_lat, start_lon, end_lat, end_lon] rows')
+    if (np.abs(pairs[:, [0, 2]]) > 90).any() or (np.abs(pairs[:, [1, 3]]) > 180).any():
+        raise ValueError('Coordinates out of range')
+    return pairs
+
+@app.route('/api/route/plan/batch', methods=['POST'])
+def plan_route_batch():
+    """Plan many origin/destination pairs on the local road graph (commute matrices)"""
+    if route_graph is None:
+        return jsonify({'error': 'No local route graph loaded; build one with route_graph.py'}), 503
+    
+    data = request.get_json(silent=True) or {}
+    route_type = data.get('route_type', 'eco')
+    if route_type not in ROUTE_COSTS:
+        return jsonify({'error': f"route_type must be one of {', '.join(ROUTE_COSTS)}"}), 400
+    
+    try:
+        pairs = parse_route_pairs(data)
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({'error': f'Invalid batch: {e}'}), 400
+    
+    results = route_graph.matrix(pairs, route_type, include_points=bool(data.get('include_points')))
+    
+    return jsonify({
+        'count': len(results),
+        'routed': sum(result is not None for result in results),
+        'route_type': route_type,
+        'results': results
+    })
+
+CHATBOT_SYSTEM_PROMPT = 'You are GeoSense+, a helpful eco-assistant that helps users find clean routes, check air quality, and earn eco-points. Be friendly, factual, and concise.'
+
+def normalize_chat_message(message):
+    """Case-, punctuation- and whitespace-insensitive form of a chat message"""
+    return ' '.join(re.sub(r"[^\w\s]", ' ', (message or '').lower()).split())
+
+def chat_messages(message):
+    """System prompt plus the user's message for a chatbot completion"""
+    return [
+        {'role': 'system', 'content': CHATBOT_SYSTEM_PROMPT},
+        {'role': 'user', 'content': message or 'Hello!'}
+    ]
 
+@timed('chat_completion')
+def fetch_chat_completion(cache_key, message):
+    """Ask OpenAI for a chatbot reply and cache it; returns None on failure"""
     try:
-        completion = openai_client.chat.completions.create(
+        completion = get_openai_client().chat.completions.create(
             model=OPENAI_MODEL,
-            messages=[
-                {
-                    'role': 'system',
-                    'content': 'You are GeoSense+, a helpful eco-assistant that helps users find clean routes, check air quality, and earn eco-points. Be friendly, factual, and concise.'
-                },
-                {'role': 'user', 'content': message or 'Hello!'}
-            ],
+            messages=chat_messages(message),
             max_tokens=200,
             temperature=0.7
         )
@@ -506,18 +1111,152 @@ def chatbot():
         if completion and completion.choices:
             response_text = completion.choices[0].message.content.strip()
             if response_text:
-                return jsonify({'response': response_text})
+                chat_cache.set(cache_key, response_text, CHATBOT_CACHE_TTL)
+                return response_text
 
         print("Chatbot warning: OpenAI response missing choices or content")
     except Exception as e:
         print(f"Chatbot OpenAI error: {e}")
 
-    return jsonify({'response': get_rule_based_response(message)})
+    return None
+
+@app.route('/api/chatbot', methods=['POST'])
+def chatbot():
+    """AI chatbot for conversational queries"""
+    data = request.json
+    message = data.get('message', '')
+    
+    if not get_openai_client():
+        return jsonify({'response': get_rule_based_response(message)})
+
+    cache_key = normalize_chat_message(message)
+    response_text = chat_cache.get(cache_key)
+    if response_text is None:
+        response_text = chat_flight.do(cache_key, lambda: fetch_chat_completion(cache_key, message))
+
+    return jsonify({'response': response_text or get_rule_based_response(message)})
+
+def sse_event(payload, event=None):
+    """Format one Server-Sent Events frame with a JSON payload"""
+    return sse_frame(app.json.dumps(payload), event)
+
+def stream_chat_reply(message):
+    """Yield SSE frames for a chatbot reply: cached text, OpenAI deltas, or the rule-based fallback"""
+    # Flush headers straight away so the client sees the first byte before OpenAI answers
+    yield ': stream open\n\n'
+    
+    cache_key = normalize_chat_message(message)
+    cached = chat_cache.get(cache_key)
+    if cached is not None:
+        yield sse_event({'delta': cached})
+        yield sse_event({}, 'done')
+        return
+    
+    parts = []
+    openai_client = get_openai_client()
+    if openai_client:
+        try:
+            stream = openai_client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=chat_messages(message),
+                max_tokens=200,
+                temperature=0.7,
+                stream=True
+            )
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield sse_event({'delta': delta})
+            
+            response_text = ''.join(parts).strip()
+            if response_text:
+                chat_cache.set(cache_key, response_text, CHATBOT_CACHE_TTL)
+        except Exception as e:
+            print(f"Chatbot OpenAI stream error: {e}")
+    
+    if not parts:
+        for word in re.findall(r'\S+\s*', get_rule_based_response(message)):
+            yield sse_event({'delta': word})
+    
+    yield sse_event({}, 'done')
+
+@app.route('/api/chatbot/stream', methods=['POST'])
+def chatbot_stream():
+    """AI chatbot reply streamed token by token as Server-Sent Events"""
+    data = request.json or {}
+    message = data.get('message', '')
+    
+    return Response(
+        stream_with_context(stream_chat_reply(message)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+POST_FIELDS = ("user_id", "username", "title", "content", "location", "geo", "post_type", "upvotes", "created_at")
+FEED_SORT_FIELDS = {'new': 'created_at', 'top': 'upvotes'}
+
+def encode_feed_cursor(sort, post):
+    """Opaque keyset cursor pointing just past this post"""
+    value = post['created_at'].isoformat() if sort == 'new' else str(post['upvotes'])
+    return base64.urlsafe_b64encode(f"{value}|{post['id']}".encode()).decode()
+
+def decode_feed_cursor(sort, cursor):
+    try:
+        value, post_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        value = datetime.fromisoformat(value) if sort == 'new' else int(value)
+        return value, ObjectId(post_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def query_posts_page(sort, before=None, limit=FEED_PAGE_SIZE, projection=None):
+    """One page of the feed, keyset-paginated on (sort field, _id) descending"""
+    field = FEED_SORT_FIELDS[sort]
+    query = {}
+    if before:
+        value, post_id = decode_feed_cursor(sort, before)
+        query = {"$or": [{field: {"$lt": value}}, {field: value, "_id": {"$lt": post_id}}]}
+    
+    # The sort key is always fetched so the next cursor can be built
+    if projection is not None:
+        projection = dict(projection, **{field: 1})
+    
+    # ObjectIds and datetimes are left for the JSON provider to encode
+    cursor = db.community_posts.find(query, projection).sort([(field, -1), ("_id", -1)]).limit(limit)
+    posts = [public_doc(post) for post in cursor]
+    
+    return {
+        'posts': posts,
+        'next_cursor': encode_feed_cursor(sort, posts[-1]) if posts and len(posts) == limit else None
+    }
+
+def demo_posts():
+    """Demo community posts around Pune"""
+    posts = [
+        {"username": "demo_user", "title": "Greenest Route of the Week", "content": "FC Road morning route has perfect AQI and low traffic!", "location": "FC Road, Pune", "geo": geo_point(18.5236, 73.8412), "post_type": "eco_route", "upvotes": random.randint(5, 50)},
+        {"username": "eco_warrior", "title": "Avoid FC Road at 6 PM", "content": "Heavy traffic and pollution during evening rush hour", "location": "FC Road, Pune", "geo": geo_point(18.5196, 73.8410), "post_type": "alert", "upvotes": random.randint(5, 50)},
+        {"username": "green_citizen", "title": "Top Eco-Zone Discovery", "content": "Koregaon Park early morning is the best for walks!", "location": "Koregaon Park, Pune", "geo": geo_point(18.5362, 73.8937), "post_type": "eco_zone", "upvotes": random.randint(5, 50)}
+    ]
+    
+    for post_data in posts:
+        post_data['created_at'] = datetime.now()
+    return posts
+
+def seed_demo_posts():
+    """Seed demo posts into an empty community feed"""
+    db.community_posts.insert_many(demo_posts())
+
+def index_demo_posts():
+    """Offline mode: make the demo posts findable through /api/community/nearby"""
+    for i, post in enumerate(demo_posts(), start=1):
+        post['id'] = str(i)
+        lon, lat = post['geo']['coordinates']
+        post_index.insert(post['id'], lat, lon, post)
 
 @app.route('/api/community/posts')
 def get_community_posts():
-    """Get community posts"""
-    if not db:
+    """Get a page of community posts (?sort=new|top&before=<cursor>&limit=&fields=)"""
+    if db is None:
         # Fallback demo data
         return jsonify({
             'posts': [
@@ -534,38 +1273,31 @@ def get_community_posts():
             ]
         })
     
-    posts_cursor = db.community_posts.find().sort("created_at", -1).limit(20)
-    posts = []
-    for post in posts_cursor:
-        post['id'] = str(post['_id'])
-        if 'user_id' in post and isinstance(post['user_id'], ObjectId):
-            post['user_id'] = str(post['user_id'])
-        del post['_id']
-        posts.append(post)
-    
-    if not posts:
-        # Seed demo posts
-        demo_posts = [
-            {"username": "demo_user", "title": "Greenest Route of the Week", "content": "FC Road morning route has perfect AQI and low traffic!", "location": "FC Road, Pune", "post_type": "eco_route", "upvotes": random.randint(5, 50)},
-            {"username": "eco_warrior", "title": "Avoid FC Road at 6 PM", "content": "Heavy traffic and pollution during evening rush hour", "location": "FC Road, Pune", "post_type": "alert", "upvotes": random.randint(5, 50)},
-            {"username": "green_citizen", "title": "Top Eco-Zone Discovery", "content": "Koregaon Park early morning is the best for walks!", "location": "Koregaon Park, Pune", "post_type": "eco_zone", "upvotes": random.randint(5, 50)}
-        ]
-        
-        for post_data in demo_posts:
-            post_data['created_at'] = datetime.now()
-            db.community_posts.insert_one(post_data)
-        
-        # Fetch again
-        posts_cursor = db.community_posts.find().sort("created_at", -1).limit(20)
-        posts = []
-        for post in posts_cursor:
-            post['id'] = str(post['_id'])
-            if 'user_id' in post and isinstance(post['user_id'], ObjectId):
-                post['user_id'] = str(post['user_id'])
-            del post['_id']
-            posts.append(post)
-    
-    return jsonify({'posts': posts})
+    sort = request.args.get('sort', 'new')
+    if sort not in FEED_SORT_FIELDS:
+        return jsonify({'error': f"sort must be one of {', '.join(FEED_SORT_FIELDS)}"}), 400
+    before = request.args.get('before')
+    limit = min(max(request.args.get('limit', FEED_PAGE_SIZE, type=int), 1), FEED_MAX_PAGE_SIZE)
+    fields = request.args.get('fields')
+    projection = {field: 1 for field in fields.split(',') if field in POST_FIELDS} if fields else None
+    
+    cache_key = (sort, before, limit, fields)
+    cached = feed_cache.get(cache_key) if FEED_CACHE_TTL else None
+    if cached is not None:
+        return jsonify(cached)
+    
+    try:
+        page = query_posts_page(sort, before, limit, projection)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not page['posts'] and not before and db.community_posts.estimated_document_count() == 0:
+        seed_demo_posts()
+        page = query_posts_page(sort, before, limit, projection)
+    
+    if FEED_CACHE_TTL:
+        feed_cache.set(cache_key, page, FEED_CACHE_TTL)
+    return jsonify(page)
 
 @app.route('/api/community/post', methods=['POST'])
 def create_post():
@@ -573,10 +1305,10 @@ def create_post():
     data = request.json
     user = get_or_create_user()
     
-    if not db:
+    if db is None:
         return jsonify({'error': 'Database not available'}), 500
     
-    user_id = ObjectId(user['id']) if isinstance(user['id'], str) and len(user['id']) == 24 else user.get('_id')
+    user_id = user_object_id(user)
     
     post_data = {
         "user_id": user_id,
@@ -589,19 +1321,140 @@ def create_post():
         "created_at": datetime.now()
     }
     
-    result = db.community_posts.insert_one(post_data)
-    post = db.community_posts.find_one({"_id": result.inserted_id})
+    try:
+        if data.get('lat') is not None and data.get('lon') is not None:
+            lat, lon = float(data['lat']), float(data['lon'])
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                raise ValueError
+            post_data['geo'] = geo_point(lat, lon)
+    except (ValueError, TypeError):
+        return jsonify({'error': 'lat/lon must be valid coordinates'}), 400
     
-    post['id'] = str(post['_id'])
-    post['user_id'] = str(post['user_id'])
-    del post['_id']
+    result = db.community_posts.insert_one(post_data)
+    feed_cache.clear()
+    event_bus.publish('feed_changed', {})
+    post = public_doc(db.community_posts.find_one({"_id": result.inserted_id}))
     
     return jsonify({'post': post})
 
+def nearby_posts(lat, lon, radius_km, limit):
+    """Posts within radius_km of a point, nearest first, via the 2dsphere index"""
+    pipeline = [
+        {"$geoNear": {
+            "near": geo_point(lat, lon),
+            "key": "geo",
+            "distanceField": "distance_m",
+            "maxDistance": radius_km * 1000,
+            "spherical": True
+        }},
+        {"$limit": limit},
+        {"$set": {"distance_km": {"$round": [{"$divide": ["$distance_m", 1000]}, 3]}}},
+        {"$unset": "distance_m"}
+    ]
+    return [public_doc(post) for post in db.community_posts.aggregate(pipeline)]
+
+def nearby_pois(lat, lon, radius_km, limit):
+    """Distinct POIs recorded in location_analytics within radius_km of a point, nearest first"""
+    pipeline = [
+        {"$geoNear": {
+            "near": geo_point(lat, lon),
+            "key": "geo",
+            "distanceField": "distance_m",
+            "maxDistance": radius_km * 1000,
+            "spherical": True
+        }},
+        # Each POI is stored once per analysis that saw it
+        {"$group": {
+            "_id": {"name": "$name", "lat": "$lat", "lon": "$lon"},
+            "category": {"$first": "$category"},
+            "distance_m": {"$min": "$distance_m"}
+        }},
+        {"$sort": {"distance_m": 1}},
+        {"$limit": limit}
+    ]
+    return [
+        dict(poi['_id'], category=poi.get('category'), distance_km=round(poi['distance_m'] / 1000, 3))
+        for poi in db.location_analytics.aggregate(pipeline)
+    ]
+
+@app.route('/api/community/nearby')
+def community_nearby():
+    """Posts and POIs near a point in distance order (?lat=&lon=&radius=<km>&limit=)"""
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    if lat is None or lon is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return jsonify({'error': 'lat and lon are required'}), 400
+    radius_km = min(max(request.args.get('radius', NEARBY_RADIUS_KM, type=float), 0.0), NEARBY_MAX_RADIUS_KM)
+    limit = min(max(request.args.get('limit', FEED_PAGE_SIZE, type=int), 1), FEED_MAX_PAGE_SIZE)
+    
+    if db is None:
+        if not len(post_index):
+            index_demo_posts()
+        posts = [dict(post, distance_km=round(d, 3)) for d, post in post_index.nearby(lat, lon, radius_km, limit)]
+    else:
+        posts = nearby_posts(lat, lon, radius_km, limit)
+    
+    if db is None or not TOMTOM_API_KEY:
+        pois = [dict(poi, distance_km=round(d, 3)) for d, poi in poi_index.nearby(lat, lon, radius_km, limit)]
+    else:
+        pois = nearby_pois(lat, lon, radius_km, limit)
+    
+    return jsonify({'radius_km': radius_km, 'posts': posts, 'pois': pois})
+
+def box_polygon(south, west, north, east):
+    """GeoJSON Polygon of a bounding box, for $geoWithin queries"""
+    ring = [[west, south], [east, south], [east, north], [west, north], [west, south]]
+    return {'type': 'Polygon', 'coordinates': [ring]}
+
+def map_layer_points(south, west, north, east):
+    """Post and POI coordinates inside a bounding box as (N, 2) lat/lon arrays"""
+    if db is None:
+        if not len(post_index):
+            index_demo_posts()
+        posts = post_index.points_in_box(south, west, north, east)
+    else:
+        within = {'geo': {'$geoWithin': {'$geometry': box_polygon(south, west, north, east)}}}
+        posts = np.array([post['geo']['coordinates'][::-1] for post in db.community_posts.find(within, {'geo': 1, '_id': 0})], dtype=np.float64).reshape(-1, 2)
+    
+    if db is None or not TOMTOM_API_KEY:
+        pois = poi_index.points_in_box(south, west, north, east)
+    else:
+        pipeline = [
+            {"$match": {'geo': {'$geoWithin': {'$geometry': box_polygon(south, west, north, east)}}}},
+            # Each POI is stored once per analysis that saw it
+            {"$group": {"_id": {"name": "$name", "lat": "$lat", "lon": "$lon"}}}
+        ]
+        pois = np.array([(poi['_id']['lat'], poi['_id']['lon']) for poi in db.location_analytics.aggregate(pipeline)], dtype=np.float64).reshape(-1, 2)
+    
+    return {'posts': posts, 'pois': pois}
+
+@app.route('/api/map/layer')
+def map_layer():
+    """Aggregated clusters and heat cells for a map view (?bbox=west,south,east,north&zoom=&shape=grid|hex)"""
+    try:
+        west, south, east, north = (float(v) for v in request.args.get('bbox', '').split(','))
+    except ValueError:
+        return jsonify({'error': 'bbox must be west,south,east,north'}), 400
+    if not (-180 <= west < east <= 180 and -90 <= south < north <= 90):
+        return jsonify({'error': 'bbox must be west,south,east,north with west < east and south < north'}), 400
+    zoom = min(max(request.args.get('zoom', 13, type=int), 0), MAP_LAYER_MAX_ZOOM)
+    shape = request.args.get('shape', 'grid')
+    if shape not in MAP_LAYER_SHAPES:
+        return jsonify({'error': f"shape must be one of {', '.join(MAP_LAYER_SHAPES)}"}), 400
+    
+    try:
+        layer = map_layers.layer((west, south, east, north), zoom, shape)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    response = jsonify(layer)
+    response.headers['Cache-Control'] = f'public, max-age={MAP_LAYER_TIME_BUCKET}'
+    return response
+
 @app.route('/api/community/upvote/<post_id>', methods=['POST'])
 def upvote_post(post_id):
     """Upvote a community post"""
-    if not db:
+    if db is None:
         return jsonify({'success': False, 'error': 'Database not available'}), 500
     
     try:
@@ -612,6 +1465,8 @@ def upvote_post(post_id):
         )
         
         if result.modified_count > 0:
+            feed_cache.clear()
+            event_bus.publish('feed_changed', {})
             return jsonify({'success': True})
         else:
             return jsonify({'success': False, 'error': 'Post not found'}), 404
@@ -621,7 +1476,7 @@ def upvote_post(post_id):
 @app.route('/api/leaderboard')
 def leaderboard():
     """Get leaderboard data"""
-    if not db:
+    if db is None:
         # Fallback demo data
         return jsonify({
             'leaderboard': [
@@ -629,19 +1484,110 @@ def leaderboard():
             ]
         })
     
-    leaders_cursor = db.users.find(
-        {},
-        {"username": 1, "eco_points": 1, "green_score": 1, "co2_saved": 1, "streak_days": 1}
-    ).sort("eco_points", -1).limit(10)
+    leaderboard_service.ensure_fresh(db.users)
+    return jsonify({'leaderboard': leaderboard_service.top(LEADERBOARD_SIZE)})
+
+@app.route('/api/leaderboard/rank/<username>')
+def leaderboard_rank(username):
+    """Get a user's position on the leaderboard"""
+    if db is None:
+        return jsonify({'error': 'Database not available'}), 500
+    
+    leaderboard_service.ensure_fresh(db.users)
+    standing = leaderboard_service.rank(username)
+    if standing is None:
+        return jsonify({'error': 'User not found'}), 404
+    rank, entry = standing
     
-    leaders = []
-    for leader in leaders_cursor:
-        leader['id'] = str(leader['_id'])
-        del leader['_id']
-        leaders.append(leader)
+    return jsonify({
+        'username': username,
+        'rank': rank,
+        'eco_points': entry['eco_points'],
+        'total_users': len(leaderboard_service)
+    })
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    """Get TomTom cache hit/miss counters"""
+    return jsonify({
+        'tomtom': tomtom_cache.stats(),
+        'insight': {'entries': len(insight_cache), 'coalesced': insight_flight.coalesced},
+        'chatbot': {'entries': len(chat_cache), 'coalesced': chat_flight.coalesced},
+        'map_layers': map_layers.stats()
+    })
+
+@app.route('/api/forecast/stats')
+def forecast_stats():
+    """Get traffic forecast coverage and training progress"""
+    return jsonify({'traffic': traffic_model.stats(), 'metrics': metric_store.stats()})
+
+@app.route('/api/queue/stats')
+def queue_stats():
+    """Get trip write-behind queue depth and flush counters"""
+    return jsonify({'trips': trip_writer.stats() if trip_writer else None})
+
+@app.route('/api/live/stats')
+def live_stats():
+    """Get live dashboard stream subscriber and publish counters"""
+    return jsonify(dict(live_hub.stats(), event_bus=event_bus.stats()))
+
+@app.route('/api/upstream/stats')
+def upstream_stats_view():
+    """Get circuit state and latency histograms for outbound API clients"""
+    return jsonify(upstream_stats())
+
+@app.route('/healthz')
+def healthz():
+    """Liveness of this worker process, with its memory split into shared and private pages"""
+    return jsonify({
+        'status': 'ok',
+        'pid': os.getpid(),
+        'uptime_s': round(time.time() - _worker_started, 1),
+        'memory': process_memory(),
+        'shared': shared_stats()
+    })
+
+@app.route('/readyz')
+def readyz():
+    """Readiness of this worker: models loaded and its own connections opened"""
+    ready = _warmed and _connected
+    return jsonify({
+        'ready': ready,
+        'pid': os.getpid(),
+        'checks': {
+            'warmed': _warmed,
+            'connected': _connected,
+            'zone_model': zone_index.ready,
+            'traffic_model': traffic_model.ready,
+            'route_graph': route_graph is not None,
+            'mongo': db is not None
+        }
+    }), 200 if ready else 503
+
+@app.route('/metrics')
+def metrics_view():
+    """Prometheus metrics: per-route latency, per-stage timers and upstream health, summed over the workers"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/profiler', methods=['GET', 'POST'])
+def profiler_toggle():
+    """Show or switch the slow-request sampling profiler (POST {"enabled": bool, "threshold_ms": n})"""
+    if request.method == 'POST':
+        if not PROFILER_TOKEN or request.headers.get('X-Profiler-Token') != PROFILER_TOKEN:
+            return jsonify({'error': 'Profiler toggle requires PROFILER_TOKEN'}), 403
+        data = request.get_json(silent=True) or {}
+        try:
+            threshold_ms = float(data['threshold_ms']) if data.get('threshold_ms') is not None else None
+        except (ValueError, TypeError):
+            return jsonify({'error': 'threshold_ms must be a number'}), 400
+        if data.get('enabled', True):
+            profiler.enable(threshold_ms)
+        else:
+            profiler.disable()
     
-    return jsonify({'leaderboard': leaders})
+    return jsonify(profiler.stats())
 
 if __name__ == '__main__':
+    warm_up()
     init_db()
     app.run(host='0.0.0.0', port=5000, debug=True)
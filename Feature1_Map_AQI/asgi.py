@@ -0,0 +1,182 @@
+# ASGI entry point: uvicorn asgi:application --host 0.0.0.0 --port 5000
+import asyncio
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import (
+    app as flask_app,
+    TOMTOM_API_KEY, OPENAI_API_KEY, OPENAI_CHAT_URL,
+    tomtom_cache, search_key, GEO_CACHE_SEARCH_TTL,
+    tomtom_search_request, mock_tomtom_search,
+    openai_headers, insight_request_body, generate_mock_insight,
+    insight_cache, insight_cache_key, INSIGHT_CACHE_TTL,
+    pois_to_locations, location_metrics,
+    analyze_location_patterns_ml, generate_traffic_pattern, warm_up
+)
+from http_client import tomtom_async, openai_async
+from instrumentation import begin_request, end_request, server_timing, timed
+from single_flight import AsyncSingleFlight
+
+insight_flight = AsyncSingleFlight()
+
+
+@timed('tomtom_search')
+async def get_tomtom_search_async(query, lat=None, lon=None):
+    """Async TomTom POI search sharing the sync path's cache and circuit breaker"""
+    if not TOMTOM_API_KEY:
+        return mock_tomtom_search(query, lat, lon)
+
+    cache_key = search_key(query, lat, lon)
+    cached = tomtom_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    url, params = tomtom_search_request(query, lat, lon)
+
+    try:
+        response = await tomtom_async.get(url, params=params, timeout=5)
+        if response.status_code == 200:
+            results = response.json().get('results', [])
+            tomtom_cache.set(cache_key, results, GEO_CACHE_SEARCH_TTL)
+            return results
+    except Exception as e:
+        print(f"TomTom API error: {e}")
+
+    return mock_tomtom_search(query, lat, lon)
+
+
+async def fetch_ai_insight_async(cache_key, location_data, context):
+    try:
+        response = await openai_async.post(
+            OPENAI_CHAT_URL,
+            headers=openai_headers(),
+            json=insight_request_body(location_data, context),
+            timeout=10
+        )
+        if response.status_code == 200:
+            insight = response.json()['choices'][0]['message']['content'].strip()
+            insight_cache.set(cache_key, insight, INSIGHT_CACHE_TTL)
+            return insight
+    except Exception as e:
+        print(f"OpenAI API error: {e}")
+
+    return None
+
+
+@timed('ai_insight')
+async def get_ai_insight_async(location_data, context='general'):
+    """Async OpenAI insight with the same prompt, cache and fallback as get_ai_insight"""
+    if not OPENAI_API_KEY:
+        return generate_mock_insight(location_data, context)
+
+    cache_key = insight_cache_key(location_data, context)
+    insight = insight_cache.get(cache_key)
+    if insight is None:
+        insight = await insight_flight.do(
+            cache_key, lambda: fetch_ai_insight_async(cache_key, location_data, context)
+        )
+
+    return insight or generate_mock_insight(location_data, context)
+
+
+async def analyze_location(data):
+    """Async /api/location/analyze: POI search and AI insight run concurrently"""
+    lat = data.get('lat', 18.5204)
+    lon = data.get('lon', 73.8567)
+    query = data.get('query', 'points of interest')
+
+    # The insight only depends on the traffic pattern and metrics, not on the POIs
+    traffic_pattern = generate_traffic_pattern(lat, lon)
+    location_data = location_metrics(lat, lon, traffic_pattern)
+
+    pois, insight = await asyncio.gather(
+        get_tomtom_search_async(query, lat, lon),
+        get_ai_insight_async(location_data, 'location_analysis')
+    )
+
+    locations_data = pois_to_locations(pois, lat, lon)
+    analyzed = await asyncio.to_thread(analyze_location_patterns_ml, locations_data)
+
+    return 200, {
+        'locations': analyzed or locations_data,
+        'traffic_pattern': traffic_pattern,
+        'metrics': location_data,
+        'insight': insight
+    }
+
+
+ASYNC_ROUTES = {
+    ('POST', '/api/location/analyze'): analyze_location,
+}
+
+
+async def read_json_body(receive):
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return flask_app.json.loads(body or b'{}')
+
+
+async def send_json(send, status, payload, headers=()):
+    body = flask_app.json.encode(payload)
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode('ascii')),
+            *headers
+        ]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class Application:
+    """Dispatches async routes natively and falls back to the WSGI app in a thread"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi = WsgiToAsgi(wsgi_app)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # Models and pools are loaded before uvicorn reports the worker ready
+                await asyncio.to_thread(warm_up)
+                await tomtom_async.start()
+                await openai_async.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await tomtom_async.close()
+                await openai_async.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        handler = ASYNC_ROUTES.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+        if handler is None:
+            return await self.wsgi(scope, receive, send)
+
+        timer = begin_request(profile=False)
+        try:
+            data = await read_json_body(receive)
+        except ValueError:
+            status, payload = 400, {'error': 'Invalid JSON body'}
+        else:
+            try:
+                status, payload = await handler(data)
+            except Exception:
+                end_request(timer, scope['method'], scope['path'], 500)
+                raise
+
+        seconds, stages = end_request(timer, scope['method'], scope['path'], status)
+        await send_json(send, status, payload, [(b'server-timing', server_timing(seconds, stages).encode('ascii'))])
+
+
+application = Application(flask_app)
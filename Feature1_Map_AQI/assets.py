@@ -0,0 +1,187 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+
+ASSET_URL_PREFIX = os.getenv('ASSET_URL_PREFIX', '/assets')
+ASSET_MAX_AGE = int(os.getenv('ASSET_MAX_AGE', 365 * 86400))
+ASSET_MIN_COMPRESS_BYTES = 512
+
+# Types worth compressing; images and fonts are already compressed
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+
+def content_hash(body):
+    return hashlib.sha256(body).hexdigest()[:12]
+
+
+def compress(body, mimetype):
+    """Pre-compressed variants of a body keyed by content coding; brotli needs the optional brotli package"""
+    variants = {'identity': body}
+    if len(body) < ASSET_MIN_COMPRESS_BYTES or not mimetype.startswith(COMPRESSIBLE_TYPES):
+        return variants
+
+    gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+    if len(gzipped) < len(body):
+        variants['gzip'] = gzipped
+    try:
+        import brotli
+
+        compressed = brotli.compress(body, quality=11)
+        if len(compressed) < len(body):
+            variants['br'] = compressed
+    except ImportError:
+        pass
+    return variants
+
+
+def accepted_encodings(header):
+    """Content codings a client accepts (q > 0) from its Accept-Encoding header"""
+    accepted = set()
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if coding and q > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class CompressedBody:
+    """A response body held with its pre-compressed variants and an ETag"""
+
+    def __init__(self, body, mimetype):
+        self.mimetype = mimetype
+        self.etag = content_hash(body)
+        self.variants = compress(body, mimetype)
+
+    def negotiate(self, accept_encoding):
+        """Smallest variant the client accepts"""
+        accepted = accepted_encodings(accept_encoding)
+        for coding in ('br', 'gzip'):
+            if coding in self.variants and (coding in accepted or '*' in accepted):
+                return coding
+        return 'identity'
+
+    def response(self, request, cache_control):
+        """Flask response for a request: 304 on a matching ETag, otherwise the best variant"""
+        from flask import Response
+
+        coding = self.negotiate(request.headers.get('Accept-Encoding'))
+        # Each coding gets its own strong ETag since the bytes differ
+        etag = self.etag if coding == 'identity' else f'{self.etag}-{coding}'
+        headers = {'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+
+        if any(request.if_none_match.contains(self.etag if c == 'identity' else f'{self.etag}-{c}') for c in self.variants):
+            response = Response(status=304, headers=headers)
+        else:
+            response = Response(self.variants[coding], mimetype=self.mimetype, headers=headers)
+            if coding != 'identity':
+                response.headers['Content-Encoding'] = coding
+        response.set_etag(etag)
+        return response
+
+    def stats(self):
+        return {coding: len(body) for coding, body in self.variants.items()}
+
+
+class AssetPipeline:
+    """Content-hashed, pre-compressed copies of everything under the static folder.
+
+    Each file is served from ASSET_URL_PREFIX under a name carrying its
+    content hash (css/style.3f2a9c1b7e4d.css), so it can be cached as
+    immutable; a changed file gets a new URL. The build can also be written
+    to disk for a CDN or reverse proxy with `python assets.py`.
+    """
+
+    def __init__(self, static_dir, url_prefix=ASSET_URL_PREFIX):
+        self.static_dir = static_dir
+        self.url_prefix = url_prefix
+        self.manifest = {}
+        self.files = {}
+        self._lock = threading.Lock()
+
+    def build(self):
+        manifest, files = {}, {}
+        for root, _, names in os.walk(self.static_dir):
+            for name in sorted(names):
+                path = os.path.join(root, name)
+                logical = os.path.relpath(path, self.static_dir).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    body = f.read()
+                if not body:
+                    continue
+                mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                asset = CompressedBody(body, mimetype)
+                stem, ext = os.path.splitext(logical)
+                hashed = f'{stem}.{asset.etag}{ext}'
+                manifest[logical] = hashed
+                files[hashed] = asset
+        with self._lock:
+            self.manifest, self.files = manifest, files
+        return self
+
+    def url(self, logical):
+        """Hashed URL for a static file, falling back to /static/ for files not in the build"""
+        hashed = self.manifest.get(logical)
+        return f'{self.url_prefix}/{hashed}' if hashed else f'/static/{logical}'
+
+    def response(self, hashed, request):
+        """Response for a hashed asset name, or None if it is not in the build"""
+        asset = self.files.get(hashed)
+        if asset is None:
+            return None
+        return asset.response(request, f'public, max-age={ASSET_MAX_AGE}, immutable')
+
+    def write(self, out_dir):
+        """Write hashed files, their .gz/.br siblings and manifest.json to out_dir"""
+        suffixes = {'identity': '', 'gzip': '.gz', 'br': '.br'}
+        for hashed, asset in self.files.items():
+            path = os.path.join(out_dir, hashed)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            for coding, body in asset.variants.items():
+                with open(path + suffixes[coding], 'wb') as f:
+                    f.write(body)
+        with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+
+    def stats(self):
+        return {hashed: asset.stats() for hashed, asset in self.files.items()}
+
+
+class PageCache:
+    """Rendered pages kept as CompressedBody per key (the config the page depends on)"""
+
+    def __init__(self):
+        self.pages = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, render, mimetype='text/html; charset=utf-8'):
+        page = self.pages.get(key)
+        if page is None:
+            body = render().encode('utf-8')
+            with self._lock:
+                page = self.pages.setdefault(key, CompressedBody(body, mimetype))
+        return page
+
+    def clear(self):
+        with self._lock:
+            self.pages.clear()
+
+
+if __name__ == '__main__':
+    import sys
+
+    static_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    out_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(static_dir, os.pardir, 'build', 'assets')
+    pipeline = AssetPipeline(static_dir).build()
+    pipeline.write(out_dir)
+    for hashed, sizes in sorted(pipeline.stats().items()):
+        print(f"{hashed:<40} " + '  '.join(f"{coding} {size}" for coding, size in sizes.items()))
+    print(f"Wrote {len(pipeline.files)} assets to {os.path.normpath(out_dir)}")
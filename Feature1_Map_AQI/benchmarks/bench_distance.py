@@ -0,0 +1,65 @@
+"""Compare the NumPy distance kernels against geopy's geodesic for speed and accuracy.
+
+Run from Feature1_Map_AQI/: python benchmarks/bench_distance.py [n_points]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+from geopy.distance import geodesic
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from distance import distance_km, pairwise_km, distance_matrix_km  # noqa: E402
+
+
+def random_points(n, rng, center=(18.5204, 73.8567), spread=0.5):
+    return np.column_stack([
+        center[0] + rng.uniform(-spread, spread, n),
+        center[1] + rng.uniform(-spread, spread, n)
+    ])
+
+
+def timed(fn, repeat=3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(n=20000):
+    rng = np.random.default_rng(42)
+    a = random_points(n, rng)
+    b = random_points(n, rng)
+
+    geopy_time, reference = timed(
+        lambda: np.array([geodesic(tuple(p), tuple(q)).km for p, q in zip(a, b)]), repeat=1
+    )
+    print(f"{n} pairs")
+    print(f"  geopy geodesic loop     {geopy_time * 1000:9.1f} ms")
+
+    for mode in ('haversine', 'ellipsoidal'):
+        elapsed, result = timed(lambda: pairwise_km(a, b, mode=mode))
+        error = np.abs(result - reference)
+        print(f"  {mode:<11} pairwise    {elapsed * 1000:9.1f} ms  "
+              f"speedup {geopy_time / elapsed:7.0f}x  "
+              f"max err {error.max() * 1000:8.3f} m  mean err {error.mean() * 1000:8.3f} m")
+
+    p, q = a[0], b[0]
+    scalar_geopy, _ = timed(lambda: [geodesic(tuple(p), tuple(q)).km for _ in range(1000)])
+    scalar_ours, _ = timed(lambda: [distance_km(p[0], p[1], q[0], q[1]) for _ in range(1000)])
+    print(f"  scalar x1000: geopy {scalar_geopy * 1000:.1f} ms, ellipsoidal {scalar_ours * 1000:.1f} ms")
+
+    m = min(n, 2000)
+    elapsed, matrix = timed(lambda: distance_matrix_km(a[:m], b[:m], mode='haversine'))
+    print(f"  {m}x{m} haversine matrix {elapsed * 1000:9.1f} ms")
+    elapsed, matrix = timed(lambda: distance_matrix_km(a[:m], b[:m], mode='ellipsoidal'))
+    print(f"  {m}x{m} ellipsoidal matrix {elapsed * 1000:7.1f} ms")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,64 @@
+"""Time fitting the traffic forecast and answering single and batched forecasts.
+
+Run from Feature1_Map_AQI/: python benchmarks/bench_forecast.py [n_samples]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geo_cache import geohash  # noqa: E402
+from traffic_forecast import TrafficForecaster, hour_of_week  # noqa: E402
+
+
+def synthetic_samples(n, rng, center=(18.5204, 73.8567), spread=0.1, days=14):
+    lats = center[0] + rng.uniform(-spread, spread, n)
+    lons = center[1] + rng.uniform(-spread, spread, n)
+    ts = time.time() - rng.uniform(0, days * 86400, n)
+    hours = hour_of_week(ts) % 24
+    # Morning and evening rush on top of a quiet baseline
+    levels = 25 + 45 * np.exp(-((hours - 8.5) ** 2) / 3) + 55 * np.exp(-((hours - 18.5) ** 2) / 4)
+    return pd.DataFrame({
+        'tile': [geohash(lat, lon, 6) for lat, lon in zip(lats, lons)],
+        'ts': pd.to_datetime(ts, unit='s', utc=True),
+        'traffic_level': np.clip(levels + rng.normal(0, 8, n), 0, 100)
+    })
+
+
+def timed(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(n=500000):
+    rng = np.random.default_rng(42)
+    samples = synthetic_samples(n, rng)
+    forecaster = TrafficForecaster(path=os.devnull)
+
+    fit_time = timed(lambda: forecaster.fit(samples), repeat=1)
+    half = n // 2
+    incremental = TrafficForecaster(path=os.devnull)
+    incremental.fit(samples.iloc[:half])
+    refresh_time = timed(lambda: incremental.fit(samples.iloc[half:], incremental=True), repeat=1)
+    print(f"fit {n} samples: {fit_time:.2f}s  ({forecaster.stats()['tiles']} tiles)")
+    print(f"incremental fit of {n - half} samples: {refresh_time:.2f}s")
+
+    single = timed(lambda: [forecaster.forecast(18.5204, 73.8567) for _ in range(10000)]) / 10000
+    print(f"single forecast: {single * 1e6:.1f} us")
+
+    for batch in (1000, 100000):
+        points = rng.uniform(-0.1, 0.1, (batch, 2)) + [18.5204, 73.8567]
+        elapsed = timed(lambda: forecaster.predict(points[:, 0], points[:, 1]))
+        print(f"batch of {batch}: {elapsed * 1000:.2f} ms ({elapsed / batch * 1e6:.2f} us/point)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500000)
@@ -0,0 +1,136 @@
+"""Micro-benchmarks for the clustering, distance, map aggregation and serialization hot paths, with a regression check.
+
+Run from Feature1_Map_AQI/:
+    python benchmarks/bench_hotpaths.py                       # print timings
+    python benchmarks/bench_hotpaths.py --save baseline.json  # record a baseline
+    python benchmarks/bench_hotpaths.py --check baseline.json # exit 1 if any path got slower than the tolerance
+
+The app is imported against mongomock (see fakes.py); nothing here touches the network.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import boot_app  # noqa: E402
+
+
+def best_of(fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def random_points(n, rng, center=(18.5204, 73.8567), spread=0.2):
+    return np.column_stack([center[0] + rng.uniform(-spread, spread, n), center[1] + rng.uniform(-spread, spread, n)])
+
+
+def cases(app, rng):
+    """name -> zero-argument callable timing one hot path"""
+    from distance import distance_matrix_km, pairwise_km
+    from map_layers import MapLayers
+    from zone_model import fit_zone_model
+
+    coords = random_points(100000, rng)
+    other = random_points(100000, rng)
+    model = fit_zone_model(coords[:20000])[0]
+    pois = [{'lat': lat, 'lon': lon, 'name': f'POI {i}', 'category': 'Park'} for i, (lat, lon) in enumerate(random_points(5, rng))]
+
+    client = app.app.test_client()
+    batch_body = {'points': random_points(20000, rng).tolist()}
+    analyze_payload = {
+        'locations': [dict(poi, cluster=1, zone_type='Calm Zone') for poi in pois],
+        'traffic_pattern': app.generate_traffic_pattern(18.52, 73.85),
+        'metrics': {'aqi': 80, 'noise_level': 60, 'traffic_level': 55},
+        'insight': 'Traffic is moderate in your zone, AQI is healthy — best time for an evening walk!'
+    }
+    page = {'posts': [dict(post, id=str(i)) for i, post in enumerate(app.demo_posts() * 7)], 'next_cursor': 'abc'}
+
+    def kmeans_fallback():
+        zone_model, app.zone_index.model = app.zone_index.model, None
+        try:
+            app.analyze_location_patterns_ml([dict(poi) for poi in pois])
+        finally:
+            app.zone_index.model = zone_model
+
+    layer_points = random_points(50000, rng)
+    layer_heat = random_points(2000, rng)
+    map_layers = MapLayers(
+        lambda *box: {'pois': layer_points},
+        lambda: (layer_heat, np.ones((2000, 3), dtype=np.int64), np.full((2000, 3), 80.0))
+    )
+
+    def aggregate_map_layer():
+        map_layers.cache.clear()
+        map_layers.layer((73.6567, 18.3204, 74.0567, 18.7204), 12, 'hex')
+
+    def dumps(payload, times=200):
+        with app.app.app_context():
+            for _ in range(times):
+                app.app.json.dumps(payload)
+
+    return {
+        'cluster.fit_zone_model_20k': lambda: fit_zone_model(coords[:20000]),
+        'cluster.predict_100k': lambda: model.predict(coords),
+        'cluster.request_kmeans_5': kmeans_fallback,
+        'distance.haversine_100k': lambda: pairwise_km(coords, other, mode='haversine'),
+        'distance.ellipsoidal_100k': lambda: pairwise_km(coords, other, mode='ellipsoidal'),
+        'distance.matrix_1000x1000': lambda: distance_matrix_km(coords[:1000], other[:1000], mode='haversine'),
+        'aggregate.map_layer_hex_50k': aggregate_map_layer,
+        'serialize.analyze_response_x200': lambda: dumps(analyze_payload),
+        'serialize.feed_page_x200': lambda: dumps(page),
+        'serialize.sse_frames_x1000': lambda: [app.sse_event({'delta': 'word '}) for _ in range(1000)],
+        'serialize.batch_analyze_20k': lambda: client.post('/api/location/analyze/batch', json=batch_body).get_data(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--save', help='write timings to this JSON file')
+    parser.add_argument('--check', help='compare against timings in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown before --check fails (0.25 = 25%%)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = boot_app()
+    results = {}
+    for name, fn in cases(app, np.random.default_rng(42)).items():
+        fn()  # warm caches and lazy imports
+        results[name] = best_of(fn, args.repeat)
+
+    baseline = {}
+    if args.check:
+        with open(args.check) as f:
+            baseline = json.load(f)
+
+    regressions = []
+    print(f"{'hot path':<34} {'best ms':>10} {'baseline':>10} {'change':>8}")
+    for name, seconds in results.items():
+        line = f"{name:<34} {seconds * 1000:>10.2f}"
+        if name in baseline:
+            change = seconds / baseline[name] - 1
+            line += f" {baseline[name] * 1000:>10.2f} {change:>+8.0%}"
+            if change > args.tolerance:
+                regressions.append(name)
+                line += '  REGRESSION'
+        print(line)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.save}")
+    if regressions:
+        print(f"{len(regressions)} hot path(s) slower than baseline by more than {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
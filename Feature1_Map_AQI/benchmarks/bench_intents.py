@@ -0,0 +1,78 @@
+"""Compare the compiled intent engine against the naive any()-per-rule keyword scan.
+
+Run from Feature1_Map_AQI/: python benchmarks/bench_intents.py [n_messages]
+"""
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_engine import IntentEngine  # noqa: E402
+
+
+def random_word(rng, length):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def synthetic_rules(n_rules, rng, keywords_per_rule=4):
+    return [
+        {
+            'name': f'intent_{i}',
+            'keywords': [random_word(rng, rng.randint(4, 9)) for _ in range(keywords_per_rule)],
+            'response': f'response {i}'
+        }
+        for i in range(n_rules)
+    ]
+
+
+def synthetic_messages(n, rules, rng, words=12):
+    vocabulary = [keyword for rule in rules for keyword in rule['keywords']]
+    messages = []
+    for _ in range(n):
+        tokens = [random_word(rng, rng.randint(3, 8)) for _ in range(words)]
+        # Roughly half the messages contain a real keyword somewhere
+        if rng.random() < 0.5:
+            tokens[rng.randrange(words)] = rng.choice(vocabulary)
+        messages.append(' '.join(tokens))
+    return messages
+
+
+def naive_respond(rules, message):
+    message_lower = message.lower()
+    for rule in rules:
+        if any(keyword in message_lower for keyword in rule['keywords']):
+            return rule['response']
+    return None
+
+
+def timed(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(n_messages=2000):
+    rng = random.Random(42)
+    print(f"{'rules':>6} {'naive ms':>10} {'engine ms':>10} {'speedup':>8}  ({n_messages} messages)")
+    for n_rules in (10, 100, 1000):
+        rules = synthetic_rules(n_rules, rng)
+        messages = synthetic_messages(n_messages, rules, rng)
+
+        start = time.perf_counter()
+        engine = IntentEngine(rules, default_response=None, empty_response=None)
+        compile_time = time.perf_counter() - start
+
+        naive_time = timed(lambda: [naive_respond(rules, m) for m in messages])
+        engine_time = timed(lambda: [engine.respond(m) for m in messages])
+        print(f"{n_rules:>6} {naive_time * 1000:>10.1f} {engine_time * 1000:>10.1f} "
+              f"{naive_time / engine_time:>7.1f}x  (compile {compile_time * 1000:.1f} ms)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,80 @@
+"""Compare Flask's default JSON provider with FastJSONProvider on leaderboard and feed payloads.
+
+Run from Feature1_Map_AQI/: python benchmarks/bench_json.py [n_docs]
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_provider import FastJSONProvider, orjson, public_doc  # noqa: E402
+from leaderboard import Leaderboard  # noqa: E402
+
+
+def feed_docs(n, rng):
+    now = datetime.now()
+    return [{
+        '_id': ObjectId(), 'user_id': ObjectId(), 'username': f'user{i}',
+        'title': 'Avoid FC Road at 6 PM', 'content': 'Heavy traffic and pollution during evening rush hour',
+        'location': 'FC Road, Pune', 'geo': {'type': 'Point', 'coordinates': [73.84 + rng.random() / 10, 18.52 + rng.random() / 10]},
+        'post_type': 'alert', 'upvotes': rng.randint(0, 500), 'created_at': now - timedelta(minutes=i)
+    } for i in range(n)]
+
+
+def legacy_page(docs):
+    """The per-document conversion the feed used before public_doc"""
+    posts = []
+    for doc in docs:
+        post = dict(doc)
+        post['id'] = str(post.pop('_id'))
+        if isinstance(post.get('user_id'), ObjectId):
+            post['user_id'] = str(post['user_id'])
+        posts.append(post)
+    return {'posts': posts, 'next_cursor': None}
+
+
+def best_of(fn, repeat=200):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(n=100):
+    rng = random.Random(42)
+    default_app, fast_app = Flask('default'), Flask('fast')
+    fast_app.json = FastJSONProvider(fast_app)
+    assert isinstance(default_app.json, DefaultJSONProvider)
+
+    board = Leaderboard()
+    for i in range(n):
+        board.upsert({'_id': ObjectId(), 'username': f'user{i}', 'eco_points': rng.randint(0, 5000), 'green_score': rng.randint(0, 100), 'co2_saved': round(rng.random() * 100, 2), 'streak_days': rng.randint(0, 30)})
+    docs = feed_docs(n, rng)
+
+    cases = {
+        f'leaderboard top {n}': (lambda: {'leaderboard': board.top(n)}, lambda: {'leaderboard': board.top(n)}),
+        f'feed page {n}': (lambda: legacy_page(docs), lambda: {'posts': [public_doc(doc) for doc in docs], 'next_cursor': None}),
+    }
+
+    print(f"encoder: {'orjson ' + orjson.__version__ if orjson else 'standard library (orjson not installed)'}")
+    print(f"{'payload':<20} {'default us':>11} {'fast us':>9} {'speedup':>8} {'bytes':>8}")
+    for name, (build_default, build_fast) in cases.items():
+        with default_app.app_context():
+            default_time = best_of(lambda: default_app.json.response(build_default()).get_data())
+        with fast_app.app_context():
+            fast_time = best_of(lambda: fast_app.json.response(build_fast()).get_data())
+            size = len(fast_app.json.response(build_fast()).get_data())
+        print(f"{name:<20} {default_time * 1e6:>11.0f} {fast_time * 1e6:>9.0f} {default_time / fast_time:>7.1f}x {size:>8}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
@@ -0,0 +1,64 @@
+"""Time single A* routes and batched origin/destination matrices on a synthetic street grid.
+
+Run from Feature1_Map_AQI/: python benchmarks/bench_routing.py [grid_size]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from route_graph import RouteGraph  # noqa: E402
+
+
+def grid_graph(size, rng, origin=(18.45, 73.78), step=0.002):
+    """size x size jittered street grid; every tenth street is an arterial"""
+    rows, cols = np.divmod(np.arange(size * size), size)
+    lat = origin[0] + rows * step + rng.uniform(-3e-4, 3e-4, size * size)
+    lon = origin[1] + cols * step + rng.uniform(-3e-4, 3e-4, size * size)
+
+    ids = np.arange(size * size).reshape(size, size)
+    horizontal = np.column_stack([ids[:, :-1].ravel(), ids[:, 1:].ravel()])
+    vertical = np.column_stack([ids[:-1, :].ravel(), ids[1:, :].ravel()])
+    edges = np.vstack([horizontal, vertical])
+    arterial = (rows[edges[:, 0]] % 10 == 0) | (cols[edges[:, 0]] % 10 == 0)
+    speeds = np.where(arterial, 60.0, 25.0)
+
+    u = np.concatenate([edges[:, 0], edges[:, 1]])
+    v = np.concatenate([edges[:, 1], edges[:, 0]])
+    return RouteGraph.from_edges(lat, lon, u, v, np.concatenate([speeds, speeds]))
+
+
+def random_pairs(graph, n, rng):
+    lo, hi = [graph.lat.min(), graph.lon.min()], [graph.lat.max(), graph.lon.max()]
+    return np.column_stack([rng.uniform(lo, hi, (n, 2)), rng.uniform(lo, hi, (n, 2))])
+
+
+def main(size=200):
+    rng = np.random.default_rng(42)
+    graph = grid_graph(size, rng)
+    print(f"{graph.node_count} nodes, {graph.edge_count} edges")
+
+    pairs = random_pairs(graph, 50, rng)
+    for route_type in ('eco', 'fastest'):
+        start = time.perf_counter()
+        for p in pairs:
+            graph.route(*p, route_type=route_type)
+        print(f"A* {route_type}: {(time.perf_counter() - start) / len(pairs) * 1000:.1f} ms/route")
+
+    for origins, per_origin in ((10, 100), (100, 100)):
+        sources = random_pairs(graph, origins, rng)[:, :2]
+        destinations = random_pairs(graph, origins * per_origin, rng)[:, 2:]
+        batch = np.column_stack([np.repeat(sources, per_origin, axis=0), destinations])
+        start = time.perf_counter()
+        results = graph.matrix(batch, 'eco')
+        elapsed = time.perf_counter() - start
+        routed = sum(r is not None for r in results)
+        print(f"matrix {origins} origins x {per_origin} destinations: {elapsed:.2f}s "
+              f"({elapsed / len(batch) * 1000:.2f} ms/pair, {routed} routed)")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,52 @@
+"""Compare GridIndex radius queries against a full scan over every point.
+
+Run from Feature1_Map_AQI/: python benchmarks/bench_spatial.py [n_points]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from distance import haversine_km  # noqa: E402
+from spatial_index import GridIndex  # noqa: E402
+
+
+def timed(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(n=100000, queries=1000, radius_km=1.0):
+    rng = np.random.default_rng(42)
+    points = rng.uniform(-0.5, 0.5, (n, 2)) + [18.5204, 73.8567]
+    centers = rng.uniform(-0.4, 0.4, (queries, 2)) + [18.5204, 73.8567]
+
+    index = GridIndex(max_entries=n)
+    build_time = timed(lambda: [index.insert(i, lat, lon, i) for i, (lat, lon) in enumerate(points)], repeat=1)
+
+    def scan(lat, lon):
+        distances = haversine_km(lat, lon, points[:, 0], points[:, 1])
+        within = np.flatnonzero(distances <= radius_km)
+        return within[np.argsort(distances[within])][:20]
+
+    grid_time = timed(lambda: [index.nearby(lat, lon, radius_km, 20) for lat, lon in centers])
+    scan_time = timed(lambda: [scan(lat, lon) for lat, lon in centers])
+
+    # Both must return the same nearest items
+    for lat, lon in centers[:50]:
+        assert [item for _, item in index.nearby(lat, lon, radius_km, 20)] == scan(lat, lon).tolist()
+
+    print(f"{n} points, {radius_km} km radius, build {build_time:.2f}s")
+    print(f"grid: {grid_time / queries * 1e6:.1f} us/query  scan: {scan_time / queries * 1e6:.1f} us/query  "
+          f"speedup {scan_time / grid_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
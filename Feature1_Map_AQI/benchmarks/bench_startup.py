@@ -0,0 +1,51 @@
+"""Break down the cost of `import app` per module it imports, using python -X importtime.
+
+Run from Feature1_Map_AQI/: python benchmarks/bench_startup.py [--warm] [top_n]
+--warm also times warm_up() (needs MongoDB reachable, or it waits for the server selection timeout).
+"""
+import os
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(module='app'):
+    """Total import time of a module and (name, self_us, cumulative_us) for each import it triggers directly"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=APP_DIR, capture_output=True, text=True, check=True
+    )
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # -X importtime indents nested imports by two spaces per level and prints children before their parent
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((name.strip(), int(self_us), int(cumulative_us)))
+        elif depth == 0:
+            if name.strip() == module:
+                return int(cumulative_us), children
+            children = []
+    raise RuntimeError(f'No import record for {module}')
+
+
+def main(top_n=15, warm=False):
+    total, rows = import_times()
+    print(f"import app: {total / 1e6:.3f}s, {len(rows)} direct imports")
+    print(f"{'module':<32} {'cumulative ms':>14} {'self ms':>9}")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda r: -r[2])[:top_n]:
+        print(f"{name:<32} {cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}")
+
+    if warm:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import app; app.warm_up()'], cwd=APP_DIR, check=True)
+        print(f"import + warm_up: {time.perf_counter() - start:.2f}s (including interpreter start)")
+
+
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if a != '--warm']
+    main(int(args[0]) if args else 15, warm='--warm' in sys.argv)
@@ -0,0 +1,168 @@
+"""Local stand-ins for TomTom, OpenAI and MongoDB so the app can be benchmarked offline.
+
+FakeUpstreams serves the TomTom search/routing and OpenAI chat completion
+endpoints the app calls, with a configurable delay per upstream. boot_app()
+points the app at it (TOMTOM_BASE_URL / OPENAI_BASE_URL) and, unless a real
+MONGODB_URI is given, swaps pymongo's client for mongomock (pip install mongomock).
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+POI_TYPES = ['Restaurant', 'Park', 'Shopping Mall', 'Hospital', 'School']
+
+
+def search_results(query, lat, lon, limit=10):
+    return [{
+        'position': {'lat': lat + random.uniform(-0.02, 0.02), 'lon': lon + random.uniform(-0.02, 0.02)},
+        'poi': {'name': f"{query} {POI_TYPES[i % len(POI_TYPES)]} {i + 1}", 'categories': [POI_TYPES[i % len(POI_TYPES)]]},
+        'address': {'freeformAddress': f"Street {i + 1}, Pune, India"}
+    } for i in range(limit)]
+
+
+def route_result(start_lat, start_lon, end_lat, end_lon, n_points=50):
+    length = int(((end_lat - start_lat) ** 2 + (end_lon - start_lon) ** 2) ** 0.5 * 111000 * 1.3) + 100
+    points = [{
+        'latitude': start_lat + (end_lat - start_lat) * i / (n_points - 1),
+        'longitude': start_lon + (end_lon - start_lon) * i / (n_points - 1)
+    } for i in range(n_points)]
+    return {'routes': [{
+        'summary': {'lengthInMeters': length, 'travelTimeInSeconds': length // 8},
+        'legs': [{'points': points}]
+    }]}
+
+
+def completion(text, model):
+    return {
+        'id': 'chatcmpl-fake', 'object': 'chat.completion', 'created': int(time.time()), 'model': model,
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+        'usage': {'prompt_tokens': 40, 'completion_tokens': 20, 'total_tokens': 60}
+    }
+
+
+def completion_chunk(delta, model, finish_reason=None):
+    return {
+        'id': 'chatcmpl-fake', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+        'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+    }
+
+
+class FakeUpstreams:
+    """Threaded HTTP server answering like TomTom and OpenAI after a fixed delay (seconds)"""
+
+    def __init__(self, tomtom_latency=0.05, openai_latency=0.3, host='127.0.0.1', port=0):
+        self.tomtom_latency = tomtom_latency
+        self.openai_latency = openai_latency
+        self.requests = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-upstreams', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        upstreams = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, payload, status=200):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                upstreams.requests += 1
+                url = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                time.sleep(upstreams.tomtom_latency)
+
+                if url.path.startswith('/search/2/search/'):
+                    query = unquote(url.path[len('/search/2/search/'):]).removesuffix('.json')
+                    lat, lon = float(params.get('lat', 18.5204)), float(params.get('lon', 73.8567))
+                    return self.send_json({'results': search_results(query, lat, lon, int(params.get('limit', 10)))})
+                if url.path.startswith('/routing/1/calculateRoute/'):
+                    start, end = url.path.split('/')[4].split(':')
+                    return self.send_json(route_result(*map(float, start.split(',')), *map(float, end.split(','))))
+                self.send_json({'error': 'not found'}, 404)
+
+            def do_POST(self):
+                upstreams.requests += 1
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if not self.path.endswith('/chat/completions'):
+                    return self.send_json({'error': 'not found'}, 404)
+
+                model = body.get('model', 'gpt-3.5-turbo')
+                text = 'Traffic is moderate in your zone and the air is fair, so an eco route is a good choice today.'
+                time.sleep(upstreams.openai_latency)
+                if not body.get('stream'):
+                    return self.send_json(completion(text, model))
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.close_connection = True
+                chunks = [completion_chunk({'role': 'assistant', 'content': ''}, model)]
+                chunks += [completion_chunk({'content': word}, model) for word in text.split(' ')]
+                chunks.append(completion_chunk({}, model, 'stop'))
+                for chunk in chunks:
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                self.wfile.write(b"data: [DONE]\n\n")
+
+        return Handler
+
+
+def boot_app(upstreams=None, mongo_uri=None):
+    """Import the app configured against fake upstreams and mongomock (or a real MongoDB at mongo_uri)"""
+    state_dir = tempfile.mkdtemp(prefix='aimlmap-bench-')
+    os.environ.setdefault('ZONE_MODEL_PATH', os.path.join(state_dir, 'zone_model.npz'))
+    os.environ.setdefault('TRAFFIC_MODEL_PATH', os.path.join(state_dir, 'traffic_model.npz'))
+    os.environ.setdefault('METRICS_INGEST_TOKEN', 'bench')
+    if upstreams is not None:
+        os.environ.update({
+            'TOMTOM_API_KEY': 'fake', 'OPENAI_API_KEY': 'fake',
+            'TOMTOM_BASE_URL': upstreams.url, 'OPENAI_BASE_URL': f"{upstreams.url}/v1"
+        })
+
+    if mongo_uri:
+        os.environ['MONGODB_URI'] = mongo_uri
+    else:
+        import mongomock
+        import pymongo
+
+        pymongo.MongoClient = mongomock.MongoClient
+
+    sys.path.insert(0, APP_DIR)
+    import app
+
+    app.warm_up()
+    if mongo_uri:
+        app.init_db()
+    return app
@@ -0,0 +1,231 @@
+"""Drive the index page and every /api/* route at a fixed concurrency and report throughput and p50/p95/p99 latency.
+
+By default the app is booted in-process behind a threaded Werkzeug server,
+against mongomock and local fake TomTom/OpenAI servers (see fakes.py).
+--target sends the load to an already running server instead.
+
+Run from Feature1_Map_AQI/:
+    python benchmarks/load_test.py --requests 200 --concurrency 16 --tomtom-ms 50 --openai-ms 300
+    python benchmarks/load_test.py --routes analyze,chatbot
+    METRICS_INGEST_TOKEN=... python benchmarks/load_test.py --target http://localhost:5000
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeUpstreams, boot_app  # noqa: E402
+
+CENTER = (18.5204, 73.8567)
+
+
+def point(spread=0.1):
+    return CENTER[0] + random.uniform(-spread, spread), CENTER[1] + random.uniform(-spread, spread)
+
+
+def index_page():
+    return 'GET', '/', None
+
+
+def dashboard():
+    lat, lon = point()
+    return 'GET', f'/api/dashboard?lat={lat}&lon={lon}', None
+
+
+def analyze():
+    lat, lon = point()
+    return 'POST', '/api/location/analyze', {'lat': lat, 'lon': lon, 'query': random.choice(['cafe', 'park', 'hospital'])}
+
+
+def analyze_batch():
+    return 'POST', '/api/location/analyze/batch', {'points': [point() for _ in range(1000)]}
+
+
+def ingest():
+    samples = []
+    for _ in range(20):
+        lat, lon = point()
+        samples.append({'lat': lat, 'lon': lon, 'aqi': random.randint(40, 160), 'noise_level': random.randint(40, 90), 'traffic_level': random.randint(10, 95)})
+    return 'POST', '/api/metrics/ingest', {'samples': samples}
+
+
+def series():
+    lat, lon = point()
+    return 'GET', f'/api/metrics/series?lat={lat}&lon={lon}&resolution=minute&limit=60', None
+
+
+def route_plan():
+    (start_lat, start_lon), (end_lat, end_lon) = point(), point()
+    return 'POST', '/api/route/plan', {'start_lat': start_lat, 'start_lon': start_lon, 'end_lat': end_lat, 'end_lon': end_lon, 'route_type': 'eco'}
+
+
+def route_batch():
+    return 'POST', '/api/route/plan/batch', {'pairs': [[*point(), *point()] for _ in range(100)], 'route_type': 'eco'}
+
+
+def chatbot():
+    return 'POST', '/api/chatbot', {'message': f"What is the best eco route to zone {random.randint(1, 50)}?"}
+
+
+def chatbot_stream():
+    return 'POST', '/api/chatbot/stream', {'message': f"How is the air near stop {random.randint(1, 50)}?"}
+
+
+def community_posts():
+    return 'GET', f"/api/community/posts?sort={random.choice(['new', 'top'])}&limit=20", None
+
+
+def community_post():
+    lat, lon = point()
+    return 'POST', '/api/community/post', {'title': 'Load test', 'content': 'Quiet streets this morning', 'location': 'Pune', 'lat': lat, 'lon': lon}
+
+
+def community_nearby():
+    lat, lon = point()
+    return 'GET', f'/api/community/nearby?lat={lat}&lon={lon}&radius=3', None
+
+
+def map_layer():
+    lat, lon = point()
+    return 'GET', f'/api/map/layer?bbox={lon - 0.05},{lat - 0.03},{lon + 0.05},{lat + 0.03}&zoom=14&shape=hex', None
+
+
+def leaderboard():
+    return 'GET', '/api/leaderboard', None
+
+
+def leaderboard_rank():
+    return 'GET', '/api/leaderboard/rank/demo_user', None
+
+
+def stats():
+    return 'GET', random.choice(['/api/cache/stats', '/api/forecast/stats', '/api/queue/stats', '/api/upstream/stats']), None
+
+
+SCENARIOS = {
+    'index': index_page,
+    'dashboard': dashboard,
+    'analyze': analyze,
+    'analyze_batch': analyze_batch,
+    'metrics_ingest': ingest,
+    'metrics_series': series,
+    'route_plan': route_plan,
+    'route_batch': route_batch,
+    'chatbot': chatbot,
+    'chatbot_stream': chatbot_stream,
+    'community_posts': community_posts,
+    'community_post': community_post,
+    'community_nearby': community_nearby,
+    'map_layer': map_layer,
+    'leaderboard': leaderboard,
+    'leaderboard_rank': leaderboard_rank,
+    'stats': stats,
+}
+
+
+def upvote_scenario(base_url):
+    """Upvotes spread over the posts currently on the first feed page"""
+    posts = requests.get(f'{base_url}/api/community/posts?limit=50', timeout=30).json().get('posts', [])
+    ids = [post['id'] for post in posts]
+    if not ids:
+        return None
+    return lambda: ('POST', f'/api/community/upvote/{random.choice(ids)}', None)
+
+
+def run_scenario(base_url, make_request, total, concurrency, timeout=60):
+    """Send `total` requests from `concurrency` threads; returns (latencies, statuses, wall time)"""
+    local = threading.local()
+    latencies = np.empty(total)
+    statuses = [0] * total
+
+    def send(i):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+            if os.getenv('METRICS_INGEST_TOKEN'):
+                session.headers['X-Ingest-Token'] = os.environ['METRICS_INGEST_TOKEN']
+        method, path, body = make_request()
+        start = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, json=body, timeout=timeout)
+            response.content  # read streamed bodies to the end
+            statuses[i] = response.status_code
+        except requests.RequestException:
+            statuses[i] = -1
+        latencies[i] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, range(total)))
+    return latencies, statuses, time.perf_counter() - start
+
+
+def report(name, latencies, statuses, wall):
+    errors = sum(status < 0 or status >= 500 for status in statuses)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    print(f"{name:<18} {len(latencies):>6} {errors:>6} {len(latencies) / wall:>9.1f} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f}")
+
+
+def serve(app, host='127.0.0.1'):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server(host, 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, name='app-server', daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--routes', help='comma-separated scenario names (default: all)')
+    parser.add_argument('--tomtom-ms', type=float, default=50, help='fake TomTom response delay')
+    parser.add_argument('--openai-ms', type=float, default=300, help='fake OpenAI response delay')
+    parser.add_argument('--mongo', help='real MongoDB URI instead of mongomock')
+    parser.add_argument('--target', help='base URL of a running server; skips booting the app and fakes')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    scenarios = dict(SCENARIOS)
+    if args.target:
+        base_url = args.target.rstrip('/')
+    else:
+        upstreams = FakeUpstreams(args.tomtom_ms / 1000, args.openai_ms / 1000).start()
+        app = boot_app(upstreams, args.mongo)
+        server, base_url = serve(app.app)
+        if app.route_graph is None:
+            print("Skipping route_batch: no local route graph (build one with route_graph.py)")
+            scenarios.pop('route_batch')
+        if not args.mongo:
+            print("Skipping community_nearby and map_layer: $geoNear/$geoWithin need a real MongoDB (--mongo)")
+            scenarios.pop('community_nearby')
+            scenarios.pop('map_layer')
+
+    upvote = upvote_scenario(base_url)
+    if upvote is not None:
+        scenarios['community_upvote'] = upvote
+    if args.routes:
+        wanted = args.routes.split(',')
+        scenarios = {name: scenario for name, scenario in scenarios.items() if name in wanted}
+
+    print(f"{args.requests} requests per route at concurrency {args.concurrency} against {base_url}")
+    print(f"{'route':<18} {'reqs':>6} {'errors':>6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, make_request in scenarios.items():
+        report(name, *run_scenario(base_url, make_request, args.requests, args.concurrency))
+
+
+if __name__ == '__main__':
+    main()
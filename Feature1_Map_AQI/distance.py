@@ -0,0 +1,157 @@
+import math
+import os
+
+import numpy as np
+
+DISTANCE_MODE = os.getenv('DISTANCE_MODE', 'ellipsoidal')
+
+EARTH_RADIUS_KM = 6371.0088
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = (1 - WGS84_F) * WGS84_A
+VINCENTY_MAX_ITER = 200
+VINCENTY_TOLERANCE = 1e-12
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km on a spherical earth; broadcasts over NumPy arrays"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def vincenty_km(lat1, lon1, lat2, lon2):
+    """Inverse Vincenty distance in km on the WGS-84 ellipsoid; broadcasts over NumPy arrays.
+
+    Nearly antipodal pairs that do not converge fall back to haversine.
+    """
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(
+        *(np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    )
+    f = WGS84_F
+    L = lon2 - lon1
+    U1 = np.arctan((1 - f) * np.tan(lat1))
+    U2 = np.arctan((1 - f) * np.tan(lat2))
+    sinU1, cosU1 = np.sin(U1), np.cos(U1)
+    sinU2, cosU2 = np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    converged = np.zeros(L.shape, dtype=bool)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for _ in range(VINCENTY_MAX_ITER):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.sqrt((cosU2 * sin_lam) ** 2 + (cosU1 * sinU2 - sinU1 * cosU2 * cos_lam) ** 2)
+            cos_sigma = sinU1 * sinU2 + cosU1 * cosU2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cosU1 * cosU2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            cos_2sigma_m = np.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * sinU1 * sinU2 / cos2_alpha)
+            C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+            lam_prev = lam
+            lam = L + (1 - C) * f * sin_alpha * (
+                sigma + C * sin_sigma * (cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2))
+            )
+            converged = np.abs(lam - lam_prev) < VINCENTY_TOLERANCE
+            if converged.all():
+                break
+
+        u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+        A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+        B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+        delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+            - B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)
+        ))
+        meters = WGS84_B * A * (sigma - delta_sigma)
+
+    km = meters / 1000.0
+    if not converged.all():
+        km = np.where(converged, km, haversine_km(np.degrees(lat1), np.degrees(lon1), np.degrees(lat2), np.degrees(lon2)))
+    return km
+
+
+def _haversine_scalar_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * math.asin(math.sqrt(min(max(a, 0.0), 1.0)))
+
+
+def _vincenty_scalar_km(lat1, lon1, lat2, lon2):
+    # Same iteration as vincenty_km, without NumPy's per-call overhead for single points
+    f = WGS84_F
+    L = math.radians(lon2 - lon1)
+    U1 = math.atan((1 - f) * math.tan(math.radians(lat1)))
+    U2 = math.atan((1 - f) * math.tan(math.radians(lat2)))
+    sinU1, cosU1 = math.sin(U1), math.cos(U1)
+    sinU2, cosU2 = math.sin(U2), math.cos(U2)
+
+    lam = L
+    for _ in range(VINCENTY_MAX_ITER):
+        sin_lam, cos_lam = math.sin(lam), math.cos(lam)
+        sin_sigma = math.sqrt((cosU2 * sin_lam) ** 2 + (cosU1 * sinU2 - sinU1 * cosU2 * cos_lam) ** 2)
+        if sin_sigma == 0:
+            return 0.0
+        cos_sigma = sinU1 * sinU2 + cosU1 * cosU2 * cos_lam
+        sigma = math.atan2(sin_sigma, cos_sigma)
+        sin_alpha = cosU1 * cosU2 * sin_lam / sin_sigma
+        cos2_alpha = 1 - sin_alpha ** 2
+        cos_2sigma_m = cos_sigma - 2 * sinU1 * sinU2 / cos2_alpha if cos2_alpha else 0.0
+        C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+        lam_prev = lam
+        lam = L + (1 - C) * f * sin_alpha * (
+            sigma + C * sin_sigma * (cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2))
+        )
+        if abs(lam - lam_prev) < VINCENTY_TOLERANCE:
+            break
+    else:
+        return _haversine_scalar_km(lat1, lon1, lat2, lon2)
+
+    u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+        - B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)
+    ))
+    return WGS84_B * A * (sigma - delta_sigma) / 1000.0
+
+
+_SCALAR_KERNELS = {
+    'haversine': _haversine_scalar_km,
+    'ellipsoidal': _vincenty_scalar_km,
+}
+
+_KERNELS = {
+    'haversine': haversine_km,
+    'ellipsoidal': vincenty_km,
+}
+
+
+def _kernel(mode, kernels=_KERNELS):
+    try:
+        return kernels[mode or DISTANCE_MODE]
+    except KeyError:
+        raise ValueError(f"Unknown distance mode: {mode}")
+
+
+def distance_km(lat1, lon1, lat2, lon2, mode=None):
+    """Distance in km between two points (returns a float)"""
+    return _kernel(mode, _SCALAR_KERNELS)(float(lat1), float(lon1), float(lat2), float(lon2))
+
+
+def pairwise_km(coords1, coords2, mode=None):
+    """Row-wise distances in km between two equal-length (N, 2) lat/lon arrays"""
+    coords1 = np.asarray(coords1, dtype=np.float64).reshape(-1, 2)
+    coords2 = np.asarray(coords2, dtype=np.float64).reshape(-1, 2)
+    return _kernel(mode)(coords1[:, 0], coords1[:, 1], coords2[:, 0], coords2[:, 1])
+
+
+def distance_matrix_km(origins, destinations, mode=None):
+    """N x M matrix of distances in km from every origin to every destination"""
+    origins = np.asarray(origins, dtype=np.float64).reshape(-1, 2)
+    destinations = np.asarray(destinations, dtype=np.float64).reshape(-1, 2)
+    return _kernel(mode)(
+        origins[:, 0][:, None], origins[:, 1][:, None],
+        destinations[:, 0][None, :], destinations[:, 1][None, :]
+    )
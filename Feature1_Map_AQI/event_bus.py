@@ -0,0 +1,121 @@
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+EVENT_BUS_SIZE = int(os.getenv('EVENT_BUS_SIZE', 16 * 1024 * 1024))
+EVENT_BUS_AWAIT_MS = int(os.getenv('EVENT_BUS_AWAIT_MS', 1000))
+EVENT_BUS_RETRY = float(os.getenv('EVENT_BUS_RETRY', 1.0))
+
+
+class EventBus:
+    """Fan-out of state changes to the other worker processes through a capped Mongo collection.
+
+    publish() inserts an event; every worker tails the collection with a
+    tailable cursor and hands the events other processes published to the
+    handlers registered for their channel. The publishing worker has already
+    applied its own change, so its events are skipped. Capped collections and
+    tailable cursors need no replica set. Without a collection the bus is
+    local only: nothing is sent and every process keeps its own state.
+    """
+
+    def __init__(self, collection=None, size=EVENT_BUS_SIZE):
+        self.collection = collection
+        self.size = size
+        self.handlers = {}
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def origin(self):
+        # Read on every call: a forked worker gets a new pid and so a new origin
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def on(self, channel, handler):
+        """Call handler(payload) for every event another process publishes on a channel"""
+        self.handlers.setdefault(channel, []).append(handler)
+
+    def init_collection(self, database=None):
+        """Create the capped collection, in `database` if given rather than the bus's own"""
+        if self.collection is None:
+            return
+        database = self.collection.database if database is None else database
+        try:
+            database.create_collection(self.collection.name, capped=True, size=self.size)
+        except CollectionInvalid:
+            pass
+
+    def publish(self, channel, payload):
+        """Send an event to the other workers; a failed send only costs them staleness until their TTLs expire"""
+        if self.collection is None:
+            return
+        try:
+            self.collection.insert_one({
+                'origin': self.origin,
+                'channel': channel,
+                'payload': payload,
+                'ts': datetime.now(timezone.utc)
+            })
+            self.published += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"Event bus publish error: {e}")
+
+    def start(self):
+        """Start tailing in this process; call it after forking"""
+        if self.collection is None or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._tail, name='event-bus', daemon=True)
+                self._thread.start()
+
+    def _tail(self):
+        # Only events published after this worker started; earlier ones are already in Mongo
+        since = datetime.now(timezone.utc)
+        seen = set()
+        while True:
+            try:
+                cursor = self.collection.find(
+                    {'ts': {'$gte': since}}, cursor_type=CursorType.TAILABLE_AWAIT
+                ).max_await_time_ms(EVENT_BUS_AWAIT_MS)
+                while cursor.alive:
+                    for doc in cursor:
+                        # ts has millisecond precision, so a reopened cursor sees the last instant again
+                        if doc['_id'] in seen:
+                            continue
+                        if doc['ts'] != since:
+                            since, seen = doc['ts'], set()
+                        seen.add(doc['_id'])
+                        self._dispatch(doc)
+            except Exception as e:
+                self.errors += 1
+                print(f"Event bus tail error: {e}")
+            # A tailable cursor on an empty collection dies at once, so wait before reopening
+            time.sleep(EVENT_BUS_RETRY)
+
+    def _dispatch(self, doc):
+        if doc.get('origin') == self.origin:
+            return
+        self.received += 1
+        for handler in self.handlers.get(doc.get('channel'), ()):
+            try:
+                handler(doc.get('payload'))
+            except Exception as e:
+                self.errors += 1
+                print(f"Event bus handler error on {doc.get('channel')}: {e}")
+
+    def stats(self):
+        return {
+            'shared': self.collection is not None,
+            'published': self.published,
+            'received': self.received,
+            'errors': self.errors
+        }
@@ -0,0 +1,337 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+GEO_CACHE_PRECISION = int(os.getenv('GEO_CACHE_PRECISION', 7))
+GEO_CACHE_MAX_ENTRIES = int(os.getenv('GEO_CACHE_MAX_ENTRIES', 5000))
+GEO_CACHE_SEARCH_TTL = int(os.getenv('GEO_CACHE_SEARCH_TTL', 3600))
+GEO_CACHE_ROUTE_TTL = int(os.getenv('GEO_CACHE_ROUTE_TTL', 300))
+GEO_CACHE_BACKEND = os.getenv('GEO_CACHE_BACKEND', 'memory')
+SHARED_CACHE_SLOTS = int(os.getenv('SHARED_CACHE_SLOTS', 2048))
+SHARED_CACHE_SLOT_BYTES = int(os.getenv('SHARED_CACHE_SLOT_BYTES', 32768))
+
+_GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash(lat, lon, precision=GEO_CACHE_PRECISION):
+    """Encode a coordinate as a geohash tile (precision 7 is roughly 150m)"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bit = 0
+    ch = 0
+    even = True
+
+    while len(chars) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if lon >= mid:
+                ch |= 1 << (4 - bit)
+                lon_range[0] = mid
+            else:
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if lat >= mid:
+                ch |= 1 << (4 - bit)
+                lat_range[0] = mid
+            else:
+                lat_range[1] = mid
+        even = not even
+
+        if bit < 4:
+            bit += 1
+        else:
+            chars.append(_GEOHASH_BASE32[ch])
+            bit = 0
+            ch = 0
+
+    return ''.join(chars)
+
+
+def geohash_codes(lats, lons, precision=GEO_CACHE_PRECISION):
+    """Vectorized geohash: int64 codes equal to the base32 tile read as a 5*precision-bit number"""
+    bits = 5 * precision
+    lon_bits, lat_bits = (bits + 1) // 2, bits // 2
+    lat_q = np.floor((np.asarray(lats, dtype=np.float64) + 90.0) / 180.0 * (1 << lat_bits))
+    lon_q = np.floor((np.asarray(lons, dtype=np.float64) + 180.0) / 360.0 * (1 << lon_bits))
+    lat_q = np.clip(lat_q, 0, (1 << lat_bits) - 1).astype(np.int64)
+    lon_q = np.clip(lon_q, 0, (1 << lon_bits) - 1).astype(np.int64)
+
+    # Interleave bits most significant first, starting with longitude
+    codes = np.zeros(np.broadcast(lat_q, lon_q).shape, dtype=np.int64)
+    for i in range(bits):
+        if i % 2 == 0:
+            bit = (lon_q >> (lon_bits - 1 - i // 2)) & 1
+        else:
+            bit = (lat_q >> (lat_bits - 1 - i // 2)) & 1
+        codes = (codes << 1) | bit
+    return codes
+
+
+def geohash_code(tile):
+    """int64 code of a geohash string, as produced by geohash_codes"""
+    code = 0
+    for ch in tile:
+        code = code * 32 + _GEOHASH_BASE32.index(ch)
+    return code
+
+
+def geohash_center(tile):
+    """Center (lat, lon) of a geohash tile"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for ch in tile:
+        code = _GEOHASH_BASE32.index(ch)
+        for shift in range(4, -1, -1):
+            bounds = lon_range if even else lat_range
+            mid = (bounds[0] + bounds[1]) / 2
+            if code >> shift & 1:
+                bounds[0] = mid
+            else:
+                bounds[1] = mid
+            even = not even
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
+
+
+def tile_key(kind, *parts):
+    """Build a cache key from a kind prefix and already-quantized parts"""
+    return ':'.join([kind] + [str(p).strip().lower() for p in parts])
+
+
+class TTLCache:
+    """Thread-safe in-process LRU cache with per-entry expiry"""
+
+    def __init__(self, max_entries=GEO_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class MongoCacheBackend:
+    """Shared cache backend stored in a Mongo collection with a TTL index"""
+
+    name = 'mongo'
+
+    def __init__(self, collection):
+        self.collection = collection
+        try:
+            self.collection.create_index("expires_at", expireAfterSeconds=0)
+        except Exception as e:
+            print(f"Cache index error: {e}")
+
+    def get(self, key):
+        try:
+            doc = self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}})
+        except Exception as e:
+            print(f"Cache read error: {e}")
+            return None
+        return doc['value'] if doc else None
+
+    def set(self, key, value, ttl):
+        try:
+            self.collection.replace_one(
+                {"_id": key},
+                {"_id": key, "value": value, "expires_at": datetime.utcnow() + timedelta(seconds=ttl)},
+                upsert=True
+            )
+        except Exception as e:
+            print(f"Cache write error: {e}")
+
+    def delete(self, key):
+        try:
+            self.collection.delete_one({"_id": key})
+        except Exception as e:
+            print(f"Cache delete error: {e}")
+
+
+class SharedCacheBackend:
+    """Cache backend in an anonymous shared mapping, shared by every worker forked after it is created.
+
+    A direct-mapped table of fixed-size slots: each key hashes to one slot
+    holding the key's 64-bit hash, its expiry and its JSON-encoded value, so a
+    colliding key simply replaces the older entry and values larger than a
+    slot are not cached. Workers exclude each other with a POSIX record lock
+    on an unlinked temporary file, taken together with a per-process thread
+    lock. The kernel drops a record lock when its holder exits, so a worker
+    killed mid-write leaves at worst that one slot torn, never the lock held.
+    """
+
+    name = 'shm'
+    _header = struct.Struct('<QdI')
+
+    def __init__(self, slots=SHARED_CACHE_SLOTS, slot_bytes=SHARED_CACHE_SLOT_BYTES):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.buf = mmap.mmap(-1, slots * slot_bytes)
+        self.oversize = 0
+        # Forked workers inherit the descriptor; lockf locks belong to the process, not the descriptor
+        self._lock_file = tempfile.TemporaryFile() if fcntl else None
+        self._thread_lock = threading.Lock()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_thread_lock)
+
+    def _reset_thread_lock(self):
+        # A thread of the parent may have held it at fork time; that thread does not exist in the child
+        self._thread_lock = threading.Lock()
+
+    def _slot(self, key):
+        digest = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+        # 0 marks an empty slot
+        return digest or 1, digest % self.slots * self.slot_bytes
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            if self._lock_file is None:
+                yield
+                return
+            fcntl.lockf(self._lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._lock_file, fcntl.LOCK_UN)
+
+    def get(self, key):
+        digest, offset = self._slot(key)
+        with self._locked():
+            stored, expires_at, length = self._header.unpack_from(self.buf, offset)
+            if stored != digest or expires_at < time.time():
+                return None
+            start = offset + self._header.size
+            payload = self.buf[start:start + length]
+        return orjson.loads(payload) if orjson else json.loads(payload)
+
+    def set(self, key, value, ttl):
+        payload = orjson.dumps(value) if orjson else json.dumps(value).encode('utf-8')
+        if len(payload) > self.slot_bytes - self._header.size:
+            self.oversize += 1
+            return
+        digest, offset = self._slot(key)
+        with self._locked():
+            start = offset + self._header.size
+            self.buf[start:start + len(payload)] = payload
+            self._header.pack_into(self.buf, offset, digest, time.time() + ttl, len(payload))
+
+    def delete(self, key):
+        digest, offset = self._slot(key)
+        with self._locked():
+            if self._header.unpack_from(self.buf, offset)[0] == digest:
+                self._header.pack_into(self.buf, offset, 0, 0.0, 0)
+
+
+class GeoCache:
+    """Two-tier cache: in-process LRU in front of an optional shared backend"""
+
+    def __init__(self, local=None, shared=None, promote_ttl=60):
+        self.local = local or TTLCache()
+        self.shared = shared
+        self.promote_ttl = promote_ttl
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        if self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.shared_hits += 1
+                # Shared entries have their own expiry; keep the local copy short-lived
+                self.local.set(key, value, self.promote_ttl)
+                return value
+
+        self.misses += 1
+        return None
+
+    def set(self, key, value, ttl):
+        self.local.set(key, value, ttl)
+        if self.shared is not None:
+            self.shared.set(key, value, ttl)
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def stats(self):
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            'hits': self.hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.hits + self.shared_hits) / lookups, 3) if lookups else 0.0,
+            'entries': len(self.local),
+            'backend': self.shared.name if self.shared is not None else 'memory'
+        }
+
+
+def search_key(query, lat, lon):
+    """Cache key for a POI search around a coordinate"""
+    tile = geohash(float(lat), float(lon)) if lat is not None and lon is not None else 'global'
+    return tile_key('search', tile, query)
+
+
+def route_key(start_lat, start_lon, end_lat, end_lon, route_type):
+    """Cache key for a route between two coordinate tiles"""
+    return tile_key(
+        'route',
+        geohash(float(start_lat), float(start_lon)),
+        geohash(float(end_lat), float(end_lon)),
+        route_type
+    )
@@ -0,0 +1,278 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+
+import requests
+from requests.adapters import HTTPAdapter
+
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 20))
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', 2))
+HTTP_BACKOFF_BASE = float(os.getenv('HTTP_BACKOFF_BASE', 0.2))
+HTTP_BACKOFF_MAX = float(os.getenv('HTTP_BACKOFF_MAX', 2.0))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', 30))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# A POST that got one of these was not processed, so it is safe to send again
+UNPROCESSED_STATUSES = {429, 503}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+LATENCY_BUCKETS = [0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+
+def retry_statuses(method):
+    return RETRY_STATUSES if method.upper() in IDEMPOTENT_METHODS else UNPROCESSED_STATUSES
+
+
+def backoff_delay(attempt, deadline):
+    """Full-jitter backoff before retry `attempt`, or None when it would not finish before the deadline"""
+    # Full jitter keeps retries from synchronising across workers
+    delay = random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+    if deadline is not None and time.monotonic() + delay >= deadline:
+        return None
+    return delay
+
+
+def attempt_timeout(timeout, deadline):
+    """The caller's timeout, shortened so all attempts together stay within it"""
+    if deadline is None:
+        return timeout
+    return max(deadline - time.monotonic(), 0.001)
+
+
+def request_unsent(error):
+    """Whether a requests exception was raised before the request reached the upstream"""
+    from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    return isinstance(reason, MaxRetryError) and isinstance(reason.reason, NewConnectionError)
+
+
+class CircuitOpenError(Exception):
+    """Raised when an upstream is failing and calls are short-circuited"""
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets one probe through per reset window"""
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'half_open':
+                # Restart the window so only one probe goes out at a time
+                self.opened_at = time.monotonic()
+                return True
+            return state == 'closed'
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class LatencyHistogram:
+    """Cumulative latency histogram with fixed bucket bounds in seconds"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, seconds)] += 1
+            self.total += seconds
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            cumulative = []
+            running = 0
+            for bound, n in zip(self.buckets + [float('inf')], self.counts):
+                running += n
+                cumulative.append(('+Inf' if bound == float('inf') else bound, running))
+            return {'buckets': cumulative, 'sum': round(self.total, 6), 'count': self.count}
+
+
+class UpstreamClient:
+    """Pooled keep-alive session for one upstream with retries and a circuit breaker"""
+
+    def __init__(self, name, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=HTTP_MAX_RETRIES):
+        self.name = name
+        self.max_retries = max_retries
+        self.breaker = CircuitBreaker()
+        self.latency = LatencyHistogram()
+        self.errors = 0
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        """Send a request, retrying only failures that are safe to send again.
+
+        Connect errors and connect timeouts are retried for every method;
+        other connection errors and retryable statuses only where resending
+        cannot repeat a side effect. Read timeouts are never retried. A
+        numeric `timeout` bounds all attempts together, so retries do not
+        stretch the caller's worst case.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+        timeout = kwargs.pop('timeout', None)
+        deadline = time.monotonic() + timeout if isinstance(timeout, (int, float)) else None
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        statuses = retry_statuses(method)
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=attempt_timeout(timeout, deadline), **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.latency.observe(time.perf_counter() - start)
+                # A read timeout means the request was sent and may still be processed
+                retryable = request_unsent(e) or (idempotent and isinstance(e, requests.ConnectionError))
+                delay = backoff_delay(attempt, deadline) if retryable and attempt < self.max_retries else None
+                if delay is None:
+                    self.errors += 1
+                    self.breaker.record_failure()
+                    raise
+            else:
+                self.latency.observe(time.perf_counter() - start)
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.record_success()
+                    return response
+                retryable = response.status_code in statuses
+                delay = backoff_delay(attempt, deadline) if retryable and attempt < self.max_retries else None
+                if delay is None:
+                    self.errors += 1
+                    self.breaker.record_failure()
+                    return response
+                response.close()
+
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        return {
+            'circuit': self.breaker.state,
+            'consecutive_failures': self.breaker.failures,
+            'errors': self.errors,
+            'latency': self.latency.snapshot()
+        }
+
+
+class AsyncUpstreamClient:
+    """httpx-based async counterpart of an UpstreamClient, sharing its breaker and histogram"""
+
+    def __init__(self, upstream, pool_maxsize=HTTP_POOL_MAXSIZE):
+        self.upstream = upstream
+        self.pool_maxsize = pool_maxsize
+        self.client = None
+
+    async def start(self):
+        import httpx
+
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.pool_maxsize, max_keepalive_connections=self.pool_maxsize)
+            )
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def request(self, method, url, **kwargs):
+        """UpstreamClient.request over httpx: the same retry rules and overall deadline"""
+        import httpx
+
+        upstream = self.upstream
+        if not upstream.breaker.allow():
+            raise CircuitOpenError(f"{upstream.name} circuit is open")
+        await self.start()
+
+        timeout = kwargs.pop('timeout', None)
+        deadline = time.monotonic() + timeout if isinstance(timeout, (int, float)) else None
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        statuses = retry_statuses(method)
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = await self.client.request(method, url, timeout=attempt_timeout(timeout, deadline), **kwargs)
+            except httpx.TransportError as e:
+                upstream.latency.observe(time.perf_counter() - start)
+                unsent = isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+                retryable = unsent or (idempotent and not isinstance(e, httpx.TimeoutException))
+                delay = backoff_delay(attempt, deadline) if retryable and attempt < upstream.max_retries else None
+                if delay is None:
+                    upstream.errors += 1
+                    upstream.breaker.record_failure()
+                    raise
+            else:
+                upstream.latency.observe(time.perf_counter() - start)
+                if response.status_code not in RETRY_STATUSES:
+                    upstream.breaker.record_success()
+                    return response
+                retryable = response.status_code in statuses
+                delay = backoff_delay(attempt, deadline) if retryable and attempt < upstream.max_retries else None
+                if delay is None:
+                    upstream.errors += 1
+                    upstream.breaker.record_failure()
+                    return response
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+
+tomtom_http = UpstreamClient('tomtom')
+openai_http = UpstreamClient('openai')
+tomtom_async = AsyncUpstreamClient(tomtom_http)
+openai_async = AsyncUpstreamClient(openai_http)
+
+
+def upstream_stats():
+    """Stats for every shared upstream client"""
+    return {client.name: client.stats() for client in (tomtom_http, openai_http)}
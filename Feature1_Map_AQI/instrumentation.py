@@ -0,0 +1,454 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+from http_client import LatencyHistogram, upstream_stats
+
+PROFILE_SLOW_MS = float(os.getenv('PROFILE_SLOW_MS', 0))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', 0.005))
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+PROFILE_MAX_DUMPS = int(os.getenv('PROFILE_MAX_DUMPS', 100))
+METRICS_DIR = os.getenv('METRICS_DIR')
+METRICS_SNAPSHOT_INTERVAL = float(os.getenv('METRICS_SNAPSHOT_INTERVAL', 5))
+
+# Stage durations of the request being served, keyed by stage name; None outside a request
+_request_stages = contextvars.ContextVar('request_stages', default=None)
+
+
+class MetricsRegistry:
+    """Per-process latency histograms for routes and named stages"""
+
+    def __init__(self):
+        self.requests = {}
+        self.stages = {}
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+
+    def _histogram(self, table, key):
+        histogram = table.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = table.setdefault(key, LatencyHistogram())
+        return histogram
+
+    def observe_request(self, method, route, status, seconds):
+        self._histogram(self.requests, (method, route, str(status))).observe(seconds)
+
+    def observe_stage(self, name, seconds):
+        self._histogram(self.stages, name).observe(seconds)
+
+
+metrics = MetricsRegistry()
+
+
+def record_stage(name, seconds):
+    """Add a stage duration to its histogram and to the current request's breakdown"""
+    metrics.observe_stage(name, seconds)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name):
+    """Time a block as a named stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """Decorator timing every call of a function (sync or async) as a named stage"""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """pymongo command listener recording every database round trip as a mongo.<command> stage"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        record_stage(f'mongo.{event.command_name}', event.duration_micros / 1e6)
+
+    def failed(self, event):
+        record_stage(f'mongo.{event.command_name}', event.duration_micros / 1e6)
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame):
+    """Stack of a frame in collapsed form (root;...;leaf), as read by flamegraph.pl and speedscope"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class SlowRequestProfiler:
+    """Opt-in sampling profiler that dumps collapsed stacks of slow requests.
+
+    While enabled, a background thread samples the stack of every thread that
+    is serving a request each `interval` seconds. Requests slower than
+    `threshold_ms` have their samples written to `out_dir` as a .folded file
+    (one "stack count" line per distinct stack); faster ones are discarded.
+    Only the newest `max_dumps` files are kept.
+    """
+
+    def __init__(self, threshold_ms=PROFILE_SLOW_MS, interval=PROFILE_SAMPLE_INTERVAL, out_dir=PROFILE_DIR, max_dumps=PROFILE_MAX_DUMPS):
+        self.threshold_ms = threshold_ms
+        self.interval = interval
+        self.out_dir = out_dir
+        self.max_dumps = max_dumps
+        self.enabled = False
+        self.dumps = deque()
+        self.samples_taken = 0
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        # A worker forked from serve.py's master has no sampling thread of its own
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+        if threshold_ms > 0:
+            self.enable(threshold_ms)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._active.clear()
+        self._thread = None
+        if self.enabled:
+            self.enable()
+
+    def enable(self, threshold_ms=None):
+        with self._lock:
+            if threshold_ms is not None:
+                self.threshold_ms = threshold_ms
+            self.enabled = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample_loop, name='request-profiler', daemon=True)
+                self._thread.start()
+
+    def disable(self):
+        with self._lock:
+            self.enabled = False
+            self._active.clear()
+
+    def begin(self):
+        if self.enabled:
+            with self._lock:
+                self._active[threading.get_ident()] = Counter()
+
+    def end(self, label, seconds):
+        """Stop sampling the current thread; dump its stacks if the request was slow"""
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+        if samples and seconds * 1000 >= self.threshold_ms:
+            try:
+                self._dump(label, seconds, samples)
+            except OSError as e:
+                print(f"Profiler dump error: {e}")
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self.enabled:
+                    self._thread = None
+                    return
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for ident, samples in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        samples[collapse_stack(frame)] += 1
+                        self.samples_taken += 1
+
+    def _dump(self, label, seconds, samples):
+        os.makedirs(self.out_dir, exist_ok=True)
+        name = re.sub(r'[^A-Za-z0-9]+', '_', label).strip('_')
+        path = os.path.join(self.out_dir, f"{int(time.time() * 1000)}-{name}-{int(seconds * 1000)}ms.folded")
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        self.dumps.append(path)
+        while len(self.dumps) > self.max_dumps:
+            try:
+                os.remove(self.dumps.popleft())
+            except OSError:
+                pass
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'threshold_ms': self.threshold_ms,
+            'interval_s': self.interval,
+            'samples_taken': self.samples_taken,
+            'dumps': list(self.dumps)[-10:]
+        }
+
+
+profiler = SlowRequestProfiler()
+
+
+def process_snapshot():
+    """This process's request, stage, upstream and profiler metrics as plain JSON-ready data"""
+    return {
+        'pid': os.getpid(),
+        'started_at': metrics.started_at,
+        'requests': [[method, route, status, histogram.snapshot()] for (method, route, status), histogram in list(metrics.requests.items())],
+        'stages': {name: histogram.snapshot() for name, histogram in list(metrics.stages.items())},
+        'upstreams': {
+            name: {'latency': stats['latency'], 'errors': stats['errors'], 'circuit_open': int(stats['circuit'] == 'open')}
+            for name, stats in upstream_stats().items()
+        },
+        'profiler_samples': profiler.samples_taken
+    }
+
+
+class WorkerSnapshots:
+    """Metric snapshots of every worker of one server, exchanged through files in a shared directory.
+
+    Each worker rewrites its own worker-<pid>.json every `interval` seconds,
+    so whichever worker answers /metrics can report them all; its own entry
+    is always current, the others are at most `interval` seconds old. Without
+    a directory only the calling process is reported.
+    """
+
+    def __init__(self, directory=METRICS_DIR, interval=METRICS_SNAPSHOT_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def path(directory, pid):
+        return os.path.join(directory, f"worker-{pid}.json")
+
+    def prepare(self):
+        """Create the directory, or empty it of snapshots an earlier server left behind"""
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if name.startswith('worker-') and name.endswith('.json'):
+                os.remove(os.path.join(self.directory, name))
+
+    def start(self):
+        """Start writing this process's snapshot; call it after forking"""
+        if not self.directory or self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._write_loop, name='metrics-snapshot', daemon=True)
+                self._thread.start()
+
+    def _write_loop(self):
+        while True:
+            try:
+                self.write(process_snapshot())
+            except OSError as e:
+                print(f"Metrics snapshot error: {e}")
+            time.sleep(self.interval)
+
+    def write(self, snapshot):
+        # Readers must never see a half-written file, so write beside it and rename over it
+        f = tempfile.NamedTemporaryFile('w', dir=self.directory, prefix='.worker-', suffix='.tmp', delete=False)
+        try:
+            with f:
+                json.dump(snapshot, f)
+            os.replace(f.name, self.path(self.directory, snapshot['pid']))
+        except BaseException:
+            os.unlink(f.name)
+            raise
+
+    def collect(self):
+        """Snapshots of every worker, with this process's taken now"""
+        own = process_snapshot()
+        if not self.directory:
+            return [own]
+        snapshots = [own]
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return snapshots
+        for name in names:
+            if not (name.startswith('worker-') and name.endswith('.json')) or name == f"worker-{own['pid']}.json":
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                # Removed by the master as its worker exited
+                continue
+        return snapshots
+
+
+worker_snapshots = WorkerSnapshots()
+
+
+def begin_request(profile=True):
+    """Start timing a request and collecting its stages; pass the result to end_request.
+
+    Requests sharing a thread (async handlers on the event loop) pass
+    profile=False, since the profiler samples stacks per thread.
+    """
+    stages = {}
+    token = _request_stages.set(stages)
+    if profile:
+        profiler.begin()
+    return time.perf_counter(), token, stages, profile
+
+
+def end_request(state, method, route, status):
+    """Record a finished request; returns its duration and stage breakdown"""
+    start, token, stages, profile = state
+    seconds = time.perf_counter() - start
+    metrics.observe_request(method, route, status, seconds)
+    if profile:
+        profiler.end(f"{method} {route}", seconds)
+    try:
+        _request_stages.reset(token)
+    except ValueError:
+        # Finished in a different context from the one it started in
+        _request_stages.set(None)
+    return seconds, stages
+
+
+def server_timing(seconds, stages):
+    """Server-Timing header value (milliseconds) for a request's stage breakdown"""
+    entries = [f"{re.sub(r'[^A-Za-z0-9_-]', '_', name)};dur={value * 1000:.1f}" for name, value in stages.items()]
+    entries.append(f"total;dur={seconds * 1000:.1f}")
+    return ', '.join(entries)
+
+
+def instrument_flask(app):
+    """Time every Flask request per route and report its stages in a Server-Timing header"""
+    from flask import g, request
+
+    def route_label():
+        return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+    @app.before_request
+    def begin_request_timer():
+        g.request_timer = begin_request()
+
+    @app.after_request
+    def end_request_timer(response):
+        state = g.pop('request_timer', None)
+        if state is not None:
+            seconds, stages = end_request(state, request.method, route_label(), response.status_code)
+            response.headers['Server-Timing'] = server_timing(seconds, stages)
+        return response
+
+    @app.teardown_request
+    def abort_request_timer(exc):
+        state = g.pop('request_timer', None)
+        if state is not None:
+            end_request(state, request.method, route_label(), 500)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _histogram_lines(name, labels, snapshot):
+    prefix = ','.join(f'{key}="{_label(value)}"' for key, value in labels.items())
+    separator = ',' if prefix else ''
+    lines = [f'{name}_bucket{{{prefix}{separator}le="{bound}"}} {count}' for bound, count in snapshot['buckets']]
+    lines.append(f'{name}_sum{{{prefix}}} {snapshot["sum"]}')
+    lines.append(f'{name}_count{{{prefix}}} {snapshot["count"]}')
+    return lines
+
+
+def _merge_histograms(items):
+    """Sum (key, snapshot) histograms that share bucket bounds, per key"""
+    merged = {}
+    for key, snapshot in items:
+        total = merged.get(key)
+        if total is None:
+            merged[key] = {'buckets': [list(bucket) for bucket in snapshot['buckets']], 'sum': snapshot['sum'], 'count': snapshot['count']}
+            continue
+        for bucket, (_, count) in zip(total['buckets'], snapshot['buckets']):
+            bucket[1] += count
+        total['sum'] = round(total['sum'] + snapshot['sum'], 6)
+        total['count'] += snapshot['count']
+    return merged
+
+
+def render_metrics():
+    """Prometheus text exposition of request, stage and upstream metrics, summed over every worker"""
+    snapshots = worker_snapshots.collect()
+    lines = [
+        '# HELP http_request_duration_seconds Flask and ASGI request latency by route',
+        '# TYPE http_request_duration_seconds histogram'
+    ]
+    requests = _merge_histograms((tuple(entry[:3]), entry[3]) for snapshot in snapshots for entry in snapshot['requests'])
+    for (method, route, status), histogram in sorted(requests.items()):
+        lines += _histogram_lines('http_request_duration_seconds', {'method': method, 'route': route, 'status': status}, histogram)
+
+    lines += [
+        '# HELP stage_duration_seconds Time spent in instrumented stages (upstream calls, ML, Mongo commands)',
+        '# TYPE stage_duration_seconds histogram'
+    ]
+    stages = _merge_histograms(item for snapshot in snapshots for item in snapshot['stages'].items())
+    for name, histogram in sorted(stages.items()):
+        lines += _histogram_lines('stage_duration_seconds', {'stage': name}, histogram)
+
+    upstreams = [item for snapshot in snapshots for item in snapshot['upstreams'].items()]
+    names = sorted({name for name, _ in upstreams})
+    latency = _merge_histograms((name, stats['latency']) for name, stats in upstreams)
+    lines += [
+        '# HELP upstream_request_duration_seconds Outbound HTTP latency per upstream attempt',
+        '# TYPE upstream_request_duration_seconds histogram'
+    ]
+    for name in names:
+        lines += _histogram_lines('upstream_request_duration_seconds', {'upstream': name}, latency[name])
+    lines += ['# HELP upstream_errors_total Outbound calls that failed after retries', '# TYPE upstream_errors_total counter']
+    lines += [f'upstream_errors_total{{upstream="{name}"}} {sum(stats["errors"] for n, stats in upstreams if n == name)}' for name in names]
+    # Each worker has its own breaker; report the number of workers whose circuit is open
+    lines += ['# HELP upstream_circuit_open Workers whose circuit breaker for the upstream is open', '# TYPE upstream_circuit_open gauge']
+    lines += [f'upstream_circuit_open{{upstream="{name}"}} {sum(stats["circuit_open"] for n, stats in upstreams if n == name)}' for name in names]
+
+    lines += [
+        '# HELP process_start_time_seconds Start time of the earliest reporting worker since the epoch',
+        '# TYPE process_start_time_seconds gauge',
+        f'process_start_time_seconds {min(snapshot["started_at"] for snapshot in snapshots)}',
+        '# HELP metrics_workers Worker processes whose metrics are included',
+        '# TYPE metrics_workers gauge',
+        f'metrics_workers {len(snapshots)}',
+        '# HELP profiler_samples_total Stack samples taken by the slow-request profiler',
+        '# TYPE profiler_samples_total counter',
+        f'profiler_samples_total {sum(snapshot["profiler_samples"] for snapshot in snapshots)}'
+    ]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,109 @@
+import json
+import os
+from collections import deque
+
+CHATBOT_RULES_PATH = os.getenv('CHATBOT_RULES_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chatbot_rules.json'))
+
+
+class AhoCorasick:
+    """Multi-pattern matcher: one pass over the text finds every pattern occurrence"""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+
+        for index, pattern in enumerate(patterns):
+            state = 0
+            for ch in pattern:
+                next_state = self.goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][ch] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                state = next_state
+            self.out[state].append(index)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(ch, 0)
+                self.out[next_state] = self.out[next_state] + self.out[self.fail[next_state]]
+
+    def finditer(self, text):
+        """Yield (end_index, pattern_index) for every occurrence; end_index is exclusive"""
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for index in out[state]:
+                yield i + 1, index
+
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == '_'
+
+
+class IntentEngine:
+    """Compiled rule-based chatbot: keyword rules loaded from a data file and matched in one pass.
+
+    A keyword matches whole words only; a trailing '*' ("route*") also matches
+    longer words that start with it ("routes"). Each intent
+    scores the sum of its matched keyword weights, and the best intent is picked
+    by (priority, score, position in the rules file).
+    """
+
+    def __init__(self, intents, default_response, empty_response):
+        self.intents = intents
+        self.default_response = default_response
+        self.empty_response = empty_response
+
+        self.keywords = []
+        for intent_index, intent in enumerate(intents):
+            for keyword in intent['keywords']:
+                if isinstance(keyword, str):
+                    keyword = {'pattern': keyword}
+                pattern = keyword['pattern'].lower()
+                prefix = pattern.endswith('*')
+                self.keywords.append((pattern.rstrip('*'), prefix, keyword.get('weight', 1.0), intent_index))
+
+        self.matcher = AhoCorasick([pattern for pattern, _, _, _ in self.keywords])
+
+    @classmethod
+    def from_file(cls, path=CHATBOT_RULES_PATH):
+        with open(path, encoding='utf-8') as f:
+            rules = json.load(f)
+        return cls(rules['intents'], rules['default_response'], rules['empty_response'])
+
+    def match(self, message):
+        """Best matching intent for a message, or None"""
+        text = message.lower()
+        scores = {}
+        for end, keyword_index in self.matcher.finditer(text):
+            pattern, prefix, weight, intent_index = self.keywords[keyword_index]
+            start = end - len(pattern)
+            if start > 0 and _is_word_char(text[start - 1]):
+                continue
+            if not prefix and end < len(text) and _is_word_char(text[end]):
+                continue
+            scores[intent_index] = scores.get(intent_index, 0.0) + weight
+
+        if not scores:
+            return None
+        best = max(scores, key=lambda i: (self.intents[i].get('priority', 0), scores[i], -i))
+        return self.intents[best]
+
+    def respond(self, message):
+        if not message:
+            return self.empty_response
+        intent = self.match(message)
+        return intent['response'] if intent else self.default_response
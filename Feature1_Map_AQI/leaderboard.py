@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+
+from sortedcontainers import SortedList
+
+from write_behind import APPLIED_BATCHES_FIELD
+
+LEADERBOARD_SIZE = int(os.getenv('LEADERBOARD_SIZE', 10))
+LEADERBOARD_REBUILD_INTERVAL = float(os.getenv('LEADERBOARD_REBUILD_INTERVAL', 300))
+
+LEADER_FIELDS = ("username", "eco_points", "green_score", "co2_saved", "streak_days")
+
+
+class Leaderboard:
+    """In-memory eco_points ranking with incremental updates and rank lookups.
+
+    Entries are kept in a SortedList keyed on (-eco_points, username), so an
+    update, a rank lookup and reaching the top K are all logarithmic. Mongo is
+    only read on a cold start, and again every LEADERBOARD_REBUILD_INTERVAL
+    seconds to pick up writes made by other worker processes.
+
+    `pending` returns the (token, {user_id: increments}) trip batches this
+    process's TripWriter has not yet confirmed as written. A rebuild adds them
+    back to every user whose APPLIED_BATCHES_FIELD lacks their token, so points
+    still queued for the database are not dropped from the board.
+    """
+
+    def __init__(self, rebuild_interval=LEADERBOARD_REBUILD_INTERVAL, pending=None):
+        self.rebuild_interval = rebuild_interval
+        self.pending = pending
+        self.users = {}
+        self._order = SortedList()
+        self._built_at = None
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _key(entry):
+        return (-entry['eco_points'], entry['username'])
+
+    @property
+    def stale(self):
+        return self._built_at is None or time.monotonic() - self._built_at > self.rebuild_interval
+
+    def rebuild(self, collection):
+        """Reload every user from Mongo, walking the eco_points index, then re-apply unwritten trip points"""
+        projection = {field: 1 for field in LEADER_FIELDS}
+        projection[APPLIED_BATCHES_FIELD] = 1
+        users = {}
+        by_id = {}
+        for doc in collection.find({}, projection).sort("eco_points", -1):
+            entry = {field: doc.get(field, 0) for field in LEADER_FIELDS}
+            entry['id'] = str(doc['_id'])
+            users[entry['username']] = entry
+            by_id[doc['_id']] = (entry, set(doc.get(APPLIED_BATCHES_FIELD, ())))
+
+        with self._lock:
+            for token, increments in (self.pending() if self.pending else ()):
+                for user_id, counters in increments.items():
+                    entry, applied = by_id.get(user_id, (None, ()))
+                    if entry is None or token in applied:
+                        continue
+                    for field, amount in counters.items():
+                        if field in entry and field != 'username':
+                            entry[field] += amount
+            self.users = users
+            self._order = SortedList(self._key(entry) for entry in users.values())
+            self._built_at = time.monotonic()
+
+    def ensure_fresh(self, collection):
+        if self.stale:
+            self.rebuild(collection)
+
+    def upsert(self, user):
+        """Add or replace a user's entry (e.g. right after the user is created)"""
+        entry = {field: user.get(field, 0) for field in LEADER_FIELDS}
+        entry['id'] = str(user.get('id', user.get('_id', '')))
+        with self._lock:
+            previous = self.users.get(entry['username'])
+            if previous is not None:
+                self._order.discard(self._key(previous))
+            self.users[entry['username']] = entry
+            self._order.add(self._key(entry))
+
+    def apply_increment(self, username, **increments):
+        """Mirror a Mongo $inc on a user's counters and reposition them"""
+        with self._lock:
+            entry = self.users.get(username)
+            if entry is None:
+                return
+            self._order.discard(self._key(entry))
+            for field, amount in increments.items():
+                entry[field] = entry.get(field, 0) + amount
+            self._order.add(self._key(entry))
+
+    def top(self, k=LEADERBOARD_SIZE):
+        with self._lock:
+            return [dict(self.users[username]) for _, username in self._order.islice(0, k)]
+
+    def rank(self, username):
+        """1-based rank of a user and a copy of their entry, or None if they are not on the board"""
+        with self._lock:
+            entry = self.users.get(username)
+            if entry is None:
+                return None
+            # Users tied on points share the best rank among them
+            return self._order.bisect_left((-entry['eco_points'], '')) + 1, dict(entry)
+
+    def __len__(self):
+        return len(self._order)
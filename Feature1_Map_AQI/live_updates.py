@@ -0,0 +1,168 @@
+import os
+import queue
+import threading
+import time
+
+LIVE_PUSH_INTERVAL = float(os.getenv('LIVE_PUSH_INTERVAL', 1.0))
+LIVE_KEEPALIVE = float(os.getenv('LIVE_KEEPALIVE', 15))
+LIVE_QUEUE_SIZE = int(os.getenv('LIVE_QUEUE_SIZE', 100))
+LIVE_MAX_SUBSCRIBERS = int(os.getenv('LIVE_MAX_SUBSCRIBERS', 1000))
+
+
+def sse_frame(data, event=None):
+    """One Server-Sent Events frame carrying `data` (encoded JSON) on a single data: line"""
+    # A line break would end the data: line early; outside JSON strings it is only whitespace
+    data = data.replace('\r', ' ').replace('\n', ' ')
+    return (f"event: {event}\n" if event else '') + f"data: {data}\n\n"
+
+
+class SubscriberLimitError(Exception):
+    """Raised when a worker already holds LIVE_MAX_SUBSCRIBERS streams"""
+
+
+class Subscription:
+    """One connected client: a bounded queue of encoded frames for the topics it follows"""
+
+    def __init__(self, topics, size=LIVE_QUEUE_SIZE):
+        self.topics = topics
+        self.frames = queue.Queue(maxsize=size)
+        self.dropped = False
+        self.closed = False
+
+    def push(self, frame):
+        """Queue a frame; a client too slow to drain its queue is dropped so it reconnects and resyncs"""
+        try:
+            self.frames.put_nowait(frame)
+        except queue.Full:
+            self.dropped = True
+
+    def stream(self, keepalive=LIVE_KEEPALIVE):
+        """Yield frames as they are published, with keepalive comments in between"""
+        while not self.dropped and not self.closed:
+            try:
+                yield self.frames.get(timeout=keepalive)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+
+
+class LiveHub:
+    """Topic-based fan-out of dashboard updates to Server-Sent Events subscribers.
+
+    Ingested metrics only mark their tiles dirty. Every LIVE_PUSH_INTERVAL
+    seconds a background thread computes each dirty tile's metrics once,
+    keeps the fields that changed since the last push, encodes that delta once
+    and queues the same frame for every subscriber of the tile, so the cost
+    per tile does not grow with the number of clients or the ingest rate.
+
+    Subscribers live in the worker serving their stream, and each open stream
+    holds one of that worker's request threads, so max_subscribers should stay
+    below its thread count. Changes made on other workers reach the hub
+    through the app's EventBus.
+    """
+
+    def __init__(self, tile_metrics, encode, interval=LIVE_PUSH_INTERVAL, max_subscribers=LIVE_MAX_SUBSCRIBERS):
+        self.tile_metrics = tile_metrics
+        self.encode = encode
+        self.interval = interval
+        self.max_subscribers = max_subscribers
+        self.topics = {}
+        self.subscribers = 0
+        self.published = 0
+        self._dirty = set()
+        self._last = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def frame(self, event, payload):
+        return sse_frame(self.encode(payload), event)
+
+    def subscribe(self, topics):
+        with self._lock:
+            if self.subscribers >= self.max_subscribers:
+                raise SubscriberLimitError(f"At most {self.max_subscribers} live streams per worker")
+            subscription = Subscription(topics)
+            for topic in topics:
+                self.topics.setdefault(topic, set()).add(subscription)
+            self.subscribers += 1
+        self.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a subscription; safe to call more than once"""
+        with self._lock:
+            if subscription.closed:
+                return
+            subscription.closed = True
+            for topic in subscription.topics:
+                subscribers = self.topics.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.topics[topic]
+            self.subscribers -= 1
+
+    def publish(self, topic, event, payload):
+        """Encode one update and queue it for every subscriber of a topic"""
+        with self._lock:
+            subscribers = list(self.topics.get(topic, ()))
+        if not subscribers:
+            return
+        frame = self.frame(event, payload)
+        for subscription in subscribers:
+            subscription.push(frame)
+        self.published += 1
+
+    def mark_tiles(self, tiles):
+        """MetricStore listener: schedule a push for tiles somebody is watching"""
+        with self._lock:
+            self._dirty.update(tile for tile in tiles if f'tile:{tile}' in self.topics)
+
+    def snapshot(self, tile):
+        """Current metrics of a tile, recorded as the baseline later deltas are taken against"""
+        metrics = self.tile_metrics(tile)
+        with self._lock:
+            last = self._last.setdefault(tile, dict(metrics))
+            if last != metrics:
+                # Older subscribers have not seen these values yet
+                self._dirty.add(tile)
+        return metrics
+
+    def flush(self):
+        """Push the changed metrics of every dirty tile"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        for tile in dirty:
+            metrics = self.tile_metrics(tile)
+            with self._lock:
+                last = self._last.setdefault(tile, {})
+                delta = {name: value for name, value in metrics.items() if last.get(name) != value}
+                last.update(delta)
+            if delta:
+                self.publish(f'tile:{tile}', 'metrics', dict(delta, tile=tile))
+
+        # Forget baselines of tiles nobody watches any more
+        with self._lock:
+            for tile in [tile for tile in self._last if f'tile:{tile}' not in self.topics]:
+                del self._last[tile]
+
+    def start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._push_loop, name='live-push', daemon=True)
+                    self._thread.start()
+
+    def _push_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Live update push error: {e}")
+
+    def stats(self):
+        return {
+            'subscribers': self.subscribers,
+            'topics': len(self.topics),
+            'published': self.published
+        }
@@ -0,0 +1,215 @@
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from geo_cache import TTLCache
+from timeseries import METRIC_NAMES
+
+MAP_LAYER_CELLS_PER_TILE = int(os.getenv('MAP_LAYER_CELLS_PER_TILE', 8))
+MAP_LAYER_TIME_BUCKET = int(os.getenv('MAP_LAYER_TIME_BUCKET', 60))
+MAP_LAYER_MAX_TILES = int(os.getenv('MAP_LAYER_MAX_TILES', 64))
+MAP_LAYER_CACHE_ENTRIES = int(os.getenv('MAP_LAYER_CACHE_ENTRIES', 20000))
+MAP_LAYER_MAX_ZOOM = 20
+
+MAP_LAYER_SHAPES = ('grid', 'hex')
+MERCATOR_MAX_LAT = 85.0511287798
+
+# Circumradius of a pointy-top hexagon with the area of one square grid cell
+HEX_RADIUS = math.sqrt(2 / (3 * math.sqrt(3)))
+HEX_OUTLINE = [(HEX_RADIUS * math.cos(math.radians(60 * k - 30)), HEX_RADIUS * math.sin(math.radians(60 * k - 30))) for k in range(7)]
+GRID_OUTLINE = [(-0.5, -0.5), (0.5, -0.5), (0.5, 0.5), (-0.5, 0.5), (-0.5, -0.5)]
+
+
+def mercator_xy(lats, lons, zoom):
+    """Fractional Web Mercator tile coordinates (x east, y south) of points at a zoom level"""
+    scale = 2.0 ** zoom
+    lat = np.radians(np.clip(np.asarray(lats, dtype=np.float64), -MERCATOR_MAX_LAT, MERCATOR_MAX_LAT))
+    x = (np.asarray(lons, dtype=np.float64) + 180.0) / 360.0 * scale
+    y = (1.0 - np.arcsinh(np.tan(lat)) / np.pi) / 2.0 * scale
+    return x, y
+
+
+def mercator_lonlat(x, y, zoom):
+    """Inverse of mercator_xy: (lon, lat) of fractional tile coordinates"""
+    scale = 2.0 ** zoom
+    lon = np.asarray(x, dtype=np.float64) / scale * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * np.asarray(y, dtype=np.float64) / scale))))
+    return lon, lat
+
+
+def covering_tiles(bbox, zoom):
+    """Column and row ranges of the tiles at a zoom level overlapping a (west, south, east, north) bounding box"""
+    west, south, east, north = bbox
+    (x0, x1), (y0, y1) = mercator_xy([north, south], [west, east], zoom)
+    last = 2 ** zoom - 1
+    xs = range(max(int(math.floor(x0)), 0), min(int(math.floor(x1)), last) + 1)
+    ys = range(max(int(math.floor(y0)), 0), min(int(math.floor(y1)), last) + 1)
+    return xs, ys
+
+
+def bin_cells(u, v, shape):
+    """Integer cell keys (N, 2) of points given in cell units, for square or hexagonal cells"""
+    if shape == 'grid':
+        return np.column_stack([np.floor(u), np.floor(v)]).astype(np.int64)
+
+    # Axial hex coordinates, rounded through cube coordinates
+    q = (math.sqrt(3) / 3 * u - v / 3) / HEX_RADIUS
+    r = (2 / 3 * v) / HEX_RADIUS
+    rq, rr, rs = np.round(q), np.round(r), np.round(-q - r)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs + q + r)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    q_key = np.where(fix_q, -rr - rs, rq)
+    r_key = np.where(fix_r, -rq - rs, rr)
+    return np.column_stack([q_key, r_key]).astype(np.int64)
+
+
+def cell_centers(keys, shape):
+    """Centers (u, v), in cell units, of cell keys from bin_cells"""
+    if shape == 'grid':
+        return keys[:, 0] + 0.5, keys[:, 1] + 0.5
+    return HEX_RADIUS * math.sqrt(3) * (keys[:, 0] + keys[:, 1] / 2), HEX_RADIUS * 1.5 * keys[:, 1]
+
+
+class MapLayers:
+    """Pre-aggregated map layers: point clusters and AQI/noise/traffic heat cells.
+
+    A bounding box at a zoom level is answered with the Web Mercator tiles
+    covering it. Each tile is cut into cells_per_tile x cells_per_tile square
+    (or equal-area hexagonal) cells; points are binned into them with NumPy
+    and every tile's features are cached per (shape, zoom, tile, time bucket),
+    so panning only aggregates the tiles that newly came into view. Tiles
+    missing from the cache are computed together from one read of their
+    points.
+    """
+
+    def __init__(self, points, heat, cells_per_tile=MAP_LAYER_CELLS_PER_TILE, time_bucket=MAP_LAYER_TIME_BUCKET,
+                 max_tiles=MAP_LAYER_MAX_TILES, max_entries=MAP_LAYER_CACHE_ENTRIES):
+        # points(south, west, north, east) -> {layer: (N, 2) lat/lon array}
+        self.points = points
+        # heat() -> (coords, count, total) as returned by MetricStore.latest_totals
+        self.heat = heat
+        self.cells_per_tile = cells_per_tile
+        self.time_bucket = time_bucket
+        self.max_tiles = max_tiles
+        self.cache = TTLCache(max_entries=max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def layer(self, bbox, zoom, shape='grid', now=None):
+        """Cluster and heat FeatureCollections for the tiles covering a (west, south, east, north) bbox"""
+        xs, ys = covering_tiles(bbox, zoom)
+        if len(xs) * len(ys) > self.max_tiles:
+            raise ValueError(f'bbox covers {len(xs) * len(ys)} tiles at zoom {zoom}; zoom in to at most {self.max_tiles}')
+        tiles = [(x, y) for y in ys for x in xs]
+        bucket = int((time.time() if now is None else now) // self.time_bucket)
+
+        results, missing = {}, []
+        for tile in tiles:
+            cached = self.cache.get((shape, zoom, tile, bucket))
+            if cached is None:
+                missing.append(tile)
+            else:
+                results[tile] = cached
+        if missing:
+            computed = self._compute(missing, zoom, shape)
+            for tile in missing:
+                results[tile] = computed.get(tile, {'clusters': [], 'heat': []})
+                self.cache.set((shape, zoom, tile, bucket), results[tile], self.time_bucket)
+        with self._lock:
+            self.hits += len(tiles) - len(missing)
+            self.misses += len(missing)
+
+        return {
+            'zoom': zoom,
+            'shape': shape,
+            'tiles': len(tiles),
+            'cached_tiles': len(tiles) - len(missing),
+            'clusters': {'type': 'FeatureCollection', 'features': [f for tile in tiles for f in results[tile]['clusters']]},
+            'heat': {'type': 'FeatureCollection', 'features': [f for tile in tiles for f in results[tile]['heat']]}
+        }
+
+    def _compute(self, tiles, zoom, shape):
+        """Features of each tile in `tiles`, from one read of the points around all of them"""
+        n = self.cells_per_tile
+        xs, ys = [x for x, _ in tiles], [y for _, y in tiles]
+        # A cell of margin so hexagons centered in a tile also collect points just across its edge
+        (west, east), (north, south) = mercator_lonlat(
+            [min(xs) - 1 / n, max(xs) + 1 + 1 / n], [min(ys) - 1 / n, max(ys) + 1 + 1 / n], zoom
+        )
+        wanted = set(tiles)
+        features = {}
+
+        layers = self.points(float(south), float(max(west, -180.0)), float(north), float(min(east, 180.0)))
+        names = list(layers)
+        coords = np.concatenate([layers[name] for name in names]) if names else np.empty((0, 2))
+        if len(coords):
+            layer_ids = np.repeat(np.arange(len(names)), [len(layers[name]) for name in names])
+            keys, inverse, tile_of = self._bin(coords, zoom, shape)
+            k = len(keys)
+            counts = np.bincount(inverse * len(names) + layer_ids, minlength=k * len(names)).reshape(k, len(names))
+            total = counts.sum(axis=1)
+            # Clusters sit at the mean of their points rather than the cell center
+            lat = np.bincount(inverse, weights=coords[:, 0], minlength=k) / total
+            lon = np.bincount(inverse, weights=coords[:, 1], minlength=k) / total
+            for i in range(k):
+                tile = tile_of[i]
+                if tile in wanted:
+                    properties = {'count': int(total[i])}
+                    properties.update((name, int(counts[i, j])) for j, name in enumerate(names))
+                    features.setdefault(tile, {'clusters': [], 'heat': []})['clusters'].append({
+                        'type': 'Feature',
+                        'geometry': {'type': 'Point', 'coordinates': [round(float(lon[i]), 6), round(float(lat[i]), 6)]},
+                        'properties': properties
+                    })
+
+        centers, count, metric_sum = self.heat()
+        inside = (centers[:, 0] >= south) & (centers[:, 0] <= north) & (centers[:, 1] >= west) & (centers[:, 1] <= east)
+        if inside.any():
+            centers, count, metric_sum = centers[inside], count[inside], metric_sum[inside]
+            keys, inverse, tile_of = self._bin(centers, zoom, shape)
+            k = len(keys)
+            # Sample-weighted averages: sums and counts are added before dividing
+            cell_count = np.stack([np.bincount(inverse, weights=count[:, j], minlength=k) for j in range(len(METRIC_NAMES))], axis=1)
+            cell_sum = np.stack([np.bincount(inverse, weights=metric_sum[:, j], minlength=k) for j in range(len(METRIC_NAMES))], axis=1)
+            outlines = self._outlines(*cell_centers(keys, shape), zoom, shape)
+            for i in range(k):
+                tile = tile_of[i]
+                if tile in wanted:
+                    properties = {
+                        name: int(round(cell_sum[i, j] / cell_count[i, j])) if cell_count[i, j] else None
+                        for j, name in enumerate(METRIC_NAMES)
+                    }
+                    properties['samples'] = int(cell_count[i].max())
+                    features.setdefault(tile, {'clusters': [], 'heat': []})['heat'].append({
+                        'type': 'Feature',
+                        'geometry': {'type': 'Polygon', 'coordinates': [outlines[i]]},
+                        'properties': properties
+                    })
+        return features
+
+    def _bin(self, coords, zoom, shape):
+        """Unique cell keys of lat/lon points, each point's cell index and each cell's tile"""
+        n = self.cells_per_tile
+        x, y = mercator_xy(coords[:, 0], coords[:, 1], zoom)
+        cells = bin_cells(x * n, y * n, shape)
+        # Packed into one int64 per cell, as np.unique over rows is several times slower
+        packed, inverse = np.unique((cells[:, 0] + 2 ** 30) << 32 | (cells[:, 1] + 2 ** 30), return_inverse=True)
+        keys = np.column_stack([(packed >> 32) - 2 ** 30, (packed & 0xFFFFFFFF) - 2 ** 30])
+        u, v = cell_centers(keys, shape)
+        tile_of = list(zip(np.floor(u / n).astype(int).tolist(), np.floor(v / n).astype(int).tolist()))
+        return keys, inverse.reshape(-1), tile_of
+
+    def _outlines(self, u, v, zoom, shape):
+        """Closed [lon, lat] rings of the cells centered at (u, v) in cell units"""
+        n = self.cells_per_tile
+        offsets = np.array(GRID_OUTLINE if shape == 'grid' else HEX_OUTLINE)
+        lon, lat = mercator_lonlat((u[:, None] + offsets[:, 0]) / n, (v[:, None] + offsets[:, 1]) / n, zoom)
+        return np.stack([lon, lat], axis=-1).round(6).tolist()
+
+    def stats(self):
+        return {'cached_tiles': len(self.cache), 'hits': self.hits, 'misses': self.misses}
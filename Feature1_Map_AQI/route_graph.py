@@ -0,0 +1,356 @@
+import heapq
+import math
+import os
+import sys
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from distance import haversine_km, _haversine_scalar_km
+from shared_state import savez_atomic, shared_arrays
+
+ROUTE_GRAPH_PATH = os.getenv('ROUTE_GRAPH_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'route_graph.npz'))
+ROUTE_MAX_SNAP_KM = float(os.getenv('ROUTE_MAX_SNAP_KM', 1.0))
+ROUTE_BATCH_ORIGIN_CHUNK = 32
+
+# Default speeds (km/h) for OSM highway classes that cars can use
+ROAD_SPEEDS = {
+    'motorway': 100, 'motorway_link': 60, 'trunk': 80, 'trunk_link': 50,
+    'primary': 60, 'primary_link': 40, 'secondary': 50, 'secondary_link': 35,
+    'tertiary': 40, 'tertiary_link': 30, 'unclassified': 30, 'residential': 25,
+    'living_street': 10, 'service': 15, 'road': 30
+}
+
+ROUTE_COSTS = ('eco', 'fastest', 'shortest')
+
+
+def co2_grams_per_km(speed_kmh):
+    """Approximate car CO2 emissions per km at a cruising speed (lowest around 40-45 km/h)"""
+    speed_kmh = np.maximum(speed_kmh, 5.0)
+    return 95.0 + 1800.0 / speed_kmh + 0.012 * speed_kmh ** 2
+
+
+MIN_CO2_GRAMS_PER_KM = float(co2_grams_per_km(np.cbrt(1800.0 / 0.024)))
+
+
+def _parse_speed(value, default):
+    try:
+        speed = float(value.split()[0])
+    except (AttributeError, ValueError, IndexError):
+        return default
+    return speed * 1.609 if 'mph' in value else speed
+
+
+def parse_osm(path):
+    """Road segments from an OSM XML extract: node lat/lon arrays plus directed (u, v, speed) edge arrays"""
+    node_index = {}
+    lats, lons = [], []
+    edges_u, edges_v, speeds = [], [], []
+
+    root = None
+    for event, elem in ET.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            continue
+        if elem.tag == 'node':
+            node_index[elem.get('id')] = len(lats)
+            lats.append(float(elem.get('lat')))
+            lons.append(float(elem.get('lon')))
+            elem.clear()
+        elif elem.tag == 'way':
+            tags = {tag.get('k'): tag.get('v') for tag in elem.iter('tag')}
+            highway = tags.get('highway')
+            if highway in ROAD_SPEEDS:
+                refs = [node_index[nd.get('ref')] for nd in elem.iter('nd') if nd.get('ref') in node_index]
+                speed = _parse_speed(tags.get('maxspeed'), ROAD_SPEEDS[highway])
+                oneway = tags.get('oneway', 'no')
+                if tags.get('junction') == 'roundabout' or highway.startswith('motorway'):
+                    oneway = tags.get('oneway', 'yes')
+                if oneway == '-1':
+                    refs.reverse()
+                for u, v in zip(refs, refs[1:]):
+                    edges_u.append(u)
+                    edges_v.append(v)
+                    speeds.append(speed)
+                    if oneway not in ('yes', 'true', '1', '-1'):
+                        edges_u.append(v)
+                        edges_v.append(u)
+                        speeds.append(speed)
+            elem.clear()
+        elif elem.tag == 'relation':
+            elem.clear()
+        else:
+            continue
+        # Cleared elements stay attached to the root; drop them so memory does not grow with the file
+        root.clear()
+
+    return (np.array(lats), np.array(lons),
+            np.array(edges_u, dtype=np.int64), np.array(edges_v, dtype=np.int64), np.array(speeds, dtype=np.float64))
+
+
+class RouteGraph:
+    """Road graph in CSR form (indptr/indices plus per-edge length and travel time arrays).
+
+    Single routes run A* on the chosen cost; batches of origin/destination
+    pairs run scipy's C Dijkstra once per distinct origin.
+    """
+
+    def __init__(self, lat, lon, indptr, indices, length_m, time_s):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.length_m = np.asarray(length_m, dtype=np.float64)
+        self.time_s = np.asarray(time_s, dtype=np.float64)
+        speed_kmh = self.length_m / np.maximum(self.time_s, 1e-6) * 3.6
+        self.costs = {
+            'eco': self.length_m / 1000 * co2_grams_per_km(speed_kmh),
+            'fastest': self.time_s,
+            'shortest': self.length_m
+        }
+        self.max_speed_ms = float(np.max(self.length_m / np.maximum(self.time_s, 1e-6))) if len(self.time_s) else 1.0
+        self._lists = None
+        self._tree = None
+        self._scale = 1.0
+        self._csgraphs = {}
+
+    @classmethod
+    def from_edges(cls, lat, lon, u, v, speed_kmh):
+        """Build the CSR arrays from directed edges, dropping nodes no road touches"""
+        used = np.unique(np.concatenate([u, v]))
+        remap = np.full(len(lat), -1, dtype=np.int64)
+        remap[used] = np.arange(len(used))
+        u, v = remap[u], remap[v]
+        lat, lon = np.asarray(lat)[used], np.asarray(lon)[used]
+
+        length_m = haversine_km(lat[u], lon[u], lat[v], lon[v]) * 1000
+        time_s = length_m / (np.asarray(speed_kmh) / 3.6)
+
+        order = np.argsort(u, kind='stable')
+        indptr = np.zeros(len(used) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(u, minlength=len(used)), out=indptr[1:])
+        return cls(lat, lon, indptr, v[order], length_m[order], time_s[order])
+
+    @classmethod
+    def from_osm(cls, path):
+        return cls.from_edges(*parse_osm(path))
+
+    def save(self, path=ROUTE_GRAPH_PATH):
+        savez_atomic(path, lat=self.lat, lon=self.lon, indptr=self.indptr, indices=self.indices,
+                     length_m=self.length_m, time_s=self.time_s)
+
+    @classmethod
+    def load(cls, path=ROUTE_GRAPH_PATH):
+        with np.load(path) as data:
+            return cls(data['lat'], data['lon'], data['indptr'], data['indices'], data['length_m'], data['time_s'])
+
+    def share(self):
+        """Move the CSR and cost arrays into shared memory for workers forked afterwards"""
+        names = ('lat', 'lon', 'indptr', 'indices', 'length_m', 'time_s')
+        arrays = {name: getattr(self, name) for name in names}
+        arrays.update((f'cost_{name}', weights) for name, weights in self.costs.items())
+        arrays = shared_arrays(arrays, 'route_graph')
+        for name in names:
+            setattr(self, name, arrays[name])
+        self.costs = {name: arrays[f'cost_{name}'] for name in self.costs}
+        return self
+
+    @property
+    def node_count(self):
+        return len(self.lat)
+
+    @property
+    def edge_count(self):
+        return len(self.indices)
+
+    def prepare(self):
+        """Build the snapping KD-tree and the A* search lists ahead of the first route"""
+        if self._tree is None:
+            from scipy.spatial import cKDTree
+
+            # Equirectangular projection around the graph's mean latitude keeps the tree Euclidean
+            self._scale = math.cos(math.radians(float(self.lat.mean())))
+            self._tree = cKDTree(np.column_stack([self.lat, self.lon * self._scale]))
+        if self._lists is None:
+            # Plain lists are much faster than NumPy scalars inside the search loop
+            self._lists = (self.indptr.tolist(), self.indices.tolist(), self.lat.tolist(), self.lon.tolist(),
+                           {name: weights.tolist() for name, weights in self.costs.items()})
+        return self
+
+    def snap(self, lats, lons):
+        """Nearest graph node for each coordinate and its distance in km"""
+        self.prepare()
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        _, nodes = self._tree.query(np.column_stack([lats, lons * self._scale]))
+        return nodes, haversine_km(lats, lons, self.lat[nodes], self.lon[nodes])
+
+    def _heuristic_scale(self, cost):
+        """Lower bound on cost per km of straight-line distance, keeping A* admissible"""
+        if cost == 'eco':
+            return MIN_CO2_GRAMS_PER_KM
+        if cost == 'fastest':
+            return 1000 / self.max_speed_ms
+        return 1000.0
+
+    def astar(self, source, target, cost='eco'):
+        """Cheapest path as (node list, edge index list), or None if the target is unreachable"""
+        indptr, indices, lat, lon, costs = self.prepare()._lists
+        weights = costs[cost]
+        scale = self._heuristic_scale(cost)
+        target_lat, target_lon = lat[target], lon[target]
+
+        best = {source: 0.0}
+        previous = {source: (None, None)}
+        heap = [(0.0, 0.0, source)]
+        settled = set()
+        while heap:
+            _, g, node = heapq.heappop(heap)
+            if node == target:
+                break
+            if node in settled:
+                continue
+            settled.add(node)
+            for edge in range(indptr[node], indptr[node + 1]):
+                neighbor = indices[edge]
+                candidate = g + weights[edge]
+                if candidate < best.get(neighbor, math.inf):
+                    best[neighbor] = candidate
+                    previous[neighbor] = (node, edge)
+                    h = scale * _haversine_scalar_km(lat[neighbor], lon[neighbor], target_lat, target_lon)
+                    heapq.heappush(heap, (candidate + h, candidate, neighbor))
+        else:
+            return None
+
+        nodes, edges = [target], []
+        while previous[nodes[-1]][0] is not None:
+            node, edge = previous[nodes[-1]]
+            nodes.append(node)
+            edges.append(edge)
+        return nodes[::-1], edges[::-1]
+
+    def _path_totals(self, edges):
+        """Length (m), travel time (s) and CO2 (g) summed over a path's edges"""
+        edges = np.asarray(edges, dtype=np.int64)
+        length_m = float(self.length_m[edges].sum())
+        time_s = float(self.time_s[edges].sum())
+        co2_g = float(self.costs['eco'][edges].sum())
+        return length_m, time_s, co2_g
+
+    def route(self, start_lat, start_lon, end_lat, end_lon, route_type='eco'):
+        """Route in the TomTom calculateRoute response shape, or None if either end is off the graph"""
+        cost = route_type if route_type in ROUTE_COSTS else 'eco'
+        nodes, snapped_km = self.snap([start_lat, end_lat], [start_lon, end_lon])
+        if (snapped_km > ROUTE_MAX_SNAP_KM).any():
+            return None
+        found = self.astar(int(nodes[0]), int(nodes[1]), cost)
+        if found is None:
+            return None
+        path, edges = found
+        length_m, time_s, co2_g = self._path_totals(edges)
+
+        now = datetime.now()
+        return {
+            'routes': [{
+                'summary': {
+                    'lengthInMeters': int(length_m),
+                    'travelTimeInSeconds': int(time_s),
+                    'trafficDelayInSeconds': 0,
+                    'co2EmissionGrams': round(co2_g, 1),
+                    'departureTime': now.isoformat(),
+                    'arrivalTime': (now + timedelta(seconds=time_s)).isoformat()
+                },
+                'legs': [{
+                    'points': [{'latitude': float(self.lat[n]), 'longitude': float(self.lon[n])} for n in path]
+                }]
+            }],
+            'source': 'local_graph'
+        }
+
+    def _csgraph(self, cost):
+        """scipy CSR matrix for a cost keeping the cheapest of any parallel edges, plus u*n+v keys of its edges"""
+        cached = self._csgraphs.get(cost)
+        if cached is None:
+            from scipy.sparse import csr_matrix
+
+            n = self.node_count
+            u = np.repeat(np.arange(n), np.diff(self.indptr))
+            weights = self.costs[cost]
+            # Sorted by (u, v, weight), so the first edge of each (u, v) run is the cheapest
+            order = np.lexsort((weights, self.indices, u))
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = (u[order][1:] != u[order][:-1]) | (self.indices[order][1:] != self.indices[order][:-1])
+            edges = order[first]
+
+            indptr = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(np.bincount(u[edges], minlength=n), out=indptr[1:])
+            # scipy treats stored zeros as missing edges
+            graph = csr_matrix((np.maximum(weights[edges], 1e-9), self.indices[edges], indptr), shape=(n, n))
+            cached = self._csgraphs[cost] = (graph, u[edges] * n + self.indices[edges], edges)
+        return cached
+
+    def matrix(self, pairs, route_type='eco', include_points=False):
+        """Plan many (start_lat, start_lon, end_lat, end_lon) pairs; None for pairs that cannot be routed"""
+        from scipy.sparse.csgraph import dijkstra
+
+        cost = route_type if route_type in ROUTE_COSTS else 'eco'
+        pairs = np.asarray(pairs, dtype=np.float64).reshape(-1, 4)
+        sources, source_km = self.snap(pairs[:, 0], pairs[:, 1])
+        targets, target_km = self.snap(pairs[:, 2], pairs[:, 3])
+        on_graph = (source_km <= ROUTE_MAX_SNAP_KM) & (target_km <= ROUTE_MAX_SNAP_KM)
+
+        graph, edge_keys, edge_ids = self._csgraph(cost)
+        results = [None] * len(pairs)
+        origins = np.unique(sources[on_graph])
+        for start in range(0, len(origins), ROUTE_BATCH_ORIGIN_CHUNK):
+            chunk = origins[start:start + ROUTE_BATCH_ORIGIN_CHUNK]
+            _, predecessors = dijkstra(graph, directed=True, indices=chunk, return_predecessors=True)
+            row_of = {int(origin): row for row, origin in enumerate(chunk)}
+
+            for i in np.flatnonzero(on_graph & np.isin(sources, chunk)):
+                row, source, target = row_of[int(sources[i])], int(sources[i]), int(targets[i])
+                path = [target]
+                while path[-1] != source and path[-1] >= 0:
+                    path.append(int(predecessors[row, path[-1]]))
+                if path[-1] != source:
+                    continue
+                path.reverse()
+                hops = np.asarray(path[:-1], dtype=np.int64) * self.node_count + np.asarray(path[1:], dtype=np.int64)
+                length_m, time_s, co2_g = self._path_totals(edge_ids[np.searchsorted(edge_keys, hops)])
+                result = {
+                    'distance_km': round(length_m / 1000, 3),
+                    'travel_time_min': round(time_s / 60, 1),
+                    'co2_grams': round(co2_g, 1)
+                }
+                if include_points:
+                    result['points'] = np.column_stack([self.lat[path], self.lon[path]]).round(6).tolist()
+                results[i] = result
+        return results
+
+    def stats(self):
+        return {'nodes': self.node_count, 'edges': self.edge_count}
+
+
+def load_route_graph(path=ROUTE_GRAPH_PATH):
+    """Load the local road graph if one has been built, else None"""
+    if not os.path.exists(path):
+        return None
+    try:
+        graph = RouteGraph.load(path)
+        print(f"Route graph loaded with {graph.node_count} nodes and {graph.edge_count} edges")
+        return graph
+    except Exception as e:
+        print(f"Route graph load error: {e}")
+        return None
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python route_graph.py <extract.osm> [route_graph.npz]")
+        sys.exit(1)
+    graph = RouteGraph.from_osm(sys.argv[1])
+    out_path = sys.argv[2] if len(sys.argv) > 2 else ROUTE_GRAPH_PATH
+    graph.save(out_path)
+    print(f"Route graph with {graph.node_count} nodes and {graph.edge_count} edges saved to {out_path}")
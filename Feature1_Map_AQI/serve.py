@@ -0,0 +1,160 @@
+"""Production launcher: pre-forked gunicorn workers sharing one copy of the models and the hot TomTom cache.
+
+    python serve.py [--workers N] [--threads T] [--bind 0.0.0.0:5000] [--asgi]
+
+The master process imports the app, loads the zone model, traffic forecast,
+road graph and static assets, creates the Mongo collections and indexes through
+a client it closes again, moves the model arrays into shared memory and only
+then forks the workers, so every worker maps the same pages instead of
+loading its own copy. Each worker then opens its own Mongo pool and OpenAI
+client. Needs gunicorn, so Linux or macOS.
+
+Caches and counters stay per worker. With more than one worker the launcher
+defaults EVENT_BUS to "mongo", so ingested samples, point changes, new users
+and feed changes reach every worker, and points METRICS_DIR at a fresh
+directory, so /metrics sums every worker. Each open dashboard EventSource or
+chat stream holds one of a worker's --threads until it ends; LIVE_MAX_SUBSCRIBERS
+defaults to half of them so streams cannot starve ordinary requests.
+"""
+import argparse
+import gc
+import os
+import shutil
+import tempfile
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = object
+
+SERVE_BIND = os.getenv('SERVE_BIND', '0.0.0.0:5000')
+SERVE_WORKERS = int(os.getenv('SERVE_WORKERS', 0))
+SERVE_THREADS = int(os.getenv('SERVE_THREADS', 8))
+SERVE_TIMEOUT = int(os.getenv('SERVE_TIMEOUT', 60))
+SERVE_DB_INIT_TIMEOUT = int(os.getenv('SERVE_DB_INIT_TIMEOUT', 10))
+
+
+def init_database():
+    """Create the app's collections and indexes through a client that is closed before the workers fork"""
+    import app
+    from pymongo import MongoClient
+
+    if app.db is None:
+        return
+    client = MongoClient(app.MONGODB_URI, serverSelectionTimeoutMS=SERVE_DB_INIT_TIMEOUT * 1000)
+    try:
+        app.init_db(client[app.DATABASE_NAME])
+    except Exception as e:
+        print(f"MongoDB initialization error: {e}")
+    finally:
+        client.close()
+
+
+def post_fork(server, worker):
+    """Per-worker connections, opened after the fork so no socket or pool is shared"""
+    import app
+
+    app.connect_worker()
+
+
+def child_exit(server, worker):
+    """Drop an exited worker's metrics snapshot so /metrics stops counting it"""
+    from instrumentation import WorkerSnapshots
+
+    try:
+        os.remove(WorkerSnapshots.path(os.environ['METRICS_DIR'], worker.pid))
+    except (KeyError, OSError):
+        pass
+
+
+def remove_metrics_dir(server):
+    """Delete the snapshot directory the launcher created for this run"""
+    shutil.rmtree(os.environ['METRICS_DIR'], ignore_errors=True)
+
+
+class Launcher(BaseApplication):
+    """gunicorn application that loads and shares the app in the master before forking"""
+
+    def __init__(self, options, asgi=False):
+        self.options = options
+        self.asgi = asgi
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        import app
+
+        app.warm_up(connect=False)
+        init_database()
+        app.share_models()
+        if self.asgi:
+            from asgi import application
+        else:
+            application = app.app
+        # Objects loaded so far are never collected, so the collector does not write to
+        # (and unshare) their pages in every worker
+        gc.freeze()
+        return application
+
+
+def asgi_worker_class():
+    """uvicorn's gunicorn worker, from the uvicorn-worker package when installed"""
+    try:
+        import uvicorn_worker  # noqa: F401
+
+        return 'uvicorn_worker.UvicornWorker'
+    except ImportError:
+        return 'uvicorn.workers.UvicornWorker'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--bind', default=SERVE_BIND)
+    parser.add_argument('--workers', type=int, default=SERVE_WORKERS, help='worker processes (0 = one per CPU core)')
+    parser.add_argument('--threads', type=int, default=SERVE_THREADS, help='threads per worker; SSE streams hold one each')
+    parser.add_argument('--timeout', type=int, default=SERVE_TIMEOUT)
+    parser.add_argument('--asgi', action='store_true', help='serve asgi:application on uvicorn workers')
+    args = parser.parse_args()
+
+    if BaseApplication is object:
+        parser.exit(1, "serve.py needs gunicorn (pip install gunicorn; Linux/macOS only). Use python app.py instead.\n")
+
+    # One TomTom cache table shared by every worker unless another backend was chosen
+    os.environ.setdefault('GEO_CACHE_BACKEND', 'shm')
+    workers = args.workers or os.cpu_count() or 1
+    own_metrics_dir = workers > 1 and 'METRICS_DIR' not in os.environ
+    if workers > 1:
+        os.environ.setdefault('EVENT_BUS', 'mongo')
+    if own_metrics_dir:
+        os.environ['METRICS_DIR'] = tempfile.mkdtemp(prefix='aqi-metrics-')
+    if not args.asgi:
+        # Every stream pins a gthread thread; keep half of them for everything else
+        os.environ.setdefault('LIVE_MAX_SUBSCRIBERS', str(max(args.threads // 2, 1)))
+
+    # Imported only now that METRICS_DIR is settled
+    from instrumentation import worker_snapshots
+
+    worker_snapshots.prepare()
+
+    options = {
+        'bind': args.bind,
+        'workers': workers,
+        'timeout': args.timeout,
+        'preload_app': True,
+        'post_fork': post_fork,
+        'child_exit': child_exit,
+    }
+    if own_metrics_dir:
+        options['on_exit'] = remove_metrics_dir
+    if args.asgi:
+        options['worker_class'] = asgi_worker_class()
+    else:
+        options.update(worker_class='gthread', threads=args.threads)
+    Launcher(options, args.asgi).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import mmap
+import os
+import sys
+import tempfile
+import threading
+
+import numpy as np
+
+_ALIGN = 64
+
+# (name, bytes) of every shared segment this process created or inherited
+shared_segments = []
+_segments_lock = threading.Lock()
+
+
+def shared_arrays(arrays, name):
+    """Copy NumPy arrays into one anonymous shared mapping and return read-only views of them.
+
+    The mapping is MAP_SHARED, so processes forked after this call read the
+    same physical pages rather than each holding, or copy-on-write
+    duplicating, its own copy. Call it in the launcher's master process
+    after the models are loaded.
+    """
+    arrays = {key: np.ascontiguousarray(array) for key, array in arrays.items()}
+    offsets, size = {}, 0
+    for key, array in arrays.items():
+        offsets[key] = size
+        size += -(-array.nbytes // _ALIGN) * _ALIGN
+
+    buf = mmap.mmap(-1, max(size, _ALIGN))
+    views = {}
+    for key, array in arrays.items():
+        view = np.ndarray(array.shape, dtype=array.dtype, buffer=buf, offset=offsets[key])
+        view[...] = array
+        view.flags.writeable = False
+        views[key] = view
+    with _segments_lock:
+        shared_segments.append((name, size))
+    return views
+
+
+def savez_atomic(path, **arrays):
+    """np.savez through a uniquely named temporary file and an atomic rename.
+
+    Concurrent saves from several workers each write their own file, so
+    readers only ever see one complete model.
+    """
+    f = tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(path)), prefix=os.path.basename(path) + '.',
+                                    suffix='.tmp', delete=False)
+    try:
+        with f:
+            np.savez(f, **arrays)
+        os.replace(f.name, path)
+    except BaseException:
+        if os.path.exists(f.name):
+            os.unlink(f.name)
+        raise
+
+
+def shared_stats():
+    with _segments_lock:
+        return {
+            'segments': {name: size for name, size in shared_segments},
+            'bytes': sum(size for _, size in shared_segments)
+        }
+
+
+def process_memory():
+    """Resident memory of this process in MB, split into shared and private pages where /proc allows"""
+    fields = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if value.strip().endswith('kB'):
+                    fields[key] = int(value.split()[0]) / 1024
+    except OSError:
+        import resource
+
+        # ru_maxrss is the peak, in bytes on macOS and kB elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {'max_rss_mb': round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)}
+    return {
+        'rss_mb': round(fields.get('Rss', 0), 1),
+        # Proportional set size: shared pages divided among the processes mapping them
+        'pss_mb': round(fields.get('Pss', 0), 1),
+        'shared_mb': round(fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0), 1),
+        'private_mb': round(fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0), 1)
+    }
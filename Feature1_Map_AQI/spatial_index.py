@@ -0,0 +1,103 @@
+import math
+import os
+import threading
+
+import numpy as np
+
+from distance import haversine_km
+
+SPATIAL_CELL_DEG = float(os.getenv('SPATIAL_CELL_DEG', 0.01))
+SPATIAL_MAX_ENTRIES = int(os.getenv('SPATIAL_MAX_ENTRIES', 50000))
+
+KM_PER_DEG_LAT = 111.32
+
+
+def geo_point(lat, lon):
+    """GeoJSON Point for a coordinate (GeoJSON order is lon, lat)"""
+    return {'type': 'Point', 'coordinates': [float(lon), float(lat)]}
+
+
+class GridIndex:
+    """In-memory uniform lat/lon grid answering radius queries in distance order.
+
+    Used in place of Mongo's 2dsphere index when running without a database.
+    A query only measures the points in the grid cells overlapping its
+    bounding box, so cost follows local density rather than index size.
+    Past max_entries the oldest inserted items are dropped.
+    """
+
+    def __init__(self, cell_deg=SPATIAL_CELL_DEG, max_entries=SPATIAL_MAX_ENTRIES):
+        self.cell_deg = cell_deg
+        self.max_entries = max_entries
+        self.cells = {}
+        self.keys = {}
+        self._lock = threading.Lock()
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    def insert(self, key, lat, lon, item):
+        """Add or move an item; re-inserting a key replaces it"""
+        cell = self._cell(lat, lon)
+        with self._lock:
+            self._discard(key)
+            self.cells.setdefault(cell, {})[key] = (lat, lon, item)
+            self.keys[key] = cell
+            while len(self.keys) > self.max_entries:
+                self._discard(next(iter(self.keys)))
+
+    def _discard(self, key):
+        cell = self.keys.pop(key, None)
+        if cell is not None:
+            entries = self.cells[cell]
+            entries.pop(key, None)
+            if not entries:
+                del self.cells[cell]
+
+    def remove(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def nearby(self, lat, lon, radius_km, limit=20):
+        """(distance_km, item) pairs within radius_km of a point, nearest first"""
+        lat_span = radius_km / KM_PER_DEG_LAT
+        lon_span = min(radius_km / (KM_PER_DEG_LAT * max(math.cos(math.radians(lat)), 1e-6)), 180.0)
+        row_min, col_min = self._cell(lat - lat_span, lon - lon_span)
+        row_max, col_max = self._cell(lat + lat_span, lon + lon_span)
+
+        entries = []
+        with self._lock:
+            for row in range(row_min, row_max + 1):
+                for col in range(col_min, col_max + 1):
+                    cell = self.cells.get((row, col))
+                    if cell:
+                        entries.extend(cell.values())
+        if not entries:
+            return []
+
+        coords = np.array([(entry[0], entry[1]) for entry in entries], dtype=np.float64)
+        distances = haversine_km(lat, lon, coords[:, 0], coords[:, 1])
+        within = np.flatnonzero(distances <= radius_km)
+        order = within[np.argsort(distances[within], kind='stable')][:limit]
+        return [(float(distances[i]), entries[i][2]) for i in order]
+
+    def points_in_box(self, min_lat, min_lon, max_lat, max_lon):
+        """(N, 2) lat/lon array of every item inside a bounding box"""
+        row_min, col_min = self._cell(min_lat, min_lon)
+        row_max, col_max = self._cell(max_lat, max_lon)
+        points = []
+        with self._lock:
+            # Walk whichever is smaller: the cells overlapping the box or the occupied cells
+            if (row_max - row_min + 1) * (col_max - col_min + 1) <= len(self.cells):
+                cells = (self.cells.get((row, col)) for row in range(row_min, row_max + 1) for col in range(col_min, col_max + 1))
+            else:
+                cells = (entries for (row, col), entries in self.cells.items() if row_min <= row <= row_max and col_min <= col <= col_max)
+            for cell in cells:
+                if cell:
+                    points.extend((entry[0], entry[1]) for entry in cell.values())
+        coords = np.array(points, dtype=np.float64).reshape(-1, 2)
+        inside = (coords[:, 0] >= min_lat) & (coords[:, 0] <= max_lat) & (coords[:, 1] >= min_lon) & (coords[:, 1] <= max_lon)
+        return coords[inside]
+
+    def __len__(self):
+        return len(self.keys)
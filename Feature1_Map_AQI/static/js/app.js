@@ -501,6 +501,29 @@ function toggleChatbot() {
   chatbot.style.display = chatbot.style.display === "none" ? "flex" : "none";
 }
 
+async function readChatStream(response, onDelta) {
+  // Parse Server-Sent Events frames from a fetch() body as they arrive
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+
+    buffer += decoder.decode(value, { stream: true });
+    const frames = buffer.split("\n\n");
+    buffer = frames.pop();
+
+    for (const frame of frames) {
+      const dataLine = frame.split("\n").find((line) => line.startsWith("data: "));
+      if (!dataLine) continue;
+      const payload = JSON.parse(dataLine.slice(6));
+      if (payload.delta) onDelta(payload.delta);
+    }
+  }
+}
+
 async function sendChatMessage() {
   const input = document.getElementById("chatbot-input");
   const message = input.value.trim();
@@ -509,28 +532,36 @@ async function sendChatMessage() {
 
   const messagesDiv = document.getElementById("chatbot-messages");
 
-  // Add user message
-  messagesDiv.innerHTML += `<div class="user-message">${message}</div>`;
+  // Add user message as text so markup typed into the chat is not rendered
+  const userMessage = document.createElement("div");
+  userMessage.className = "user-message";
+  userMessage.textContent = message;
+  messagesDiv.appendChild(userMessage);
   input.value = "";
 
+  const botMessage = document.createElement("div");
+  botMessage.className = "bot-message";
+  messagesDiv.appendChild(botMessage);
   messagesDiv.scrollTop = messagesDiv.scrollHeight;
 
   try {
-    // Simulate bot response
-    setTimeout(() => {
-      const responses = [
-        "I can help you find eco-friendly routes and analyze air quality in your area!",
-        "Based on current traffic patterns, I recommend taking the bike path for your commute.",
-        "Your carbon footprint is looking great this week! Keep up the good work. 🌿",
-      ];
-      const response = responses[Math.floor(Math.random() * responses.length)];
-
-      messagesDiv.innerHTML += `<div class="bot-message">${response}</div>`;
+    const response = await fetch("/api/chatbot/stream", {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ message }),
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`Chatbot stream failed: ${response.status}`);
+    }
+
+    await readChatStream(response, (delta) => {
+      botMessage.textContent += delta;
       messagesDiv.scrollTop = messagesDiv.scrollHeight;
-    }, 1000);
+    });
   } catch (error) {
     console.error("Chatbot error:", error);
-    messagesDiv.innerHTML += `<div class="bot-message">Sorry, I'm having trouble right now. Please try again!</div>`;
+    botMessage.textContent =
+      "Sorry, I'm having trouble right now. Please try again!";
   }
 }
 
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, 'benchmarks'))
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    """The app booted offline on mongomock, as the benchmarks run it"""
+    import fakes
+
+    return fakes.boot_app()
+
+
+@pytest.fixture
+def db(app_module):
+    """The app's mongomock database, emptied after each test"""
+    yield app_module.db
+    for name in app_module.db.list_collection_names():
+        app_module.db.drop_collection(name)
@@ -0,0 +1,82 @@
+import itertools
+import os
+import time
+
+import pytest
+
+from geo_cache import SharedCacheBackend
+
+
+def colliding_keys(cache):
+    """Two different keys that map to the same slot"""
+    seen = {}
+    for i in itertools.count():
+        key = f'search:tile{i}:cafe'
+        offset = cache._slot(key)[1]
+        if offset in seen:
+            return seen[offset], key
+        seen[offset] = key
+
+
+def test_set_get_delete_roundtrip():
+    cache = SharedCacheBackend(slots=16, slot_bytes=1024)
+    cache.set('route:a:b:eco', {'routes': [1, 2, 3]}, 60)
+    assert cache.get('route:a:b:eco') == {'routes': [1, 2, 3]}
+    cache.delete('route:a:b:eco')
+    assert cache.get('route:a:b:eco') is None
+
+
+def test_colliding_key_replaces_older_entry():
+    cache = SharedCacheBackend(slots=4, slot_bytes=256)
+    first, second = colliding_keys(cache)
+    cache.set(first, 'first', 60)
+    cache.set(second, 'second', 60)
+    assert cache.get(first) is None
+    assert cache.get(second) == 'second'
+
+    # Deleting the evicted key must not drop the entry that replaced it
+    cache.delete(first)
+    assert cache.get(second) == 'second'
+
+
+def test_oversize_value_is_not_cached():
+    cache = SharedCacheBackend(slots=4, slot_bytes=128)
+    cache.set('big', 'x' * 200, 60)
+    assert cache.get('big') is None
+    assert cache.oversize == 1
+
+    # The largest value that fits next to the slot header is still cached
+    fits = 'x' * (128 - SharedCacheBackend._header.size - 2)
+    cache.set('big', fits, 60)
+    assert cache.get('big') == fits
+    assert cache.oversize == 1
+
+
+def test_oversize_value_leaves_previous_entry_intact():
+    cache = SharedCacheBackend(slots=4, slot_bytes=128)
+    cache.set('key', 'small', 60)
+    cache.set('key', 'x' * 200, 60)
+    assert cache.get('key') == 'small'
+
+
+def test_expired_entry_is_a_miss():
+    cache = SharedCacheBackend(slots=4, slot_bytes=128)
+    cache.set('key', 'value', -1)
+    assert cache.get('key') is None
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_forked_child_sees_parent_entries_and_writes_back():
+    cache = SharedCacheBackend(slots=16, slot_bytes=256)
+    cache.set('parent', 'from parent', 60)
+    pid = os.fork()
+    if pid == 0:
+        ok = cache.get('parent') == 'from parent'
+        cache.set('child', 'from child', 60)
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.WEXITSTATUS(status) == 0
+    deadline = time.time() + 1
+    while cache.get('child') is None and time.time() < deadline:
+        time.sleep(0.01)
+    assert cache.get('child') == 'from child'
@@ -0,0 +1,75 @@
+import pytest
+
+from intent_engine import AhoCorasick, IntentEngine
+
+
+def engine(*intents):
+    return IntentEngine(list(intents), 'default', 'empty')
+
+
+def intent(name, keywords, **extra):
+    return dict(extra, name=name, keywords=keywords, response=name)
+
+
+def test_aho_corasick_finds_overlapping_patterns():
+    matcher = AhoCorasick(['he', 'she', 'hers'])
+    assert sorted(matcher.finditer('ushers')) == [(4, 0), (4, 1), (6, 2)]
+
+
+def test_equal_scores_pick_the_earlier_intent():
+    rules = engine(intent('first', ['air']), intent('second', ['route']))
+    assert rules.respond('route with clean air') == 'first'
+    rules = engine(intent('first', ['route']), intent('second', ['air']))
+    assert rules.respond('route with clean air') == 'first'
+
+
+def test_higher_score_beats_rule_order():
+    rules = engine(intent('first', ['air']), intent('second', ['route', 'path']))
+    assert rules.respond('a path and a route with clean air') == 'second'
+
+
+def test_weights_add_up():
+    rules = engine(intent('first', ['air', 'aqi']), intent('second', [{'pattern': 'smog', 'weight': 3}]))
+    assert rules.respond('air aqi smog') == 'second'
+
+
+def test_priority_overrides_score_and_order():
+    rules = engine(intent('first', ['air', 'aqi']), intent('second', ['traffic'], priority=1))
+    assert rules.respond('air aqi traffic') == 'second'
+
+
+def test_keywords_match_whole_words_only():
+    rules = engine(intent('mood', ['mad']), intent('routes', ['route*']))
+    assert rules.respond('I made it home') == 'default'
+    assert rules.respond('nomad routes') == 'routes'
+    assert rules.respond('so mad!') == 'mood'
+
+
+def test_prefix_keyword_matches_longer_words_but_not_inside_them():
+    rules = engine(intent('routes', ['route*']))
+    assert rules.respond('rerouted') == 'default'
+    assert rules.respond('Routes please') == 'routes'
+
+
+def test_multi_word_keyword():
+    rules = engine(intent('eco', ['green score']))
+    assert rules.respond('what is my green score?') == 'eco'
+    assert rules.respond('green scores') == 'default'
+
+
+def test_empty_and_unmatched_messages():
+    rules = engine(intent('routes', ['route']))
+    assert rules.respond('') == 'empty'
+    assert rules.respond('hello there') == 'default'
+    assert rules.match('hello there') is None
+
+
+@pytest.mark.parametrize('message, name', [
+    ('best route to work', 'routes'),
+    ('how is the air today', 'air_quality'),
+    ('rush hour congestion', 'traffic'),
+    ('route with good air', 'routes'),
+    ('my eco points and air quality', 'eco_points'),
+])
+def test_shipped_rules(message, name):
+    assert IntentEngine.from_file().match(message)['name'] == name
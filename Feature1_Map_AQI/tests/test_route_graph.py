@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from scipy.sparse.csgraph import dijkstra
+
+from bench_routing import grid_graph, random_pairs
+from route_graph import ROUTE_COSTS, RouteGraph
+
+
+@pytest.fixture(scope='module')
+def graph():
+    return grid_graph(30, np.random.default_rng(7))
+
+
+@pytest.mark.parametrize('cost', sorted(ROUTE_COSTS))
+def test_astar_matches_dijkstra(graph, cost):
+    rng = np.random.default_rng(11)
+    sources = rng.integers(0, graph.node_count, 20)
+    targets = rng.integers(0, graph.node_count, 20)
+    distances = dijkstra(graph._csgraph(cost)[0], directed=True, indices=sources)
+
+    for row, (source, target) in enumerate(zip(sources.tolist(), targets.tolist())):
+        nodes, edges = graph.astar(source, target, cost)
+        assert (nodes[0], nodes[-1]) == (source, target)
+        assert float(graph.costs[cost][edges].sum()) == pytest.approx(distances[row, target], rel=1e-9, abs=1e-6)
+
+
+@pytest.mark.parametrize('route_type', sorted(ROUTE_COSTS))
+def test_matrix_matches_single_routes(graph, route_type):
+    pairs = random_pairs(graph, 15, np.random.default_rng(3))
+    for pair, result in zip(pairs, graph.matrix(pairs, route_type)):
+        summary = graph.route(*pair, route_type=route_type)['routes'][0]['summary']
+        assert result['distance_km'] == pytest.approx(summary['lengthInMeters'] / 1000, abs=2e-3)
+        assert result['co2_grams'] == pytest.approx(summary['co2EmissionGrams'], abs=0.1)
+
+
+def test_astar_follows_one_way_edges():
+    lat, lon = np.array([18.5, 18.501, 18.502]), np.array([73.8, 73.801, 73.802])
+    graph = RouteGraph.from_edges(lat, lon, np.array([0, 1]), np.array([1, 2]), np.array([30.0, 30.0]))
+    assert graph.astar(0, 2)[0] == [0, 1, 2]
+    assert graph.astar(2, 0) is None
@@ -0,0 +1,72 @@
+from datetime import datetime, timezone
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from timeseries import TIMESERIES_UPSERT_RETRIES, MetricStore, _timestamp
+
+
+class RollupCollection:
+    """Records every bulk_write and fails the first ones with the given write errors"""
+
+    def __init__(self, *failures):
+        self.failures = list(failures)
+        self.calls = []
+
+    def bulk_write(self, operations, ordered=True):
+        self.calls.append(list(operations))
+        if self.failures:
+            errors = self.failures.pop(0)
+            raise BulkWriteError({'writeErrors': [{'index': i, 'code': code} for i, code in errors]})
+
+
+class Database:
+    def __init__(self, metric_rollups):
+        self.metric_rollups = metric_rollups
+
+
+def test_rollup_retry_resubmits_only_duplicate_key_failures():
+    rollups = RollupCollection([(1, 11000), (3, 11000)])
+    MetricStore(Database(rollups))._write_rollups(['a', 'b', 'c', 'd'])
+    assert rollups.calls == [['a', 'b', 'c', 'd'], ['b', 'd']]
+
+
+def test_rollup_retry_indexes_into_the_resubmitted_operations():
+    rollups = RollupCollection([(1, 11000), (3, 11000)], [(1, 11000)])
+    MetricStore(Database(rollups))._write_rollups(['a', 'b', 'c', 'd'])
+    assert rollups.calls[-1] == ['d']
+
+
+def test_rollup_retry_raises_other_write_errors():
+    rollups = RollupCollection([(0, 11000), (1, 121)])
+    with pytest.raises(BulkWriteError):
+        MetricStore(Database(rollups))._write_rollups(['a', 'b'])
+    assert len(rollups.calls) == 1
+
+
+def test_rollup_retry_gives_up_after_the_last_attempt():
+    rollups = RollupCollection(*[[(0, 11000)]] * TIMESERIES_UPSERT_RETRIES)
+    with pytest.raises(BulkWriteError):
+        MetricStore(Database(rollups))._write_rollups(['a'])
+    assert len(rollups.calls) == TIMESERIES_UPSERT_RETRIES
+
+
+def test_timestamp_accepts_epoch_iso_and_datetime():
+    moment = datetime(2024, 5, 1, 8, 30, tzinfo=timezone.utc)
+    assert _timestamp(moment.timestamp()) == moment.timestamp()
+    assert _timestamp('2024-05-01T08:30:00Z') == moment.timestamp()
+    assert _timestamp(moment.replace(tzinfo=None)) == moment.timestamp()
+
+
+@pytest.mark.parametrize('value', [[1], {'t': 1}, b'1'])
+def test_timestamp_rejects_other_types(value):
+    with pytest.raises(TypeError):
+        _timestamp(value)
+
+
+def test_ingest_rejects_invalid_ts(app_module):
+    response = app_module.app.test_client().post(
+        '/api/metrics/ingest', json={'lat': 18.52, 'lon': 73.85, 'aqi': 80, 'ts': [1]},
+        headers={'X-Ingest-Token': app_module.METRICS_INGEST_TOKEN}
+    )
+    assert response.status_code == 400
@@ -0,0 +1,96 @@
+from write_behind import APPLIED_BATCHES_FIELD, TripWriter
+
+
+class FailingAfterWrite:
+    """Collection proxy whose next call of one method raises after the real call went through"""
+
+    def __init__(self, collection, method):
+        self.collection = collection
+        self.method = method
+        self.failures = 1
+
+    def __getattr__(self, name):
+        attr = getattr(self.collection, name)
+        if name != self.method:
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError('connection reset after write')
+            return result
+        return call
+
+
+class Database:
+    def __init__(self, db, **overrides):
+        self.db = db
+        self.overrides = overrides
+
+    def __getattr__(self, name):
+        return self.overrides.get(name) or getattr(self.db, name)
+
+
+def writer(db, **kwargs):
+    # No background flushes; the tests flush by hand
+    kwargs.setdefault('flush_interval', 3600)
+    kwargs.setdefault('max_batch', 10 ** 6)
+    return TripWriter(db, **kwargs)
+
+
+def test_flush_applies_coalesced_increments(db):
+    db.users.insert_one({'_id': 'u1', 'eco_points': 0, 'total_trips': 0})
+    trips = writer(db)
+    for _ in range(3):
+        assert trips.record('u1', {'eco_points': 10, 'total_trips': 1}, {'user_id': 'u1'})
+
+    assert trips.flush() == 3
+    user = db.users.find_one({'_id': 'u1'})
+    assert (user['eco_points'], user['total_trips']) == (30, 3)
+    assert len(user[APPLIED_BATCHES_FIELD]) == 1
+    assert db.user_routes.count_documents({}) == 3
+
+
+def test_retried_counter_batch_is_applied_once(db):
+    db.users.insert_one({'_id': 'u1', 'eco_points': 0})
+    trips = writer(Database(db, users=FailingAfterWrite(db.users, 'bulk_write')))
+    trips.record('u1', {'eco_points': 10}, {'user_id': 'u1'})
+
+    assert trips.flush() == 0
+    assert trips.stats()['retry_batches'] == 1
+    assert trips.flush() == 1
+    assert db.users.find_one({'_id': 'u1'})['eco_points'] == 10
+    assert trips.stats()['pending_users'] == 0
+
+
+def test_retried_routes_are_inserted_once(db):
+    db.users.insert_one({'_id': 'u1', 'eco_points': 0})
+    trips = writer(Database(db, user_routes=FailingAfterWrite(db.user_routes, 'insert_many')))
+    trips.record('u1', {'eco_points': 10}, {'user_id': 'u1'})
+    trips.record('u1', {'eco_points': 5}, {'user_id': 'u1'})
+
+    assert trips.flush() == 0
+    assert trips.flush() == 2
+    assert db.user_routes.count_documents({}) == 2
+    assert db.users.find_one({'_id': 'u1'})['eco_points'] == 15
+
+
+def test_pending_batches_carry_tokens_until_written(db):
+    db.users.insert_one({'_id': 'u1', 'eco_points': 0})
+    trips = writer(db)
+    trips.record('u1', {'eco_points': 10}, {'user_id': 'u1'})
+
+    (token, increments), = trips.pending_batches()
+    assert increments['u1']['eco_points'] == 10
+    trips.flush()
+    assert token in db.users.find_one({'_id': 'u1'})[APPLIED_BATCHES_FIELD]
+    assert [t for t, _ in trips.pending_batches()] == [token]
+
+
+def test_record_refuses_trips_when_backlog_is_full(db):
+    trips = writer(Database(db, user_routes=FailingAfterWrite(db.user_routes, 'insert_many')), max_pending=2)
+    assert trips.record('u1', {'eco_points': 1}, {'user_id': 'u1'})
+    assert trips.record('u2', {'eco_points': 1}, {'user_id': 'u2'})
+    assert not trips.record('u3', {'eco_points': 1}, {'user_id': 'u3'})
+    assert trips.stats()['rejected'] == 1
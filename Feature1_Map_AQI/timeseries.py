@@ -0,0 +1,448 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, OperationFailure
+
+from geo_cache import geohash, geohash_center
+
+TIMESERIES_PRECISION = int(os.getenv('TIMESERIES_PRECISION', 6))
+TIMESERIES_SAMPLE_RETENTION = int(os.getenv('TIMESERIES_SAMPLE_RETENTION', 7 * 86400))
+# Ring pages are allocated as buckets are written: a few KB for a tile sampled now and then, up to
+# about 0.26 MB for one sampled every minute for a day. The least recently written are evicted past this
+TIMESERIES_MAX_TILES = int(os.getenv('TIMESERIES_MAX_TILES', 1000))
+ROLLUP_PAGE_SLOTS = int(os.getenv('ROLLUP_PAGE_SLOTS', 60))
+TIMESERIES_MAX_FUTURE_SKEW = int(os.getenv('TIMESERIES_MAX_FUTURE_SKEW', 300))
+TIMESERIES_UPSERT_RETRIES = 3
+
+METRIC_NAMES = ('aqi', 'noise_level', 'traffic_level')
+
+# Bucket width in seconds and number of buckets kept per tile for each rollup resolution
+ROLLUP_RESOLUTIONS = {
+    'minute': (60, 24 * 60),
+    'hour': (3600, 30 * 24),
+    'day': (86400, 365),
+}
+# Oldest sample age any ring can still hold
+MAX_SAMPLE_AGE = max(step * slots for step, slots in ROLLUP_RESOLUTIONS.values())
+
+
+def _timestamp(value):
+    """Epoch seconds for a sample time given as epoch seconds, ISO string, datetime or None (now)"""
+    if value is None:
+        return time.time()
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if not isinstance(value, datetime):
+        raise TypeError(f"ts must be epoch seconds, an ISO 8601 string or a datetime, not {type(value).__name__}")
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _bucket_time(bucket, step):
+    return datetime.fromtimestamp(bucket * step, timezone.utc)
+
+
+class RollupPage:
+    """Count/sum/min/max per metric for a run of consecutive ring slots"""
+
+    def __init__(self, slots):
+        n = len(METRIC_NAMES)
+        self.buckets = np.full(slots, -1, dtype=np.int64)
+        self.count = np.zeros((slots, n), dtype=np.int64)
+        self.sum = np.zeros((slots, n), dtype=np.float64)
+        self.min = np.full((slots, n), np.inf)
+        self.max = np.full((slots, n), -np.inf)
+
+
+class RollupSeries:
+    """Ring of fixed-width rollup buckets (count/sum/min/max per metric) for one tile.
+
+    The ring is cut into pages of ROLLUP_PAGE_SLOTS slots, each allocated the
+    first time a bucket lands in it, so a tile that saw samples in only a few
+    buckets holds a few pages rather than every slot of every resolution.
+    """
+
+    def __init__(self, step, slots, page_slots=ROLLUP_PAGE_SLOTS):
+        self.step = step
+        self.slots = slots
+        self.page_slots = min(page_slots, slots)
+        self.pages = {}
+
+    def _find(self, bucket):
+        """(page, offset) of the slot holding a bucket, or None if it holds nothing for that bucket"""
+        number, offset = divmod(bucket % self.slots, self.page_slots)
+        page = self.pages.get(number)
+        if page is None or page.buckets[offset] != bucket or not page.count[offset].any():
+            return None
+        return page, offset
+
+    def _slot(self, bucket):
+        """(page, offset) of a bucket's slot, recycling it if it still holds an older one; None if the bucket aged out"""
+        number, offset = divmod(bucket % self.slots, self.page_slots)
+        page = self.pages.get(number)
+        if page is None:
+            page = self.pages[number] = RollupPage(self.page_slots)
+        current = page.buckets[offset]
+        if current == bucket:
+            return page, offset
+        if current > bucket:
+            return None
+        page.buckets[offset] = bucket
+        page.count[offset] = 0
+        page.sum[offset] = 0.0
+        page.min[offset] = np.inf
+        page.max[offset] = -np.inf
+        return page, offset
+
+    def add(self, ts, values, present):
+        found = self._slot(int(ts // self.step))
+        if found is None:
+            return
+        page, i = found
+        page.count[i] += present
+        page.sum[i] += np.where(present, values, 0.0)
+        page.min[i] = np.where(present, np.minimum(page.min[i], values), page.min[i])
+        page.max[i] = np.where(present, np.maximum(page.max[i], values), page.max[i])
+
+    def merge(self, bucket, count, total, low, high):
+        """Fold a stored rollup document back in (used when loading from Mongo)"""
+        found = self._slot(bucket)
+        if found is None:
+            return
+        page, i = found
+        page.count[i] += count
+        page.sum[i] += total
+        page.min[i] = np.minimum(page.min[i], low)
+        page.max[i] = np.maximum(page.max[i], high)
+
+    def totals(self, bucket):
+        """Copies of one bucket's per-metric counts and sums, or None if nothing was recorded in it"""
+        found = self._find(bucket)
+        if found is None:
+            return None
+        page, i = found
+        return page.count[i].copy(), page.sum[i].copy()
+
+    def summary(self, bucket):
+        """Rollup for one bucket, or None if nothing was recorded in it"""
+        found = self._find(bucket)
+        if found is None:
+            return None
+        page, slot = found
+        result = {'bucket_start': _bucket_time(bucket, self.step).isoformat(), 'samples': int(page.count[slot].max())}
+        for i, name in enumerate(METRIC_NAMES):
+            n = page.count[slot, i]
+            if n:
+                result[name] = {
+                    'avg': round(page.sum[slot, i] / n, 2),
+                    'min': float(page.min[slot, i]),
+                    'max': float(page.max[slot, i]),
+                    'count': int(n)
+                }
+        return result
+
+
+class MetricStore:
+    """AQI/noise/traffic samples per geohash tile with per-minute, per-hour and per-day rollups.
+
+    Raw samples go to a Mongo time-series collection and rollups are upserted
+    into metric_rollups with $inc/$min/$max. Every rollup is also mirrored in
+    fixed-size in-memory rings, so reads touch a constant number of buckets no
+    matter how much history has been recorded. Each function in `listeners`
+    is called with the set of tiles an ingested batch touched, including
+    batches other workers ingested when the store is attached to an EventBus.
+
+    Samples must be no older than the longest ring and no further ahead than
+    TIMESERIES_MAX_FUTURE_SKEW, and at most max_tiles tiles keep rings in
+    memory, the least recently written being dropped first (their stored
+    rollups stay in Mongo).
+    """
+
+    def __init__(self, db=None, precision=TIMESERIES_PRECISION, max_tiles=TIMESERIES_MAX_TILES):
+        self.db = db
+        self.precision = precision
+        self.max_tiles = max_tiles
+        self.series = {}
+        # Tiles with rings, least recently written first
+        self._tiles = OrderedDict()
+        self.evicted = 0
+        self.ingested = 0
+        self.errors = 0
+        self.listeners = []
+        # EventBus that carries ingested samples to the other workers (see attach)
+        self.bus = None
+        self._centers = {}
+        self._lock = threading.Lock()
+
+    def tile(self, lat, lon):
+        return geohash(lat, lon, self.precision)
+
+    def init_collections(self, db=None):
+        """Create the samples time-series collection and rollup indexes (in `db` if given)"""
+        db = self.db if db is None else db
+        if db is None:
+            return
+        try:
+            db.create_collection(
+                'metric_samples',
+                timeseries={'timeField': 'ts', 'metaField': 'tile', 'granularity': 'minutes'},
+                expireAfterSeconds=TIMESERIES_SAMPLE_RETENTION
+            )
+        except CollectionInvalid:
+            pass
+        except OperationFailure as e:
+            # Servers older than MongoDB 5.0 have no time-series collections
+            print(f"Time-series collection unavailable, using a regular collection: {e}")
+            db.metric_samples.create_index([("tile", 1), ("ts", -1)])
+            # Traffic forecast refreshes page on ts alone
+            db.metric_samples.create_index("ts")
+        db.metric_rollups.create_index([("resolution", 1), ("bucket_start", 1)])
+        db.metric_rollups.create_index("expires_at", expireAfterSeconds=0)
+
+    def _series(self, tile, resolution):
+        key = (tile, resolution)
+        series = self.series.get(key)
+        if series is None:
+            self._touch(tile)
+            step, slots = ROLLUP_RESOLUTIONS[resolution]
+            series = self.series[key] = RollupSeries(step, slots)
+        return series
+
+    def _touch(self, tile):
+        """Mark a tile as just written, evicting the least recently written ones past max_tiles"""
+        if tile in self._tiles:
+            self._tiles.move_to_end(tile)
+            return
+        self._tiles[tile] = None
+        while len(self._tiles) > self.max_tiles:
+            old, _ = self._tiles.popitem(last=False)
+            for resolution in ROLLUP_RESOLUTIONS:
+                self.series.pop((old, resolution), None)
+            self._centers.pop(old, None)
+            self.evicted += 1
+
+    def _parse(self, sample, now):
+        lat, lon = float(sample['lat']), float(sample['lon'])
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError('Coordinates out of range')
+        present = np.array([sample.get(name) is not None for name in METRIC_NAMES])
+        if not present.any():
+            raise ValueError(f"Sample has none of {', '.join(METRIC_NAMES)}")
+        values = np.array([float(sample[name]) if p else 0.0 for name, p in zip(METRIC_NAMES, present)])
+        if not np.isfinite(values).all():
+            raise ValueError('Metric values must be finite numbers')
+        ts = _timestamp(sample.get('ts'))
+        # A far-future sample would claim ring slots ahead of real ones and outlive its TTL
+        if not now - MAX_SAMPLE_AGE < ts <= now + TIMESERIES_MAX_FUTURE_SKEW:
+            raise ValueError('Sample time is outside the window the rollups keep')
+        return lat, lon, ts, values, present
+
+    def record_many(self, samples):
+        """Ingest samples of the form {lat, lon, ts?, aqi?, noise_level?, traffic_level?}; returns the count stored"""
+        # Validate the whole batch before touching any rollup
+        now = time.time()
+        parsed = [self._parse(sample, now) for sample in samples]
+
+        tiles = self._fold(parsed)
+        docs = []
+        rollups = {}
+        for lat, lon, ts, values, present in parsed:
+            tile = self.tile(lat, lon)
+            for resolution, (step, _) in ROLLUP_RESOLUTIONS.items():
+                rollups.setdefault((resolution, tile, int(ts // step)), []).append((values, present))
+            metrics = {name: value for name, value, p in zip(METRIC_NAMES, values.tolist(), present) if p}
+            docs.append({'ts': datetime.fromtimestamp(ts, timezone.utc), 'tile': tile, 'lat': lat, 'lon': lon, **metrics})
+        with self._lock:
+            self.ingested += len(docs)
+
+        self._persist(docs, rollups)
+        if self.bus is not None:
+            self.bus.publish('metrics', {'samples': [
+                [lat, lon, ts] + [value if p else None for value, p in zip(values.tolist(), present)]
+                for lat, lon, ts, values, present in parsed
+            ]})
+        for listener in self.listeners:
+            listener(tiles)
+        return len(docs)
+
+    def _fold(self, parsed):
+        """Add parsed samples to the in-memory rings; returns the tiles they fell in"""
+        tiles = set()
+        with self._lock:
+            for lat, lon, ts, values, present in parsed:
+                tile = self.tile(lat, lon)
+                tiles.add(tile)
+                self._touch(tile)
+                for resolution in ROLLUP_RESOLUTIONS:
+                    self._series(tile, resolution).add(ts, values, present)
+        return tiles
+
+    def attach(self, bus):
+        """Share ingested samples with the other workers' rings through an EventBus"""
+        self.bus = bus
+        bus.on('metrics', self._apply_published)
+
+    def _apply_published(self, payload):
+        """Fold samples another worker ingested (and already stored) into this worker's rings"""
+        parsed = []
+        for lat, lon, ts, *metrics in payload['samples']:
+            present = np.array([value is not None for value in metrics])
+            values = np.array([0.0 if value is None else value for value in metrics], dtype=np.float64)
+            parsed.append((lat, lon, ts, values, present))
+        tiles = self._fold(parsed)
+        for listener in self.listeners:
+            listener(tiles)
+
+    def record(self, lat, lon, ts=None, **metrics):
+        return self.record_many([dict(metrics, lat=lat, lon=lon, ts=ts)])
+
+    def _persist(self, docs, rollups):
+        if self.db is None or not docs:
+            return
+        operations = []
+        for (resolution, tile, bucket), entries in rollups.items():
+            step, slots = ROLLUP_RESOLUTIONS[resolution]
+            inc, low, high = {}, {}, {}
+            for values, present in entries:
+                for name, value, p in zip(METRIC_NAMES, values.tolist(), present):
+                    if p:
+                        inc[f'count.{name}'] = inc.get(f'count.{name}', 0) + 1
+                        inc[f'sum.{name}'] = inc.get(f'sum.{name}', 0.0) + value
+                        low[f'min.{name}'] = min(low.get(f'min.{name}', value), value)
+                        high[f'max.{name}'] = max(high.get(f'max.{name}', value), value)
+            bucket_start = _bucket_time(bucket, step)
+            operations.append(UpdateOne(
+                {'_id': f'{resolution}:{tile}:{bucket}'},
+                {
+                    '$setOnInsert': {
+                        'resolution': resolution, 'tile': tile, 'bucket': bucket, 'bucket_start': bucket_start,
+                        'expires_at': bucket_start + timedelta(seconds=step * slots)
+                    },
+                    '$inc': inc, '$min': low, '$max': high
+                },
+                upsert=True
+            ))
+        # Samples and rollups are written separately so a failure in one does not lose the other
+        try:
+            self.db.metric_samples.insert_many(docs, ordered=False)
+        except Exception as e:
+            self.errors += 1
+            print(f"Metric sample write error: {e}")
+        try:
+            self._write_rollups(operations)
+        except Exception as e:
+            self.errors += 1
+            print(f"Metric rollup write error: {e}")
+
+    def _write_rollups(self, operations):
+        """bulk_write rollup upserts, retrying those that lost an insert race to a concurrent upsert"""
+        for attempt in range(TIMESERIES_UPSERT_RETRIES):
+            try:
+                self.db.metric_rollups.bulk_write(operations, ordered=False)
+                return
+            except BulkWriteError as e:
+                errors = e.details.get('writeErrors', [])
+                # E11000: another writer inserted the bucket first; the retry updates it instead
+                if attempt == TIMESERIES_UPSERT_RETRIES - 1 or any(error.get('code') != 11000 for error in errors):
+                    raise
+                operations = [operations[error['index']] for error in errors]
+
+    def load(self):
+        """Rebuild the in-memory rings from rollups stored in Mongo"""
+        if self.db is None:
+            return self
+        try:
+            loaded = self._load_rollups()
+            if loaded:
+                print(f"Metric store loaded {loaded} rollup buckets")
+        except Exception as e:
+            print(f"Metric store load error: {e}")
+        return self
+
+    def _load_rollups(self):
+        loaded = 0
+        now = time.time()
+        with self._lock:
+            for resolution, (step, slots) in ROLLUP_RESOLUTIONS.items():
+                since = int(now // step) - slots + 1
+                for doc in self.db.metric_rollups.find({'resolution': resolution, 'bucket': {'$gte': since}}):
+                    count, total, low, high = (
+                        np.array([doc.get(field, {}).get(name, default) for name in METRIC_NAMES], dtype=dtype)
+                        for field, default, dtype in (
+                            ('count', 0, np.int64), ('sum', 0.0, np.float64),
+                            ('min', np.inf, np.float64), ('max', -np.inf, np.float64)
+                        )
+                    )
+                    self._series(doc['tile'], resolution).merge(doc['bucket'], count, total, low, high)
+                    loaded += 1
+        return loaded
+
+    def latest(self, lat, lon, resolution='hour', now=None):
+        """Rollup of the current bucket for the tile holding (lat, lon), falling back to the previous one"""
+        return self.latest_tile(self.tile(lat, lon), resolution, now)
+
+    def latest_tile(self, tile, resolution='hour', now=None):
+        series = self.series.get((tile, resolution))
+        if series is None:
+            return None
+        bucket = int(_timestamp(now) // series.step)
+        return series.summary(bucket) or series.summary(bucket - 1)
+
+    def latest_totals(self, resolution='hour', now=None):
+        """Tile centers with per-metric sample counts and sums of each tile's latest bucket.
+
+        Returns (coords, count, total) arrays shaped (K, 2) and (K, len(METRIC_NAMES)),
+        taking the current bucket of every tile or, if empty, the previous one.
+        """
+        step = ROLLUP_RESOLUTIONS[resolution][0]
+        bucket = int(_timestamp(now) // step)
+        coords, counts, totals = [], [], []
+        with self._lock:
+            for (tile, tile_resolution), series in self.series.items():
+                if tile_resolution != resolution:
+                    continue
+                for b in (bucket, bucket - 1):
+                    found = series.totals(b)
+                    if found is not None:
+                        coords.append(self._center(tile))
+                        counts.append(found[0])
+                        totals.append(found[1])
+                        break
+        n = len(METRIC_NAMES)
+        return (
+            np.array(coords, dtype=np.float64).reshape(-1, 2),
+            np.array(counts, dtype=np.int64).reshape(-1, n),
+            np.array(totals, dtype=np.float64).reshape(-1, n)
+        )
+
+    def _center(self, tile):
+        center = self._centers.get(tile)
+        if center is None:
+            center = self._centers[tile] = geohash_center(tile)
+        return center
+
+    def window(self, lat, lon, resolution='hour', limit=24, now=None):
+        """The last `limit` buckets (oldest first) for the tile holding (lat, lon), skipping empty ones"""
+        series = self.series.get((self.tile(lat, lon), resolution))
+        if series is None:
+            return []
+        end = int(_timestamp(now) // series.step)
+        limit = min(limit, series.slots)
+        return [summary for summary in (series.summary(b) for b in range(end - limit + 1, end + 1)) if summary]
+
+    def stats(self):
+        return {
+            'tiles': len({tile for tile, _ in self.series}),
+            'series': len(self.series),
+            'evicted_tiles': self.evicted,
+            'ingested': self.ingested,
+            'errors': self.errors
+        }
@@ -0,0 +1,283 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from bson import ObjectId
+
+from geo_cache import geohash, geohash_codes, geohash_code
+from shared_state import savez_atomic, shared_arrays
+from timeseries import TIMESERIES_PRECISION
+
+TRAFFIC_MODEL_PATH = os.getenv('TRAFFIC_MODEL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'traffic_model.npz'))
+TRAFFIC_FORECAST_ALPHA = float(os.getenv('TRAFFIC_FORECAST_ALPHA', 0.3))
+TRAFFIC_FORECAST_TZ = os.getenv('TRAFFIC_FORECAST_TZ', 'Asia/Kolkata')
+TRAFFIC_FORECAST_REFRESH = float(os.getenv('TRAFFIC_FORECAST_REFRESH', 600))
+# Seconds behind the watermark that every refresh re-reads, catching samples written late by other workers
+TRAFFIC_FORECAST_OVERLAP = float(os.getenv('TRAFFIC_FORECAST_OVERLAP', 900))
+
+HOURS_PER_WEEK = 7 * 24
+
+
+def hour_of_week(when=None, tz=TRAFFIC_FORECAST_TZ):
+    """Hour of week (Monday 00:00 is 0) in the forecast time zone.
+
+    Accepts None (now), a datetime (naive means server local time, like
+    datetime.now()) or an array of epoch seconds.
+    """
+    if when is None or isinstance(when, datetime):
+        local = (when or datetime.now()).astimezone(ZoneInfo(tz))
+        return local.weekday() * 24 + local.hour
+    import pandas as pd
+
+    index = pd.to_datetime(np.asarray(when, dtype=np.float64), unit='s', utc=True).tz_convert(tz)
+    return np.asarray(index.dayofweek * 24 + index.hour)
+
+
+def table_levels(codes, table):
+    """Non-empty cells of a profile table as a level Series indexed by (code, how)"""
+    import pandas as pd
+
+    rows, hows = np.nonzero(~np.isnan(table))
+    index = pd.MultiIndex.from_arrays([codes[rows], hows], names=['code', 'how'])
+    return pd.Series(table[rows, hows], index=index, name='level')
+
+
+def smooth_profiles(samples, alpha=TRAFFIC_FORECAST_ALPHA, prior=None, tz=TRAFFIC_FORECAST_TZ):
+    """Exponentially smoothed traffic level per (tile code, hour of week), fitted in one grouped pass.
+
+    `samples` has tile/ts/traffic_level columns; `prior` is a previous result
+    whose levels seed the smoothing, which makes refits incremental.
+    """
+    import pandas as pd
+
+    ts = pd.to_datetime(samples['ts'], utc=True)
+    local = ts.dt.tz_convert(tz)
+    tiles = samples['tile'].astype(str)
+    codes = tiles.map({tile: geohash_code(tile) for tile in tiles.unique()})
+    frame = pd.DataFrame({
+        'code': codes.to_numpy(np.int64),
+        'how': (local.dt.dayofweek * 24 + local.dt.hour).to_numpy(np.int64),
+        'level': samples['traffic_level'].to_numpy(np.float64),
+        'ts': ts.to_numpy()
+    }).sort_values('ts', kind='stable').drop(columns='ts')
+
+    if prior is not None and len(prior):
+        # Seeds come first so each group's smoothing starts from its previous level
+        frame = pd.concat([prior.reset_index(), frame], ignore_index=True)
+
+    # Closed form of y_t = alpha * x_t + (1 - alpha) * y_(t-1) seeded with y_0 = x_0: the final level
+    # is a weighted sum of each group's values, which a single grouped sum computes for every group
+    grouped = frame.groupby(['code', 'how'], sort=False)
+    position = grouped.cumcount().to_numpy()
+    age = grouped['level'].transform('size').to_numpy() - 1 - position
+    weight = (1 - alpha) ** age * np.where(position == 0, 1.0, alpha)
+    return (frame['level'] * weight).groupby([frame['code'], frame['how']]).sum().rename('level')
+
+
+class TrafficForecaster:
+    """Per-tile hour-of-week traffic profiles served from a precomputed lookup table.
+
+    Profiles are fitted from traffic_level samples in metric_samples and
+    stored as a (tiles x 168) array keyed by sorted geohash codes, so a
+    forecast is a binary search plus an array index. Tiles, and hours of a
+    tile, without observations have no forecast (NaN/None), so callers fall
+    back to the static hour-of-day ranges. A background thread folds in
+    newly ingested samples every TRAFFIC_FORECAST_REFRESH seconds.
+
+    Refreshes page on the samples' `ts` time field, which the time-series
+    collection is organized by: each reads from TRAFFIC_FORECAST_OVERLAP
+    seconds before the newest sample time already folded in (the watermark)
+    and skips the samples it has already seen inside that window.
+    """
+
+    def __init__(self, collection=None, path=TRAFFIC_MODEL_PATH, alpha=TRAFFIC_FORECAST_ALPHA, precision=TIMESERIES_PRECISION):
+        self.collection = collection
+        self.path = path
+        self.alpha = alpha
+        self.precision = precision
+        self.watermark = None
+        # _id -> epoch seconds of samples already folded in that are still inside the overlap window
+        self._recent = {}
+        self.samples_seen = 0
+        self._model = (np.empty(0, dtype=np.int64), np.empty((0, HOURS_PER_WEEK)))
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return len(self._model[0]) > 0
+
+    def _set_levels(self, levels):
+        codes = np.unique(levels.index.get_level_values('code').to_numpy(np.int64))
+        table = np.full((len(codes), HOURS_PER_WEEK), np.nan)
+        rows = np.searchsorted(codes, levels.index.get_level_values('code').to_numpy(np.int64))
+        table[rows, levels.index.get_level_values('how').to_numpy(np.int64)] = levels.to_numpy()
+        self._set_table(codes, table)
+
+    def _set_table(self, codes, table):
+        self._model = (codes, table)
+
+    def fit(self, samples, incremental=False):
+        """Fit profiles from a samples DataFrame (tile, ts, traffic_level)"""
+        if samples.empty:
+            return False
+        with self._lock:
+            prior = table_levels(*self._model) if incremental and self.ready else None
+            self._set_levels(smooth_profiles(samples, self.alpha, prior))
+            self.samples_seen += len(samples)
+        return True
+
+    def _read_samples(self, incremental=False):
+        """Traffic samples not yet folded in (all of them unless incremental), advancing the watermark"""
+        import pandas as pd
+
+        started = time.time()
+        query = {'traffic_level': {'$exists': True}}
+        if incremental and self.watermark is not None:
+            query['ts'] = {'$gte': datetime.fromtimestamp(self.watermark - TRAFFIC_FORECAST_OVERLAP, timezone.utc)}
+        else:
+            self._recent = {}
+        docs = [
+            doc for doc in self.collection.find(query, {'tile': 1, 'ts': 1, 'traffic_level': 1})
+            if doc['_id'] not in self._recent
+        ]
+        frame = pd.DataFrame(docs, columns=['_id', 'tile', 'ts', 'traffic_level'])
+        if docs:
+            seconds = pd.to_datetime(frame['ts'], utc=True).astype('int64').to_numpy() / 1e9
+            # Never past the read time, so samples stamped slightly in the future do not hide later ones
+            self.watermark = min(max(float(seconds.max()), self.watermark or 0.0), started)
+            self._recent.update(zip(frame['_id'].tolist(), seconds.tolist()))
+        if self.watermark is not None:
+            cutoff = self.watermark - TRAFFIC_FORECAST_OVERLAP
+            self._recent = {sample_id: ts for sample_id, ts in self._recent.items() if ts >= cutoff}
+        return frame
+
+    def fit_from_store(self):
+        """Fit from every traffic sample stored in metric_samples"""
+        if self.collection is None:
+            return False
+        if not self.fit(self._read_samples()):
+            return False
+        self.save()
+        return True
+
+    def refresh(self):
+        """Fold samples ingested since the last fit into the profiles"""
+        if self.collection is None:
+            return False
+        if not self.fit(self._read_samples(incremental=True), incremental=True):
+            return False
+        self.save()
+        return True
+
+    def save(self):
+        codes, table = self._model
+        recent = self._recent
+        savez_atomic(
+            self.path, codes=codes, table=table, watermark=np.array(np.nan if self.watermark is None else self.watermark),
+            recent_ids=np.array([str(sample_id) for sample_id in recent]), recent_ts=np.array(list(recent.values()), dtype=np.float64)
+        )
+
+    def load(self):
+        if os.path.exists(self.path):
+            try:
+                with np.load(self.path) as data:
+                    codes, table = data['codes'], data['table']
+                    if 'watermark' in data:
+                        watermark = float(data['watermark'])
+                        recent = dict(zip(data['recent_ids'].tolist(), data['recent_ts'].tolist()))
+                    else:
+                        # Models saved before watermarks: resume from when the file was written
+                        watermark, recent = os.path.getmtime(self.path), {}
+                self._set_table(codes, table)
+                self.watermark = None if np.isnan(watermark) else watermark
+                self._recent = {ObjectId(sample_id): ts for sample_id, ts in recent.items()}
+                print(f"Traffic forecast loaded for {len(codes)} tiles")
+            except Exception as e:
+                print(f"Traffic forecast load error: {e}")
+        return self
+
+    def share(self):
+        """Move the lookup table into shared memory for workers forked afterwards; refits replace it per worker"""
+        if self.ready:
+            codes, table = self._model
+            arrays = shared_arrays({'codes': codes, 'table': table}, 'traffic_model')
+            self._model = (arrays['codes'], arrays['table'])
+        return self
+
+    def predict(self, lats, lons, when=None):
+        """Forecast traffic levels for arrays of coordinates; NaN where the tile has no level for that hour"""
+        self.start_refresh()
+        codes, table = self._model
+        how = hour_of_week(when)
+        query = geohash_codes(lats, lons, self.precision)
+        if len(codes):
+            rows = np.minimum(np.searchsorted(codes, query), len(codes) - 1)
+            values = np.where(codes[rows] == query, table[rows, how], np.nan)
+        else:
+            values = np.full(query.shape, np.nan)
+        return values
+
+    def profile(self, lat, lon):
+        """Hour-of-week profile (168 levels, NaN where unobserved) for the tile holding one location"""
+        codes, table = self._model
+        # Pure-Python geohash: cheaper than the vectorized encoder for a single point
+        query = geohash_code(geohash(lat, lon, self.precision))
+        row = codes.searchsorted(query)
+        if row < len(codes) and codes[row] == query:
+            return table[row]
+        return np.full(HOURS_PER_WEEK, np.nan)
+
+    def forecast(self, lat, lon, when=None):
+        """Forecast traffic level at one location, or None without a profile"""
+        self.start_refresh()
+        value = self.profile(lat, lon)[hour_of_week(when)]
+        return None if np.isnan(value) else float(value)
+
+    def peak_hour(self, lat, lon, when=None):
+        """Busiest hour of the day in a location's profile for the weekday of `when`, or None"""
+        day = hour_of_week(when) // 24 * 24
+        hours = self.profile(lat, lon)[day:day + 24]
+        if np.isnan(hours).all():
+            return None
+        return int(np.nanargmax(hours))
+
+    def start_refresh(self):
+        if self._thread is None and self.collection is not None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._refresh_loop, name='traffic-refresh', daemon=True)
+                    self._thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(TRAFFIC_FORECAST_REFRESH)
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Traffic forecast refresh error: {e}")
+
+    def stats(self):
+        codes, table = self._model
+        return {
+            'tiles': len(codes),
+            'profiled_hours': int((~np.isnan(table)).sum()),
+            'samples_seen': self.samples_seen,
+            'watermark': datetime.fromtimestamp(self.watermark, timezone.utc).isoformat() if self.watermark else None
+        }
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    db = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))[os.getenv('DATABASE_NAME', 'aimlmapinsights')]
+    forecaster = TrafficForecaster(collection=db.metric_samples)
+    if forecaster.fit_from_store():
+        print(f"Traffic forecast for {forecaster.stats()['tiles']} tiles saved to {forecaster.path}")
+    else:
+        print("No traffic samples in metric_samples to fit a forecast")
@@ -0,0 +1,188 @@
+import atexit
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+WRITE_BEHIND_MAX_BATCH = int(os.getenv('WRITE_BEHIND_MAX_BATCH', 200))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv('WRITE_BEHIND_FLUSH_INTERVAL', 2.0))
+WRITE_BEHIND_MAX_PENDING = int(os.getenv('WRITE_BEHIND_MAX_PENDING', 10000))
+
+# Tokens of the last counter batches applied to each user, so a retried batch is not counted twice
+APPLIED_BATCHES_FIELD = 'applied_trip_batches'
+APPLIED_BATCHES_KEPT = 32
+# Batches written most recently, still reported by pending_batches() for readers racing the write
+WRITTEN_BATCHES_KEPT = 8
+
+
+class TripWriter:
+    """Write-behind queue for trip recording.
+
+    Per-user $inc counters are coalesced in memory and route history is
+    buffered; both are flushed with one bulk_write and one insert_many when
+    the queue reaches WRITE_BEHIND_MAX_BATCH trips or every
+    WRITE_BEHIND_FLUSH_INTERVAL seconds, and once more at interpreter exit.
+
+    Failed writes are retried whole. Routes carry client-side _ids and every
+    flushed counter batch a token that the $inc records on the user, so
+    whatever a failed attempt already applied is skipped on the retry. At
+    WRITE_BEHIND_MAX_PENDING queued trips record() refuses new ones.
+    """
+
+    def __init__(self, db, max_batch=WRITE_BEHIND_MAX_BATCH, flush_interval=WRITE_BEHIND_FLUSH_INTERVAL,
+                 max_pending=WRITE_BEHIND_MAX_PENDING):
+        self.db = db
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._increments = defaultdict(lambda: defaultdict(int))
+        # (token, {user_id: counters}) batches whose write failed, retried with the same token
+        self._batches = []
+        self._inflight = []
+        self._written = deque(maxlen=WRITTEN_BATCHES_KEPT)
+        self._routes = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+        self.flushes = 0
+        self.flushed_routes = 0
+        self.errors = 0
+        self.rejected = 0
+        self.last_flush_seconds = 0.0
+
+        atexit.register(self.close)
+
+    def record(self, user_id, increments, route):
+        """Queue a trip: counter increments for the user plus its route history document.
+
+        Returns False, without queueing, while the backlog is full.
+        """
+        # A client-side _id makes re-inserting a partially written batch idempotent
+        route.setdefault('_id', ObjectId())
+        with self._lock:
+            if self._backlog() >= self.max_pending:
+                self.rejected += 1
+                self._wakeup.set()
+                return False
+            counters = self._increments[user_id]
+            for field, amount in increments.items():
+                counters[field] += amount
+            self._routes.append(route)
+            depth = len(self._routes)
+
+        self._start()
+        if depth >= self.max_batch:
+            self._wakeup.set()
+        return True
+
+    def _backlog(self):
+        # Routes and counter updates can fail separately, so either one can be the longer queue
+        users = len(self._increments) + sum(len(increments) for _, increments in self._batches)
+        return max(len(self._routes), users)
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='trip-writer', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Write everything queued so far; failed batches are put back for the next attempt"""
+        with self._flush_lock:
+            with self._lock:
+                if self._increments:
+                    self._batches.append((ObjectId(), self._increments))
+                    self._increments = defaultdict(lambda: defaultdict(int))
+                if not self._routes and not self._batches:
+                    return 0
+                batches, self._batches = self._batches, []
+                self._inflight = batches
+                routes, self._routes = self._routes, []
+
+            start = time.perf_counter()
+            try:
+                if batches:
+                    self.db.users.bulk_write([
+                        UpdateOne(
+                            {"_id": user_id, APPLIED_BATCHES_FIELD: {"$ne": token}},
+                            {
+                                "$inc": dict(counters),
+                                "$push": {APPLIED_BATCHES_FIELD: {"$each": [token], "$slice": -APPLIED_BATCHES_KEPT}}
+                            }
+                        )
+                        for token, increments in batches for user_id, counters in increments.items()
+                    ], ordered=False)
+                    with self._lock:
+                        self._written.extend(batches)
+                        self._inflight = []
+                    batches = []
+                if routes:
+                    try:
+                        self.db.user_routes.insert_many(routes, ordered=False)
+                    except BulkWriteError as e:
+                        # Duplicate keys are routes written by an earlier, partially failed flush
+                        if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+                            raise
+            except Exception as e:
+                self.errors += 1
+                print(f"Trip write-behind flush error: {e}")
+                self._requeue(batches, routes)
+                return 0
+
+            self.flushes += 1
+            self.flushed_routes += len(routes)
+            self.last_flush_seconds = time.perf_counter() - start
+            return len(routes)
+
+    def _requeue(self, batches, routes):
+        with self._lock:
+            self._batches[:0] = batches
+            self._inflight = []
+            self._routes[:0] = routes
+
+    def pending_batches(self):
+        """(token, {user_id: increments}) counter batches that may not be in Mongo yet.
+
+        Coalescing increments are sealed into a batch with its own token first,
+        so every increment comes with a token a reader can look for in the
+        users' APPLIED_BATCHES_FIELD. The last few written batches are included
+        too, for readers whose query raced their write.
+        """
+        with self._lock:
+            if self._increments:
+                self._batches.append((ObjectId(), self._increments))
+                self._increments = defaultdict(lambda: defaultdict(int))
+            return list(self._written) + list(self._inflight) + list(self._batches)
+
+    def close(self):
+        """Stop the background thread and flush whatever is still queued"""
+        self._stopped = True
+        self._wakeup.set()
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending_routes': len(self._routes),
+                'pending_users': len(self._increments) + sum(len(increments) for _, increments in self._batches),
+                'retry_batches': len(self._batches),
+                'flushes': self.flushes,
+                'flushed_routes': self.flushed_routes,
+                'errors': self.errors,
+                'rejected': self.rejected,
+                'last_flush_seconds': round(self.last_flush_seconds, 6)
+            }
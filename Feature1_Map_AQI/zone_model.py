@@ -0,0 +1,203 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from shared_state import savez_atomic, shared_arrays
+from spatial_index import geo_point
+
+ZONE_MODEL_PATH = os.getenv('ZONE_MODEL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'zone_model.npz'))
+ZONE_MODEL_CLUSTERS = int(os.getenv('ZONE_MODEL_CLUSTERS', 12))
+ZONE_REFRESH_INTERVAL = float(os.getenv('ZONE_REFRESH_INTERVAL', 300))
+ZONE_REFRESH_MIN_POINTS = int(os.getenv('ZONE_REFRESH_MIN_POINTS', 50))
+
+ZONE_TYPES = ['Busy Zone', 'Moderate Zone', 'Calm Zone']
+
+
+def label_centroids(counts):
+    """Rank centroids by how many POIs they hold and split them into busy/moderate/calm terciles"""
+    order = np.argsort(-np.asarray(counts), kind='stable')
+    labels = np.empty(len(order), dtype=np.int8)
+    labels[order] = np.arange(len(order)) * len(ZONE_TYPES) // max(len(order), 1)
+    return labels
+
+
+class ZoneModel:
+    """Fitted zone centroids answering nearest-centroid lookups"""
+
+    def __init__(self, centroids, counts):
+        self.centroids = np.asarray(centroids, dtype=np.float64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.labels = label_centroids(self.counts)
+
+    def predict(self, coords):
+        """Nearest centroid index for each (lat, lon) row"""
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        d2 = ((coords[:, None, :] - self.centroids[None, :, :]) ** 2).sum(axis=2)
+        return d2.argmin(axis=1)
+
+    def zone_types(self, clusters):
+        return [ZONE_TYPES[label] for label in self.labels[clusters]]
+
+    def share(self):
+        """Move the arrays into shared memory for workers forked afterwards"""
+        arrays = shared_arrays({'centroids': self.centroids, 'counts': self.counts, 'labels': self.labels}, 'zone_model')
+        self.centroids, self.counts, self.labels = arrays['centroids'], arrays['counts'], arrays['labels']
+        return self
+
+    def save(self, path=ZONE_MODEL_PATH):
+        savez_atomic(path, centroids=self.centroids, counts=self.counts)
+
+    @classmethod
+    def load(cls, path=ZONE_MODEL_PATH):
+        with np.load(path) as data:
+            return cls(data['centroids'], data['counts'])
+
+
+def fit_zone_model(coords, n_clusters=ZONE_MODEL_CLUSTERS):
+    """Fit zone centroids offline over every stored POI coordinate"""
+    from sklearn.cluster import MiniBatchKMeans
+
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    n_clusters = min(n_clusters, len(coords))
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, n_init=3, batch_size=1024)
+    clusters = kmeans.fit_predict(coords)
+    return ZoneModel(kmeans.cluster_centers_, np.bincount(clusters, minlength=n_clusters)), kmeans
+
+
+def load_stored_coords(collection):
+    """Read POI coordinates recorded in location_analytics"""
+    cursor = collection.find({"lat": {"$exists": True}, "lon": {"$exists": True}}, {"lat": 1, "lon": 1, "_id": 0})
+    return np.array([[doc['lat'], doc['lon']] for doc in cursor], dtype=np.float64).reshape(-1, 2)
+
+
+class ZoneIndex:
+    """Process-wide zone model with background incremental refresh"""
+
+    def __init__(self, path=ZONE_MODEL_PATH, collection=None):
+        self.path = path
+        self.collection = collection
+        self.model = None
+        self._kmeans = None
+        self._pending = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self.model is not None
+
+    def load(self):
+        if os.path.exists(self.path):
+            try:
+                self.model = ZoneModel.load(self.path)
+                print(f"Zone model loaded with {len(self.model.centroids)} zones")
+            except Exception as e:
+                print(f"Zone model load error: {e}")
+        return self
+
+    def share(self):
+        """Share the loaded model with forked workers; a refresh gives the refreshing worker a private copy"""
+        if self.model is not None:
+            self.model.share()
+        return self
+
+    def fit_from_store(self):
+        """Fit (or refit) from every POI stored in location_analytics"""
+        if self.collection is None:
+            return False
+        coords = load_stored_coords(self.collection)
+        if len(coords) < len(ZONE_TYPES):
+            return False
+        self.model, self._kmeans = fit_zone_model(coords)
+        self.model.save(self.path)
+        return True
+
+    def assign(self, locations_data):
+        """Label each location with its zone; returns None if no model is loaded yet"""
+        model = self.model
+        if model is None or not locations_data:
+            return None
+        clusters = model.predict([[loc['lat'], loc['lon']] for loc in locations_data])
+        for loc, cluster, zone_type in zip(locations_data, clusters, model.zone_types(clusters)):
+            loc['cluster'] = int(cluster)
+            loc['zone_type'] = zone_type
+        return locations_data
+
+    def observe(self, locations_data):
+        """Queue POIs seen by a request for storage and the next incremental refresh"""
+        now = datetime.now()
+        with self._lock:
+            self._pending.extend(
+                {
+                    'lat': loc['lat'], 'lon': loc['lon'], 'geo': geo_point(loc['lat'], loc['lon']),
+                    'name': loc.get('name'), 'category': loc.get('category'), 'analyzed_at': now
+                }
+                for loc in locations_data
+            )
+        self.start_refresh()
+
+    def start_refresh(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._refresh_loop, name='zone-refresh', daemon=True)
+                    self._thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(ZONE_REFRESH_INTERVAL)
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Zone model refresh error: {e}")
+
+    def refresh(self):
+        """Store queued POIs and fold them into the model with partial_fit"""
+        with self._lock:
+            if len(self._pending) < ZONE_REFRESH_MIN_POINTS:
+                return False
+            pending, self._pending = self._pending, []
+
+        if self.collection is not None:
+            try:
+                self.collection.insert_many(pending)
+            except Exception as e:
+                print(f"Zone analytics write error: {e}")
+
+        coords = np.array([[doc['lat'], doc['lon']] for doc in pending], dtype=np.float64)
+
+        if self.model is None:
+            if self.fit_from_store():
+                return True
+            self.model, self._kmeans = fit_zone_model(coords)
+        else:
+            if self._kmeans is None:
+                from sklearn.cluster import MiniBatchKMeans
+
+                self._kmeans = MiniBatchKMeans(
+                    n_clusters=len(self.model.centroids), init=self.model.centroids, n_init=1, random_state=42
+                )
+            self._kmeans.partial_fit(coords)
+            counts = self.model.counts + np.bincount(
+                self._kmeans.predict(coords), minlength=len(self.model.counts)
+            )
+            self.model = ZoneModel(self._kmeans.cluster_centers_, counts)
+
+        self.model.save(self.path)
+        return True
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    db = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))[os.getenv('DATABASE_NAME', 'aimlmapinsights')]
+    index = ZoneIndex(collection=db.location_analytics)
+    if index.fit_from_store():
+        print(f"Zone model with {len(index.model.centroids)} zones saved to {index.path}")
+    else:
+        print("Not enough stored POIs in location_analytics to fit a zone model")